@@ -0,0 +1,309 @@
+"""
+CVD chính xác từ aggTrades - gom lệnh khớp vào bucket theo từng nến
+
+Taker-buy volume của klines chỉ là xấp xỉ. Với các symbol volume lớn,
+module này nhận stream aggTrade và cộng dồn volume mua/bán chủ động vào
+bucket cố định của từng nến (mảng numpy dạng vòng), KHÔNG giữ lệnh thô:
+- Bộ nhớ mỗi symbol = AGGTRADE_BUCKETS bucket, không phụ thuộc số lệnh
+- Lệnh đến theo lô được cộng bằng np.add.at (vector hóa)
+- Bucket chỉ được dùng khi chắc chắn đủ lệnh: không phải nến stream bắt đầu
+  giữa chừng, id aggTrade liên tục (không mất lệnh khi mất kết nối) và đã
+  nhận lệnh của nến sau; nến còn lại dùng delta từ klines
+- Có thể replay file aggTrades của Binance (data.binance.vision) để kiểm tra
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from candle_store import timeframe_delta
+from exchange_client import apply_cached_markets
+
+logger = logging.getLogger(__name__)
+
+# Cột file aggTrades của data.binance.vision
+AGGTRADE_FILE_COLUMNS = [
+    'agg_trade_id', 'price', 'quantity', 'first_trade_id',
+    'last_trade_id', 'transact_time', 'is_buyer_maker', 'is_best_match'
+]
+
+
+class SymbolBuckets:
+    """Bucket volume mua/bán chủ động của một symbol (mảng vòng kích thước cố định)"""
+    
+    def __init__(self, capacity):
+        self.open_time = np.full(capacity, -1, dtype=np.int64)
+        self.buy_volume = np.zeros(capacity, dtype=np.float64)
+        self.sell_volume = np.zeros(capacity, dtype=np.float64)
+        self.trade_count = np.zeros(capacity, dtype=np.int64)
+        # Bucket có thể thiếu lệnh (stream bắt đầu giữa nến, id aggTrade bị hở)
+        self.incomplete = np.zeros(capacity, dtype=bool)
+        
+        # Thời điểm lệnh đầu tiên stream nhận, id và open time bucket của lệnh mới nhất
+        self.started_at = None
+        self.last_id = -1
+        self.last_bucket = -1
+    
+    @property
+    def nbytes(self):
+        """Bộ nhớ đang dùng (bytes)"""
+        return (self.open_time.nbytes + self.buy_volume.nbytes + self.sell_volume.nbytes +
+                self.trade_count.nbytes + self.incomplete.nbytes)
+
+
+class TradeBucketStore:
+    """
+    Lưu delta volume theo nến cho nhiều symbol
+    """
+    
+    def __init__(self, timeframe=None, capacity=None):
+        """
+        Args:
+            timeframe: Khung nến của bucket (mặc định AGGTRADE_TIMEFRAME)
+            capacity: Số bucket giữ lại mỗi symbol (mặc định AGGTRADE_BUCKETS)
+        """
+        self.timeframe = timeframe or config.AGGTRADE_TIMEFRAME
+        self.interval_ms = int(timeframe_delta(self.timeframe).total_seconds() * 1000)
+        self.capacity = capacity or config.AGGTRADE_BUCKETS
+        self.books = {}
+    
+    def _book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = SymbolBuckets(self.capacity)
+            self.books[symbol] = book
+        return book
+    
+    def add_trades(self, symbol, timestamps, quantities, is_buyer_maker, trade_ids):
+        """
+        Cộng một lô lệnh khớp vào bucket
+        
+        Args:
+            symbol: Mã coin (ví dụ 'BTCUSDT')
+            timestamps: Mảng thời gian khớp (ms)
+            quantities: Mảng khối lượng
+            is_buyer_maker: Mảng bool - True nếu bên bán là taker (lệnh bán chủ động)
+            trade_ids: Mảng id aggTrade (tăng liên tục, hở id = mất lệnh)
+        
+        Returns:
+            int: Số lệnh đã cộng (lệnh quá cũ so với vòng bucket hoặc đã nhận bị bỏ qua)
+        """
+        trade_ids = np.asarray(trade_ids, dtype=np.int64)
+        book = self._book(symbol)
+        
+        # Theo thứ tự id, bỏ lệnh đã nhận (file replay chồng nhau, stream gửi lại)
+        order = np.argsort(trade_ids, kind='stable')
+        order = order[trade_ids[order] > book.last_id]
+        if len(order) == 0:
+            return 0
+        trade_ids = trade_ids[order]
+        timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+        quantities = np.asarray(quantities, dtype=np.float64)[order]
+        is_buyer_maker = np.asarray(is_buyer_maker, dtype=bool)[order]
+        
+        buckets = timestamps - timestamps % self.interval_ms
+        slots = (buckets // self.interval_ms) % self.capacity
+        
+        # Bucket mới hơn bucket đang ở slot -> slot được dùng lại cho nến mới
+        unique_buckets = np.unique(buckets)
+        unique_slots = (unique_buckets // self.interval_ms) % self.capacity
+        newer = unique_buckets > book.open_time[unique_slots]
+        if newer.any():
+            reset_slots = unique_slots[newer]
+            book.open_time[reset_slots] = unique_buckets[newer]
+            book.buy_volume[reset_slots] = 0.0
+            book.sell_volume[reset_slots] = 0.0
+            book.trade_count[reset_slots] = 0
+            book.incomplete[reset_slots] = False
+        
+        # Bucket có thể thiếu lệnh: nến stream bắt đầu nhận, 2 bên mỗi chỗ hở id
+        if book.started_at is None:
+            book.started_at = int(timestamps[0])
+            suspect = [buckets[:1]]
+        elif trade_ids[0] > book.last_id + 1:
+            suspect = [np.array([book.last_bucket, buckets[0]])]
+        else:
+            suspect = []
+        gaps = np.flatnonzero(np.diff(trade_ids) > 1)
+        suspect += [buckets[gaps], buckets[gaps + 1]]
+        suspect = np.concatenate(suspect)
+        if len(suspect):
+            suspect_slots = (suspect // self.interval_ms) % self.capacity
+            book.incomplete[suspect_slots[book.open_time[suspect_slots] == suspect]] = True
+        book.last_id = int(trade_ids[-1])
+        book.last_bucket = max(book.last_bucket, int(buckets[-1]))
+        
+        accepted = book.open_time[slots] == buckets
+        slots = slots[accepted]
+        quantities = quantities[accepted]
+        is_sell = is_buyer_maker[accepted]
+        
+        np.add.at(book.buy_volume, slots[~is_sell], quantities[~is_sell])
+        np.add.at(book.sell_volume, slots[is_sell], quantities[is_sell])
+        np.add.at(book.trade_count, slots, 1)
+        
+        return int(accepted.sum())
+    
+    def add_ccxt_trades(self, trades):
+        """
+        Cộng danh sách trade của ccxt (watch_trades_for_symbols)
+        
+        Returns:
+            int: Số lệnh đã cộng
+        """
+        grouped = {}
+        for trade in trades:
+            symbol = trade['symbol'].replace('/', '')
+            rows = grouped.setdefault(symbol, ([], [], [], []))
+            rows[0].append(trade['timestamp'])
+            rows[1].append(trade['amount'])
+            rows[2].append(trade['side'] == 'sell')
+            rows[3].append(int(trade['id']))
+        
+        added = 0
+        for symbol, (timestamps, quantities, is_sell, trade_ids) in grouped.items():
+            added += self.add_trades(symbol, timestamps, quantities, is_sell, trade_ids)
+        return added
+    
+    def candles(self, symbol):
+        """
+        Bucket của symbol dạng DataFrame theo thứ tự thời gian
+        
+        Returns:
+            DataFrame: ['buy_volume', 'sell_volume', 'delta', 'trades', 'complete'] (None nếu chưa có)
+        """
+        book = self.books.get(symbol)
+        if book is None:
+            return None
+        
+        order = np.argsort(book.open_time)
+        order = order[book.open_time[order] >= 0]
+        
+        index = pd.to_datetime(book.open_time[order], unit='ms', utc=True).tz_convert(config.TIMEZONE)
+        df = pd.DataFrame({
+            'buy_volume': book.buy_volume[order],
+            'sell_volume': book.sell_volume[order],
+            'trades': book.trade_count[order],
+        }, index=index)
+        df['delta'] = df['buy_volume'] - df['sell_volume']
+        df['complete'] = self._complete(book, book.open_time[order], order)
+        return df
+    
+    @staticmethod
+    def _complete(book, times_ms, slots):
+        """Bucket đủ lệnh: không bị đánh dấu thiếu và đã nhận lệnh của nến sau (nến đã khép)"""
+        return ~book.incomplete[slots] & (times_ms < book.last_bucket)
+    
+    def delta_for(self, symbol, candle_times, fallback):
+        """
+        Delta theo aggTrades cho các nến, dùng fallback khi bucket không có hoặc có thể thiếu lệnh
+        
+        Args:
+            symbol: Mã coin
+            candle_times: DatetimeIndex open time các nến
+            fallback: Mảng delta thay thế (ví dụ delta từ taker-buy volume)
+        
+        Returns:
+            ndarray: Delta từng nến
+        """
+        result = np.array(fallback, dtype=np.float64, copy=True)
+        book = self.books.get(symbol)
+        if book is None or len(candle_times) == 0:
+            return result
+        
+        times_ms = candle_times.as_unit('ms').asi8
+        slots = (times_ms // self.interval_ms) % self.capacity
+        found = (book.open_time[slots] == times_ms) & self._complete(book, times_ms, slots)
+        result[found] = book.buy_volume[slots[found]] - book.sell_volume[slots[found]]
+        return result
+    
+    def memory_usage(self):
+        """Tổng bộ nhớ bucket (bytes)"""
+        return sum(book.nbytes for book in self.books.values())
+
+
+def replay_trade_file(store, symbol, path, chunk_size=1_000_000):
+    """
+    Replay file aggTrades (CSV của data.binance.vision) vào bucket
+    
+    Args:
+        store: TradeBucketStore
+        symbol: Mã coin
+        path: Đường dẫn file CSV (có thể nén .zip)
+        chunk_size: Số dòng đọc mỗi lần
+    
+    Returns:
+        dict: {'trades': số lệnh, 'seconds': thời gian xử lý}
+    """
+    started = time.perf_counter()
+    total = 0
+    
+    reader = pd.read_csv(path, header=None, names=AGGTRADE_FILE_COLUMNS, chunksize=chunk_size)
+    for chunk in reader:
+        # File có thể có dòng tiêu đề
+        if not np.issubdtype(chunk['transact_time'].dtype, np.number):
+            chunk = chunk[pd.to_numeric(chunk['transact_time'], errors='coerce').notna()]
+        
+        timestamps = chunk['transact_time'].to_numpy(dtype=np.int64)
+        # Một số file dùng microsecond
+        if len(timestamps) and timestamps[0] > 10**14:
+            timestamps = timestamps // 1000
+        
+        is_buyer_maker = chunk['is_buyer_maker'].astype(str).str.lower().eq('true').to_numpy()
+        total += store.add_trades(symbol, timestamps, chunk['quantity'].to_numpy(dtype=np.float64), is_buyer_maker,
+                                  chunk['agg_trade_id'].to_numpy(dtype=np.int64))
+    
+    return {'trades': total, 'seconds': time.perf_counter() - started}
+
+
+class AggTradeStream:
+    """
+    Nhận stream aggTrade từ Binance WebSocket và đổ vào TradeBucketStore
+    """
+    
+    def __init__(self, store, symbols):
+        """
+        Args:
+            store: TradeBucketStore
+            symbols: Danh sách symbol (ví dụ ['BTCUSDT', 'ETHUSDT'])
+        """
+        self.store = store
+        self.symbols = [s if '/' in s else s[:-4] + '/' + s[-4:] for s in symbols]
+        self.running = False
+        self.trade_count = 0
+    
+    async def run(self):
+        """Vòng lặp nhận trade (chạy như một task asyncio)"""
+        import ccxt.pro as ccxtpro
+        
+        exchange = ccxtpro.binance({
+            'enableRateLimit': True,
+            'options': {'tradesLimit': config.AGGTRADE_WS_BUFFER}
+        })
+        apply_cached_markets(exchange)
+        self.running = True
+        logger.info(f"Bắt đầu stream aggTrade cho {len(self.symbols)} symbols")
+        
+        try:
+            while self.running:
+                try:
+                    trades = await exchange.watch_trades_for_symbols(
+                        self.symbols, params={'name': 'aggTrade'}
+                    )
+                    self.trade_count += self.store.add_ccxt_trades(trades)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Lỗi stream aggTrade: {str(e)}")
+                    await asyncio.sleep(5)
+        finally:
+            self.running = False
+            await exchange.close()
+    
+    def stop(self):
+        """Dừng stream"""
+        self.running = False
@@ -0,0 +1,202 @@
+"""
+Kho nến trong bộ nhớ + dựng khung lớn (H1/H4/D1) từ nến M15
+
+Mỗi nến H1 gồm đúng 4 nến M15 nên không cần lấy H1 riêng từ Binance:
+- open = open nến đầu, close = close nến cuối
+- high = max, low = min, volume (và các cột volume khác) = tổng
+- Nến được gom theo mốc giờ UTC của sàn (H4 bắt đầu 00/04/08... UTC, D1 lúc 00:00 UTC)
+"""
+
+import pandas as pd
+import config
+
+TIMEFRAME_DELTAS = {
+    '1m': pd.Timedelta(minutes=1),
+    '5m': pd.Timedelta(minutes=5),
+    '15m': pd.Timedelta(minutes=15),
+    '30m': pd.Timedelta(minutes=30),
+    '1h': pd.Timedelta(hours=1),
+    '2h': pd.Timedelta(hours=2),
+    '4h': pd.Timedelta(hours=4),
+    '1d': pd.Timedelta(days=1),
+}
+
+
+def timeframe_delta(timeframe):
+    """Độ dài một nến của timeframe (ví dụ: '15m' -> 15 phút)"""
+    return TIMEFRAME_DELTAS[timeframe]
+
+
+def timeframe_label(timeframe):
+    """Tên hiển thị của timeframe (ví dụ: '15m' -> 'M15', '1h' -> 'H1', '1d' -> 'D1')"""
+    value, unit = timeframe[:-1], timeframe[-1]
+    return {'m': 'M', 'h': 'H', 'd': 'D'}[unit] + value
+
+
+def floor_to_timeframe(index, timeframe):
+    """
+    Làm tròn thời gian về mốc mở nến của timeframe (theo giờ UTC của sàn)
+    
+    Args:
+        index: DatetimeIndex hoặc Timestamp có timezone
+        timeframe: Khung thời gian ('1h', '4h', '1d', ...)
+    """
+    tz = index.tz
+    return index.tz_convert('UTC').floor(timeframe_delta(timeframe)).tz_convert(tz)
+
+
+def closed_candles(df, timeframe, as_of):
+    """
+    Lọc các nến đã đóng tại thời điểm as_of
+    
+    Nến cuối từ Binance là nến đang hình thành. Nếu dữ liệu chưa có nến
+    đang hình thành tại as_of thì sàn chưa chốt nến vừa đóng -> trả về None
+    để quét lại sau.
+    
+    Args:
+        df: DataFrame nến (index là open time)
+        timeframe: Khung thời gian
+        as_of: Thời điểm quét (thường là thời điểm đóng nến)
+    
+    Returns:
+        DataFrame các nến đã đóng, None nếu sàn chưa chốt nến
+    """
+    delta = timeframe_delta(timeframe)
+    if df.empty or df.index[-1] + delta <= as_of:
+        return None
+    return df[df.index + delta <= as_of]
+
+
+def resample_ohlcv(df, timeframe):
+    """
+    Gom nến nhỏ thành nến lớn
+    
+    Args:
+        df: DataFrame nến nhỏ (index = open time có timezone)
+        timeframe: Khung thời gian đích
+    
+    Returns:
+        tuple: (DataFrame nến lớn, Series số nến nhỏ trong mỗi nến lớn)
+    """
+    buckets = floor_to_timeframe(df.index, timeframe)
+    grouped = df.groupby(buckets)
+    
+    agg = {}
+    for col in df.columns:
+        if col == 'open':
+            agg[col] = 'first'
+        elif col == 'high':
+            agg[col] = 'max'
+        elif col == 'low':
+            agg[col] = 'min'
+        elif col == 'close':
+            agg[col] = 'last'
+        else:
+            agg[col] = 'sum'
+    
+    result = grouped.agg(agg)
+    result.index.name = df.index.name
+    return result, grouped.size()
+
+
+class CandleStore:
+    """
+    Lưu nến theo (symbol, timeframe) và dựng khung lớn từ khung nhỏ
+    """
+    
+    def __init__(self, max_candles=None):
+        """
+        Args:
+            max_candles: Số nến tối đa giữ lại cho mỗi (symbol, timeframe)
+        """
+        self.max_candles = max_candles or config.CANDLE_STORE_MAX_CANDLES
+        self.frames = {}
+    
+    def get(self, symbol, timeframe, limit=None):
+        """
+        Lấy nến đã lưu
+        
+        Returns:
+            DataFrame hoặc None nếu chưa có dữ liệu
+        """
+        df = self.frames.get((symbol, timeframe))
+        if df is None:
+            return None
+        if limit is not None:
+            return df.iloc[-limit:]
+        return df
+    
+    def last_time(self, symbol, timeframe):
+        """Open time của nến cuối đã lưu (None nếu chưa có)"""
+        df = self.frames.get((symbol, timeframe))
+        if df is None or df.empty:
+            return None
+        return df.index[-1]
+    
+    def merge(self, symbol, timeframe, df):
+        """
+        Gộp nến mới vào kho (nến trùng open time được ghi đè bằng dữ liệu mới)
+        
+        Args:
+            symbol: Mã coin
+            timeframe: Khung thời gian
+            df: DataFrame nến mới
+        
+        Returns:
+            DataFrame: Nến sau khi gộp
+        """
+        key = (symbol, timeframe)
+        existing = self.frames.get(key)
+        
+        if existing is None or existing.empty:
+            merged = df
+        else:
+            # Giữ nến cũ trước đoạn mới, đoạn mới thay thế phần đuôi
+            merged = pd.concat([existing[existing.index < df.index[0]], df])
+        
+        merged = merged.iloc[-self.max_candles:]
+        self.frames[key] = merged
+        return merged
+    
+    def derive(self, symbol, base_timeframe, timeframe, since):
+        """
+        Dựng lại các nến khung lớn kể từ thời điểm since từ nến khung nhỏ
+        
+        Args:
+            symbol: Mã coin
+            base_timeframe: Khung nhỏ đã có trong kho (ví dụ '15m')
+            timeframe: Khung lớn cần dựng (ví dụ '1h')
+            since: Open time của nến khung nhỏ đầu tiên vừa thay đổi
+        
+        Returns:
+            bool: True nếu dựng được, False nếu thiếu lịch sử (cần backfill từ REST)
+        """
+        base = self.frames.get((symbol, base_timeframe))
+        target = self.frames.get((symbol, timeframe))
+        if base is None or target is None or target.empty:
+            return False
+        
+        start = floor_to_timeframe(pd.DatetimeIndex([since]), timeframe)[0]
+        
+        # Nến khung lớn phải nối tiếp dữ liệu đã có và đủ nến khung nhỏ
+        if start - target.index[-1] > timeframe_delta(timeframe) or base.index[0] > start:
+            return False
+        
+        candles, counts = resample_ohlcv(base[base.index >= start], timeframe)
+        if candles.empty:
+            return True
+        
+        ratio = timeframe_delta(timeframe) // timeframe_delta(base_timeframe)
+        if (counts.iloc[:-1] < ratio).any():
+            return False
+        
+        self.merge(symbol, timeframe, candles.reindex(columns=target.columns))
+        return True
+    
+    def clear(self, symbol=None):
+        """Xóa dữ liệu của một symbol (hoặc toàn bộ kho)"""
+        if symbol is None:
+            self.frames.clear()
+            return
+        for key in [k for k in self.frames if k[0] == symbol]:
+            del self.frames[key]
@@ -0,0 +1,217 @@
+"""
+Vẽ biểu đồ nến + vùng S/R + Stochastic cho lệnh /chart
+
+Vẽ bằng matplotlib trong process pool (không chặn event loop, không giữ GIL
+của bot). Ảnh PNG được cache theo (symbol, timeframe, nến đã đóng gần nhất):
+mọi người dùng xem cùng biểu đồ trong một nến chỉ tốn một lần vẽ, các yêu
+cầu đến khi đang vẽ chờ chung lần vẽ đó. Cache giới hạn theo tổng dung lượng
+ảnh (CHART_CACHE_BYTES), bỏ ảnh lâu không dùng nhất khi đầy.
+"""
+
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from candle_store import timeframe_label
+
+
+def render_chart(symbol, label, times, ohlc, stoch_k, stoch_d, channels, current_price):
+    """
+    Vẽ biểu đồ thành ảnh PNG (chạy trong process con)
+    
+    Args:
+        symbol: Tên coin
+        label: Tên khung ('M15', 'H1', ...)
+        times: Mảng open time (datetime64, giờ Việt Nam không múi giờ)
+        ohlc: Mảng (n, 4) open/high/low/close
+        stoch_k, stoch_d: Mảng Stochastic cùng độ dài
+        channels: Các vùng S/R [(low, high, loại 'support'/'resistance'/'in')]
+        current_price: Giá đóng nến cuối
+    
+    Returns:
+        bytes: Ảnh PNG
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
+    fig, (ax, ax_stoch) = plt.subplots(
+        2, 1, figsize=(10, 6.5), sharex=True, gridspec_kw={'height_ratios': [3, 1], 'hspace': 0.05}
+    )
+    x = np.arange(len(times))
+    opens, highs, lows, closes = ohlc.T
+    up = closes >= opens
+    colors = np.where(up, '#26a69a', '#ef5350')
+    
+    # Nến: râu + thân
+    ax.vlines(x, lows, highs, colors=colors, linewidth=0.8)
+    body = np.maximum(np.abs(closes - opens), (highs.max() - lows.min()) * 0.001)
+    ax.bar(x, body, bottom=np.minimum(opens, closes), color=colors, width=0.7)
+    
+    zone_colors = {'support': '#26a69a', 'resistance': '#ef5350', 'in': '#5c6bc0'}
+    for low, high, kind in channels:
+        ax.axhspan(low, high, color=zone_colors[kind], alpha=0.18, linewidth=0)
+    ax.axhline(current_price, color='#616161', linewidth=0.8, linestyle='--')
+    ax.set_ylim(lows.min() - (highs.max() - lows.min()) * 0.05, highs.max() + (highs.max() - lows.min()) * 0.05)
+    ax.set_title(f"{symbol} {label} - {current_price:.4f}", loc='left')
+    ax.grid(alpha=0.2)
+    
+    ax_stoch.plot(x, stoch_k, color='#1e88e5', linewidth=1, label='%K')
+    ax_stoch.plot(x, stoch_d, color='#fb8c00', linewidth=1, label='%D')
+    for level in (20, 80):
+        ax_stoch.axhline(level, color='#9e9e9e', linewidth=0.7, linestyle=':')
+    ax_stoch.set_ylim(0, 100)
+    ax_stoch.legend(loc='upper left', fontsize=8)
+    ax_stoch.grid(alpha=0.2)
+    
+    ticks = np.linspace(0, len(times) - 1, 6).astype(int)
+    ax_stoch.set_xticks(ticks)
+    ax_stoch.set_xticklabels([np.datetime_as_string(times[i], unit='m').replace('T', ' ')[5:] for i in ticks], fontsize=8)
+    ax.set_xlim(-1, len(times))
+    
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=config.CHART_DPI, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def chart_inputs(symbol, state, candles):
+    """
+    Dữ liệu gửi sang process vẽ: chỉ mảng numpy và số, không gửi DataFrame/scanner
+    
+    S/R tính trên toàn bộ nến của state (giống lần quét), chỉ vẽ candles nến cuối.
+    """
+    df = state.df.iloc[-candles:]
+    sr = state.sr
+    channels = []
+    if sr['success']:
+        if sr['in_channel']:
+            channels.append((sr['in_channel']['low'], sr['in_channel']['high'], 'in'))
+        channels += [(ch['low'], ch['high'], 'support') for ch in sr['supports']]
+        channels += [(ch['low'], ch['high'], 'resistance') for ch in sr['resistances']]
+    return (
+        symbol,
+        timeframe_label(state.timeframe),
+        df.index.tz_localize(None).to_numpy(),
+        df[['open', 'high', 'low', 'close']].to_numpy(dtype=float),
+        state.stoch_k.iloc[-candles:].to_numpy(dtype=float),
+        state.stoch_d.iloc[-candles:].to_numpy(dtype=float),
+        channels,
+        float(df['close'].iloc[-1]),
+    )
+
+
+class ChartCache:
+    """
+    Cache ảnh LRU giới hạn theo tổng số byte
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+    
+    def get(self, key):
+        image = self.items.get(key)
+        if image is not None:
+            self.items.move_to_end(key)
+        return image
+    
+    def put(self, key, image):
+        """Thêm ảnh, bỏ ảnh lâu không dùng nhất đến khi tổng dung lượng ≤ max_bytes"""
+        if len(image) > self.max_bytes:
+            return
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.items[key] = image
+        self.size += len(image)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+    
+    def __len__(self):
+        return len(self.items)
+
+
+class ChartRenderer:
+    """
+    /chart: lấy state (SymbolChecker), vẽ trong process pool, cache + gộp yêu cầu trùng
+    """
+    
+    def __init__(self, checker, workers=None, max_bytes=None):
+        """
+        Args:
+            checker: SymbolChecker (state của scanner hoặc tải nến khi cần)
+            workers: Số process vẽ (mặc định CHART_WORKERS)
+            max_bytes: Dung lượng cache ảnh tối đa (mặc định CHART_CACHE_BYTES)
+        """
+        self.checker = checker
+        self.workers = workers or config.CHART_WORKERS
+        self.cache = ChartCache(max_bytes or config.CHART_CACHE_BYTES)
+        self.inflight = {}
+        self.executor = None
+        self.renders = 0
+    
+    def _executor(self):
+        # spawn: process con không kế thừa thread/socket của bot
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+    
+    async def chart(self, symbol, timeframe):
+        """
+        Ảnh biểu đồ của symbol ở nến đã đóng gần nhất
+        
+        Returns:
+            tuple: (ảnh PNG hoặc None nếu không lấy được dữ liệu, open time nến cuối của ảnh)
+        """
+        now = self.checker.scanner.clock.now()
+        candle = self.checker.latest_open(timeframe, now)
+        key = (symbol, timeframe, candle)
+        
+        image = self.cache.get(key)
+        if image is not None:
+            return image, candle
+        
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(key, now))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # shield: một người hủy yêu cầu không hủy lần vẽ của người khác
+        return await asyncio.shield(task)
+    
+    async def _render(self, key, now):
+        """
+        Returns:
+            tuple: (ảnh PNG hoặc None, open time nến cuối của ảnh)
+        """
+        symbol, timeframe, candle = key
+        loaded = await asyncio.to_thread(self._inputs, symbol, timeframe, now)
+        if loaded is None:
+            return None, candle
+        inputs, last_candle = loaded
+        
+        image = await asyncio.get_running_loop().run_in_executor(self._executor(), render_chart, *inputs)
+        self.renders += 1
+        # Sàn chưa chốt nến vừa đóng -> ảnh là của nến trước, không cache dưới khóa nến mới
+        if last_candle == candle:
+            self.cache.put(key, image)
+        return image, last_candle
+    
+    def _inputs(self, symbol, timeframe, now):
+        state = self.checker.load_state(symbol, timeframe, now)
+        if state is None:
+            return None
+        return chart_inputs(symbol, state, config.CHART_CANDLES), state.df.index[-1]
+    
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
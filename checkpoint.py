@@ -0,0 +1,283 @@
+"""
+Lưu/khôi phục trạng thái scanner ra file để khởi động lại gần như tức thì
+
+File .npz (mảng numpy, không pickle) gồm:
+- Nến trong kho nến của mỗi (symbol, timeframe) - đủ CANDLES_LIMITS nến
+- Trạng thái CVD và bộ phát hiện phân kỳ từng nến
+- Lịch bỏ qua symbol của StochSkipScheduler
+- Nến đã quét gần nhất của mỗi timeframe (last_scanned của bot)
+
+Stochastic và S/R được tính lại từ nến đã khôi phục nên không cần lưu.
+Sau khi khôi phục, lần quét đầu chỉ tải phần nến còn thiếu kể từ checkpoint.
+File được ghi ra file tạm rồi os.replace nên không bao giờ bị ghi dở.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+
+CHECKPOINT_VERSION = 1
+
+CANDLE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'taker_buy_volume']
+
+
+def _to_ms(times):
+    """DatetimeIndex/list Timestamp -> mảng int64 milliseconds UTC"""
+    return pd.DatetimeIndex(times).as_unit('ms').asi8
+
+
+def _from_ms(values):
+    """Mảng int64 milliseconds UTC -> DatetimeIndex giờ Việt Nam"""
+    return pd.to_datetime(np.asarray(values, dtype=np.int64), unit='ms', utc=True).tz_convert(config.TIMEZONE)
+
+
+def _ragged(sequences, dtype=np.float64, width=None):
+    """Ghép các dãy độ dài khác nhau thành (values, offsets)"""
+    shape = (0,) if width is None else (0, width)
+    parts = [np.asarray(seq, dtype=dtype).reshape((-1,) + shape[1:]) for seq in sequences]
+    values = np.concatenate(parts) if parts else np.empty(shape, dtype=dtype)
+    offsets = np.cumsum([0] + [len(p) for p in parts]).astype(np.int64)
+    return values, offsets
+
+
+def _split(values, offsets):
+    """Tách (values, offsets) thành danh sách dãy"""
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def state_fingerprint(scanner):
+    """Tham số ảnh hưởng tới trạng thái - checkpoint khác tham số sẽ bị bỏ qua"""
+    return json.dumps({
+        'pairs': [list(pair) for pair in scanner.pairs],
+        'stoch': [config.STOCH_K_PERIOD, config.STOCH_K_SMOOTH, config.STOCH_D_SMOOTH],
+        'cvd': [config.CVD_ENABLED, config.CVD_PERIOD, config.CVD_CUMULATIVE_MODE],
+        'divergence': [config.CVD_DIVERGENCE_ENABLED, config.CVD_DIVERGENCE_PERIOD, config.CVD_MIN_SWING_DISTANCE],
+        'skip': [config.SKIP_SCHEDULER_ENABLED, config.SKIP_SCHEDULER_HORIZON],
+    }, sort_keys=True)
+
+
+def _candle_arrays(scanner):
+    if scanner.store is None:
+        return {}
+    
+    keys, frames = [], []
+    for (symbol, tf), df in scanner.store.frames.items():
+        if df is None or df.empty:
+            continue
+        limit = config.CANDLES_LIMITS.get(tf, config.CANDLES_LIMIT)
+        keys.append((symbol, tf))
+        frames.append(df.iloc[-limit:].reindex(columns=CANDLE_COLUMNS))
+    
+    times, offsets = _ragged([_to_ms(df.index) for df in frames], dtype=np.int64)
+    values, _ = _ragged([df.to_numpy(dtype=np.float64) for df in frames], width=len(CANDLE_COLUMNS))
+    return {
+        'candle_symbols': np.array([k[0] for k in keys], dtype=str),
+        'candle_timeframes': np.array([k[1] for k in keys], dtype=str),
+        'candle_offsets': offsets,
+        'candle_times': times,
+        'candle_values': values,
+    }
+
+
+def _cvd_arrays(scanner):
+    keys = [key for key, state in scanner.cvd_states.items() if state.last_time is not None]
+    states = [scanner.cvd_states[key] for key in keys]
+    
+    windows, offsets = _ragged([list(state.window) for state in states])
+    return {
+        'cvd_symbols': np.array([k[0] for k in keys], dtype=str),
+        'cvd_timeframes': np.array([k[1] for k in keys], dtype=str),
+        'cvd_window': windows,
+        'cvd_offsets': offsets,
+        'cvd_window_sum': np.array([state.window_sum for state in states], dtype=np.float64),
+        'cvd_value': np.array([np.nan if state.value is None else state.value for state in states], dtype=np.float64),
+        'cvd_last_time': _to_ms([state.last_time for state in states]),
+    }
+
+
+def _divergence_arrays(scanner):
+    keys = [key for key, tracker in scanner.divergence_trackers.items() if tracker is not None]
+    trackers = [scanner.divergence_trackers[key] for key in keys]
+    
+    bars, bar_offsets = _ragged([np.column_stack([list(t.highs), list(t.lows), list(t.cvds)]) for t in trackers], width=3)
+    swing_highs, high_offsets = _ragged([list(t.swing_highs) for t in trackers], width=3)
+    swing_lows, low_offsets = _ragged([list(t.swing_lows) for t in trackers], width=3)
+    return {
+        'div_symbols': np.array([k[0] for k in keys], dtype=str),
+        'div_timeframes': np.array([k[1] for k in keys], dtype=str),
+        'div_bar_count': np.array([t.bar_count for t in trackers], dtype=np.int64),
+        'div_bars': bars,
+        'div_bar_offsets': bar_offsets,
+        'div_swing_highs': swing_highs,
+        'div_swing_high_offsets': high_offsets,
+        'div_swing_lows': swing_lows,
+        'div_swing_low_offsets': low_offsets,
+    }
+
+
+def _scheduler_arrays(scanner):
+    pair_index, symbols, times = [], [], []
+    for i, pair in enumerate(scanner.pairs):
+        scheduler = scanner.skip_schedulers.get(pair)
+        if scheduler is None:
+            continue
+        for symbol, next_time in scheduler.next_check.items():
+            pair_index.append(i)
+            symbols.append(symbol)
+            times.append(next_time)
+    
+    return {
+        'skip_pairs': np.array(pair_index, dtype=np.int64),
+        'skip_symbols': np.array(symbols, dtype=str),
+        'skip_times': _to_ms(times),
+    }
+
+
+def save_checkpoint(scanner, last_scanned=None, path=None):
+    """
+    Ghi trạng thái scanner ra file
+    
+    Args:
+        scanner: SignalScanner
+        last_scanned: dict timeframe -> thời điểm đã quét (của bot)
+        path: Đường dẫn file (mặc định config.CHECKPOINT_PATH)
+    
+    Returns:
+        dict: {'path', 'bytes', 'seconds', 'frames'}
+    """
+    started = time.perf_counter()
+    path = path or config.CHECKPOINT_PATH
+    last_scanned = last_scanned or {}
+    
+    meta = {
+        'version': CHECKPOINT_VERSION,
+        'saved_at': time.time(),
+        'fingerprint': state_fingerprint(scanner),
+        'last_scanned': {tf: int(_to_ms([ts])[0]) for tf, ts in last_scanned.items()},
+    }
+    
+    arrays = {'meta': np.array(json.dumps(meta))}
+    arrays.update(_candle_arrays(scanner))
+    arrays.update(_cvd_arrays(scanner))
+    arrays.update(_divergence_arrays(scanner))
+    arrays.update(_scheduler_arrays(scanner))
+    
+    # Ghi file tạm rồi thay thế (không để lại file ghi dở khi bị kill)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'seconds': time.perf_counter() - started,
+        'frames': len(arrays.get('candle_symbols', [])),
+    }
+
+
+def load_checkpoint(scanner, path=None, max_age=None):
+    """
+    Khôi phục trạng thái scanner từ file
+    
+    Args:
+        scanner: SignalScanner (vừa khởi tạo)
+        path: Đường dẫn file (mặc định config.CHECKPOINT_PATH)
+        max_age: Tuổi tối đa của checkpoint (giây, mặc định config.CHECKPOINT_MAX_AGE)
+    
+    Returns:
+        dict: last_scanned (timeframe -> Timestamp), None nếu không khôi phục được
+    """
+    path = path or config.CHECKPOINT_PATH
+    max_age = max_age or config.CHECKPOINT_MAX_AGE
+    
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != CHECKPOINT_VERSION:
+                print(f"⚠️ Checkpoint {path} khác phiên bản, bỏ qua")
+                return None
+            if meta.get('fingerprint') != state_fingerprint(scanner):
+                print(f"⚠️ Checkpoint {path} khác tham số chỉ báo, bỏ qua")
+                return None
+            if time.time() - meta['saved_at'] > max_age:
+                print(f"⚠️ Checkpoint {path} đã quá cũ, bỏ qua")
+                return None
+            
+            _restore_candles(scanner, data)
+            _restore_cvd(scanner, data)
+            _restore_divergence(scanner, data)
+            _restore_scheduler(scanner, data)
+        
+        return {tf: _from_ms([ms])[0] for tf, ms in meta['last_scanned'].items()}
+    
+    except Exception as e:
+        print(f"Lỗi khi đọc checkpoint {path}: {str(e)}")
+        return None
+
+
+def _restore_candles(scanner, data):
+    if scanner.store is None or 'candle_symbols' not in data:
+        return
+    
+    offsets = data['candle_offsets']
+    times = _split(data['candle_times'], offsets)
+    values = _split(data['candle_values'], offsets)
+    
+    for symbol, tf, t, v in zip(data['candle_symbols'], data['candle_timeframes'], times, values):
+        df = pd.DataFrame(v, index=_from_ms(t), columns=CANDLE_COLUMNS)
+        df.index.name = 'timestamp'
+        scanner.store.frames[(str(symbol), str(tf))] = df
+
+
+def _restore_cvd(scanner, data):
+    if scanner.cvd is None:
+        return
+    
+    windows = _split(data['cvd_window'], data['cvd_offsets'])
+    last_times = _from_ms(data['cvd_last_time'])
+    
+    for i, (symbol, tf) in enumerate(zip(data['cvd_symbols'], data['cvd_timeframes'])):
+        state = scanner.cvd.create_state()
+        state.window.extend(windows[i].tolist())
+        state.window_sum = float(data['cvd_window_sum'][i])
+        value = float(data['cvd_value'][i])
+        state.value = None if np.isnan(value) else value
+        state.last_time = last_times[i]
+        scanner.cvd_states[(str(symbol), str(tf))] = state
+
+
+def _restore_divergence(scanner, data):
+    if scanner.divergence is None:
+        return
+    
+    bars = _split(data['div_bars'], data['div_bar_offsets'])
+    swing_highs = _split(data['div_swing_highs'], data['div_swing_high_offsets'])
+    swing_lows = _split(data['div_swing_lows'], data['div_swing_low_offsets'])
+    
+    for i, (symbol, tf) in enumerate(zip(data['div_symbols'], data['div_timeframes'])):
+        tracker = scanner.divergence.create_tracker()
+        tracker.highs.extend(bars[i][:, 0].tolist())
+        tracker.lows.extend(bars[i][:, 1].tolist())
+        tracker.cvds.extend(bars[i][:, 2].tolist())
+        tracker.swing_highs.extend((int(p), price, cvd) for p, price, cvd in swing_highs[i].tolist())
+        tracker.swing_lows.extend((int(p), price, cvd) for p, price, cvd in swing_lows[i].tolist())
+        tracker.bar_count = int(data['div_bar_count'][i])
+        scanner.divergence_trackers[(str(symbol), str(tf))] = tracker
+
+
+def _restore_scheduler(scanner, data):
+    next_times = _from_ms(data['skip_times'])
+    
+    for pair_index, symbol, next_time in zip(data['skip_pairs'], data['skip_symbols'], next_times):
+        scheduler = scanner.skip_schedulers.get(scanner.pairs[int(pair_index)])
+        if scheduler is not None:
+            scheduler.next_check[str(symbol)] = next_time
@@ -0,0 +1,133 @@
+"""
+Lịch quét chính xác theo thời điểm đóng nến trên server Binance
+
+Thay cho việc kiểm tra đồng hồ mỗi 30 giây:
+- ExchangeClock đo độ lệch giữa đồng hồ máy và server Binance (/api/v3/time)
+- CloseScheduler tính thời điểm đóng nến kế tiếp của các timeframe và ngủ
+  đến đúng thời điểm đó + CLOSE_GRACE_SECONDS (thời gian để sàn chốt nến)
+"""
+
+import asyncio
+import logging
+import time
+
+import pandas as pd
+
+import config
+from candle_store import floor_to_timeframe, timeframe_delta
+from exchange_client import get_exchange
+
+logger = logging.getLogger(__name__)
+
+
+class ExchangeClock:
+    """
+    Đồng hồ theo giờ server Binance
+    """
+    
+    def __init__(self, samples=3):
+        """
+        Args:
+            samples: Số lần đo mỗi lần đồng bộ (lấy lần có độ trễ thấp nhất)
+        """
+        self.samples = samples
+        self.offset_ms = 0.0
+        self.rtt_ms = None
+        self.synced_at = None
+    
+    def sync(self):
+        """
+        Đo độ lệch đồng hồ so với server
+        
+        Returns:
+            float: Độ lệch (ms, dương = server chạy trước máy), None nếu lỗi
+        """
+        best = None
+        for _ in range(self.samples):
+            try:
+                sent = time.time() * 1000
+                server = float(get_exchange().publicGetTime()['serverTime'])
+                received = time.time() * 1000
+            except Exception as e:
+                print(f"Lỗi khi lấy giờ server: {str(e)}")
+                continue
+            
+            rtt = received - sent
+            if best is None or rtt < best[1]:
+                best = (server - (sent + received) / 2, rtt)
+        
+        if best is None:
+            return None
+        
+        self.offset_ms, self.rtt_ms = best
+        self.synced_at = time.monotonic()
+        return self.offset_ms
+    
+    @property
+    def is_stale(self):
+        return self.synced_at is None or time.monotonic() - self.synced_at > config.CLOCK_SYNC_INTERVAL
+    
+    def time(self):
+        """Giờ server hiện tại (giây, epoch)"""
+        return time.time() + self.offset_ms / 1000
+    
+    def now(self):
+        """Giờ server hiện tại (Timestamp giờ Việt Nam)"""
+        return pd.Timestamp(self.time(), unit='s', tz='UTC').tz_convert(config.TIMEZONE)
+
+
+class CloseScheduler:
+    """
+    Chờ đến thời điểm đóng nến kế tiếp của các timeframe
+    """
+    
+    def __init__(self, timeframes, clock, grace=None):
+        """
+        Args:
+            timeframes: Các timeframe cần quét khi đóng nến
+            clock: ExchangeClock
+            grace: Số giây chờ thêm sau khi đóng nến (mặc định CLOSE_GRACE_SECONDS)
+        """
+        self.timeframes = list(timeframes)
+        self.clock = clock
+        self.grace = config.CLOSE_GRACE_SECONDS if grace is None else grace
+    
+    def next_close(self, now=None):
+        """
+        Thời điểm đóng nến kế tiếp sau now
+        
+        Returns:
+            tuple: (close_time, các timeframe đóng nến tại close_time)
+        """
+        if now is None:
+            now = self.clock.now()
+        index = pd.DatetimeIndex([now])
+        
+        closes = {
+            tf: floor_to_timeframe(index, tf)[0] + timeframe_delta(tf)
+            for tf in self.timeframes
+        }
+        close_time = min(closes.values())
+        return close_time, [tf for tf in self.timeframes if closes[tf] == close_time]
+    
+    async def wait_next_close(self):
+        """
+        Ngủ đến thời điểm đóng nến kế tiếp + grace
+        
+        Returns:
+            tuple: (close_time, các timeframe vừa đóng nến)
+        """
+        if self.clock.is_stale:
+            offset = await asyncio.to_thread(self.clock.sync)
+            if offset is not None:
+                logger.info(f"Đồng bộ giờ server: lệch {offset:+.0f}ms (RTT {self.clock.rtt_ms:.0f}ms)")
+        
+        close_time, timeframes = self.next_close()
+        target = close_time.timestamp() + self.grace
+        
+        # Ngủ từng đoạn để không lệch khi máy bị treo/đồng bộ lại giờ
+        while True:
+            remaining = target - self.clock.time()
+            if remaining <= 0:
+                return close_time, timeframes
+            await asyncio.sleep(min(remaining, 60))
@@ -19,6 +19,7 @@ TIMEZONE = pytz.timezone('Asia/Ho_Chi_Minh')  # Múi giờ Việt Nam UTC+7
 # ============================================
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID', 'YOUR_CHANNEL_ID_HERE')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # Thay server Bot API (ví dụ sàn giả http://127.0.0.1:8900)
 
 # ============================================
 # CẤU HÌNH DATABASE (PostgreSQL)
@@ -40,6 +41,15 @@ CVD_PERIOD = 24                  # CVD Period
 CVD_CUMULATIVE_MODE = 'EMA'      # Cumulative Mode: 'Periodic' hoặc 'EMA'
 CVD_MARKET_TYPE = 'Crypto'       # Market Ultra Data: 'Crypto', 'Forex', 'Stock'
 CVD_MIN_SWING_DISTANCE = 5       # Khoảng cách tối thiểu giữa 2 pivot (số nến)
+CVD_ENABLED = True               # Tính CVD từ taker-buy volume của nến khi quét
+CVD_DIVERGENCE_ENABLED = True    # Phát hiện phân kỳ giá/CVD (pivot fractal) khi quét
+
+# CVD chính xác từ aggTrades (thay taker-buy volume của nến cho các symbol dưới đây)
+AGGTRADE_ENABLED = False
+AGGTRADE_SYMBOLS = ['BTCUSDT', 'ETHUSDT']  # Symbol volume lớn cần CVD theo từng lệnh
+AGGTRADE_TIMEFRAME = '15m'       # Khung nến của bucket delta
+AGGTRADE_BUCKETS = 500           # Số nến giữ lại mỗi symbol (bộ nhớ cố định)
+AGGTRADE_WS_BUFFER = 1000        # Số trade tối đa ccxt giữ tạm mỗi symbol
 
 # ============================================
 # CẤU HÌNH ĐIỀU KIỆN TÍN HIỆU
@@ -62,8 +72,28 @@ WIN_RATE_HIGH = 80    # Tỷ lệ win cao
 TIMEFRAME_M15 = '15m'  # Khung 15 phút
 TIMEFRAME_H1 = '1h'    # Khung 1 giờ
 
+# Cặp khung thời gian của chiến lược: (khung vào lệnh, khung bối cảnh)
+# Ví dụ: ('5m', '15m'), ('15m', '1h'), ('1h', '4h')
+# Mỗi (symbol, timeframe) chỉ được tải và tính chỉ báo 1 lần mỗi lần quét
+STRATEGY_PAIRS = [
+    ('15m', '1h'),
+]
+
 # Số lượng nến cần lấy để phân tích
 CANDLES_LIMIT = 500
+CANDLES_LIMIT_M15 = 300   # Số nến M15 dùng khi quét
+CANDLES_LIMIT_H1 = 500    # Số nến H1 dùng khi quét
+
+# Số nến theo từng timeframe (timeframe khác dùng CANDLES_LIMIT)
+CANDLES_LIMITS = {
+    '15m': CANDLES_LIMIT_M15,
+    '1h': CANDLES_LIMIT_H1,
+}
+
+# Kho nến: H1 được dựng từ M15, chỉ tải từ Binance phần còn thiếu
+CANDLE_STORE_ENABLED = True
+CANDLE_STORE_MAX_CANDLES = 1000  # Số nến tối đa lưu cho mỗi (symbol, timeframe)
+HISTORY_PAGE_LIMIT = 1000       # Số nến mỗi request khi tải lịch sử (đánh giá kết quả tín hiệu)
 
 # ============================================
 # CẤU HÌNH BOT
@@ -123,7 +153,180 @@ SR_M15_LOOPBACK_PERIOD = 290          # GIỐNG H1
 SR_M15_MIN_STRENGTH = 1
 SR_M15_MAX_CHANNELS = 6
 
+# Tham số S/R theo timeframe (timeframe khác dùng SR_DEFAULT_PARAMS)
+SR_DEFAULT_PARAMS = {
+    'pivot_period': SR_PIVOT_PERIOD,
+    'channel_width_percent': SR_CHANNEL_WIDTH_PERCENT,
+    'loopback_period': SR_LOOPBACK_PERIOD,
+    'min_strength': SR_MIN_STRENGTH,
+    'max_channels': SR_MAX_CHANNELS,
+}
+
+SR_TIMEFRAME_PARAMS = {
+    '1h': SR_DEFAULT_PARAMS,
+    '15m': {
+        'pivot_period': SR_M15_PIVOT_PERIOD,
+        'channel_width_percent': SR_M15_CHANNEL_WIDTH_PERCENT,
+        'loopback_period': SR_M15_LOOPBACK_PERIOD,
+        'min_strength': SR_M15_MIN_STRENGTH,
+        'max_channels': SR_M15_MAX_CHANNELS,
+    },
+}
+
 # ============================================
 # CẤU HÌNH LOẠI TÍN HIỆU
 # ============================================
-SIGNAL_STOCH_SR_ENABLED = True    # Bật tín hiệu Stoch + S/R
\ No newline at end of file
+SIGNAL_STOCH_SR_ENABLED = True    # Bật tín hiệu Stoch + S/R
+
+# ============================================
+# CẤU HÌNH LỊCH QUÉT (BỎ QUA SYMBOL CHƯA THỂ CÓ TÍN HIỆU)
+# ============================================
+SKIP_SCHEDULER_ENABLED = True     # Bật/tắt bỏ qua symbol dựa trên biên Stoch
+SKIP_SCHEDULER_HORIZON = 96       # Số nến khung vào lệnh tối đa được bỏ qua (M15: 96 = 24 giờ)
+
+# ============================================
+# CẤU HÌNH KẾT NỐI BINANCE
+# ============================================
+MARKETS_CACHE_PATH = os.getenv('MARKETS_CACHE_PATH', 'binance_markets.json')  # Cache exchangeInfo
+MARKETS_CACHE_TTL = 24 * 3600     # Tải lại thông tin market sau số giây này
+BINANCE_WEIGHT_LIMIT = 6000       # Request weight tối đa mỗi phút mỗi IP (spot API)
+BINANCE_WEIGHT_SAFETY = 0.9       # Chỉ dùng 90% ngân sách, chừa phần cho request khác
+BINANCE_WEIGHT_SHARED_NAME = os.getenv('BINANCE_WEIGHT_SHARED_NAME')  # Tên shared memory khi nhiều process cùng máy
+BINANCE_REQUEST_TIMEOUT = 10000   # Timeout mỗi request REST (ms)
+BINANCE_API_URL = os.getenv('BINANCE_API_URL')  # Thay mọi host API, nhiều URL cách nhau dấu phẩy (ví dụ sàn giả http://127.0.0.1:8900)
+
+# ============================================
+# CẤU HÌNH HEDGED REQUEST (NHIỀU HOST API BINANCE)
+# ============================================
+HEDGE_ENABLED = True              # Bật/tắt gửi bản dự phòng khi request chậm
+BINANCE_API_HOSTS = [             # Các host API spot cùng dữ liệu
+    'api.binance.com',
+    'api1.binance.com',
+    'api2.binance.com',
+    'api3.binance.com',
+]
+HEDGE_PERCENTILE = 95             # Chờ quá phân vị này của độ trễ gần đây -> gửi bản dự phòng
+HEDGE_MIN_DELAY = 0.3             # Thời gian chờ tối thiểu trước khi gửi bản dự phòng (giây)
+HEDGE_MAX_DELAY = 2.0             # Thời gian chờ tối đa (dùng khi chưa đủ mẫu độ trễ)
+HEDGE_MIN_SAMPLES = 20            # Số mẫu độ trễ tối thiểu để tính phân vị
+HEDGE_LATENCY_WINDOW = 500        # Số request gần nhất dùng để tính phân vị
+HEDGE_MAX_UTILIZATION = 0.7       # Dùng quá tỷ lệ weight này thì không gửi bản dự phòng
+HEDGE_WORKERS = 8                 # Số thread gửi request
+HOST_BREAKER_FAILURES = 5         # Lỗi liên tiếp để ngắt host
+HOST_BREAKER_COOLDOWN = 30        # Giây ngắt host trước khi thử lại
+
+# ============================================
+# CẤU HÌNH LỊCH QUÉT THEO THỜI ĐIỂM ĐÓNG NẾN
+# ============================================
+CLOSE_GRACE_SECONDS = 2           # Chờ thêm sau khi đóng nến để sàn chốt nến
+CLOSE_REPOLL_ATTEMPTS = 3         # Số lần quét lại symbol sàn chưa trả nến vừa đóng
+CLOSE_REPOLL_DELAY = 2            # Giây giữa các lần quét lại
+CLOCK_SYNC_INTERVAL = 600         # Đồng bộ lại giờ server Binance sau số giây này
+
+# ============================================
+# CẤU HÌNH CHECKPOINT (KHỞI ĐỘNG LẠI NHANH)
+# ============================================
+CHECKPOINT_ENABLED = True         # Lưu trạng thái scanner sau mỗi lần quét, khôi phục khi khởi động
+CHECKPOINT_PATH = os.getenv('CHECKPOINT_PATH', 'scanner_checkpoint.npz')
+CHECKPOINT_MAX_AGE = 6 * 3600     # Checkpoint cũ hơn số giây này bị bỏ qua (tải lại toàn bộ)
+
+# ============================================
+# CẤU HÌNH CHẠY NHIỀU WORKER (CHIA SYMBOL)
+# ============================================
+SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', 'false').lower() == 'true'  # Bật khi chạy nhiều worker
+WORKER_ID = os.getenv('WORKER_ID') or os.getenv('DYNO')  # ID worker (mặc định hostname-pid)
+WORKER_HEARTBEAT_INTERVAL = 15    # Giây giữa 2 lần heartbeat
+WORKER_HEARTBEAT_TTL = 60         # Worker không heartbeat quá số giây này coi như đã chết
+SHARD_VIRTUAL_NODES = 100         # Số virtual node mỗi worker trên hash ring
+
+# ============================================
+# CẤU HÌNH ĐO ĐỘ TRỄ TÍN HIỆU (ĐÓNG NẾN -> TELEGRAM)
+# ============================================
+LATENCY_SLO_SECONDS = 10          # p95 độ trễ tổng tối đa (giây) trước khi báo động
+LATENCY_WINDOW = 200              # Số tín hiệu gần nhất dùng để tính p50/p95/p99
+LATENCY_MIN_SAMPLES = 20          # Số tín hiệu tối thiểu trước khi kiểm tra SLO
+LATENCY_ALERT_COOLDOWN = 3600     # Giây giữa 2 lần báo động
+LATENCY_ALERT_CHAT_ID = os.getenv('LATENCY_ALERT_CHAT_ID')  # Chat nhận báo động (None = chỉ ghi log)
+
+# ============================================
+# CẤU HÌNH THEO DÕI BỘ NHỚ (LỆNH /mem)
+# ============================================
+MEMORY_TRACE_ENABLED = os.getenv('MEMORY_TRACE_ENABLED', 'false').lower() == 'true'  # Bật tracemalloc (tốn thêm CPU/RAM)
+MEMORY_TRACE_FRAMES = 1           # Số frame traceback lưu cho mỗi lần cấp phát
+MEMORY_REPORT_TOP = 10            # Số dòng code giữ nhiều bộ nhớ nhất trong báo cáo
+
+# ============================================
+# CẤU HÌNH LƯU TRỮ LỊCH SỬ TÍN HIỆU
+# ============================================
+SIGNAL_PARTITIONING_ENABLED = os.getenv('SIGNAL_PARTITIONING_ENABLED', 'true').lower() == 'true'  # PostgreSQL: chia signal_history theo tháng
+SIGNAL_PARTITION_MONTHS_AHEAD = 2     # Tạo sẵn partition cho số tháng tới
+SIGNAL_RETENTION_MONTHS = 12          # Giữ tín hiệu trong database bao nhiêu tháng
+SIGNAL_ARCHIVE_DIR = os.getenv('SIGNAL_ARCHIVE_DIR', 'archive')  # Thư mục file lưu trữ (.jsonl.gz theo tháng)
+SIGNAL_ARCHIVE_BATCH = 5000           # Số dòng đọc mỗi lần khi xuất file lưu trữ
+SIGNAL_RETENTION_INTERVAL = 86400     # Giây giữa 2 lần chạy lưu trữ
+
+# ============================================
+# CẤU HÌNH ĐÁNH GIÁ KẾT QUẢ TÍN HIỆU
+# ============================================
+OUTCOME_ENABLED = True
+OUTCOME_TIMEFRAME = '15m'             # Khung nến dùng để đánh giá
+OUTCOME_HORIZONS = ['1h', '4h', '1d'] # Các mốc tính kết quả sau tín hiệu
+OUTCOME_TP_PCT = 2.0                  # Chốt lời (% theo hướng tín hiệu)
+OUTCOME_SL_PCT = 1.0                  # Cắt lỗ (%)
+OUTCOME_BATCH = 5000                  # Số tín hiệu tối đa mỗi lượt đánh giá
+OUTCOME_INTERVAL = 3600               # Giây giữa 2 lượt đánh giá
+STATS_HORIZON = '1d'                  # Mốc kết quả dùng cho tỷ lệ thắng trong /stats (phải có trong OUTCOME_HORIZONS)
+STATS_DEFAULT_DAYS = 30               # Số ngày mặc định của /stats
+
+# ============================================
+# CẤU HÌNH ĐĂNG KÝ THEO DÕI CỦA NGƯỜI DÙNG
+# ============================================
+# Chat quản lý watchlist của channel (/add, /remove, /list tác động lên channel thay vì chat đó)
+ADMIN_CHAT_IDS = [int(chat_id) for chat_id in os.getenv('ADMIN_CHAT_IDS', '').split(',') if chat_id.strip()]
+SUBSCRIPTION_MAX_SYMBOLS = 50         # Số coin tối đa mỗi người dùng theo dõi
+SUBSCRIPTION_REFRESH_INTERVAL = 300   # Giây giữa 2 lần tải lại chỉ mục đăng ký từ database (nhiều worker)
+
+# ============================================
+# CẤU HÌNH GỬI TIN TELEGRAM (NHIỀU CHAT)
+# ============================================
+TELEGRAM_GLOBAL_RATE = 30             # Số tin/giây tối đa cho cả bot
+TELEGRAM_GLOBAL_BURST = 5             # Số tin được gửi dồn một lúc
+TELEGRAM_CHAT_RATE = 1.0              # Số tin/giây mỗi chat riêng
+TELEGRAM_GROUP_RATE = 20 / 60         # Số tin/giây mỗi nhóm/channel (20 tin/phút)
+TELEGRAM_GROUP_BURST = 20             # Số tin nhóm/channel được gửi dồn một lúc
+TELEGRAM_MESSAGE_LIMIT = 4096         # Độ dài tối đa một tin (tin tổng hợp dài hơn được tách)
+FANOUT_CONCURRENCY = 30               # Số request gửi song song
+FANOUT_MAX_ATTEMPTS = 5               # Số lần thử gửi một tin khi lỗi mạng
+FANOUT_RETRY_BACKOFF = 2              # Giây chờ trước lần thử lại đầu tiên (nhân đôi mỗi lần)
+
+# ============================================
+# CẤU HÌNH OUTBOX TÍN HIỆU (GỬI TÁCH KHỎI LẦN QUÉT)
+# ============================================
+OUTBOX_BATCH = 500                    # Số tín hiệu tối đa mỗi lượt gửi
+OUTBOX_POLL_INTERVAL = 2              # Giây giữa 2 lần kiểm tra outbox (khi không có lần quét báo tín hiệu mới)
+OUTBOX_MAX_ATTEMPTS = 10              # Số lần gửi lỗi trước khi đánh dấu 'failed'
+OUTBOX_RETRY_BACKOFF = 5              # Giây chờ trước lần thử lại đầu tiên (nhân đôi mỗi lần)
+OUTBOX_RETRY_MAX_DELAY = 300          # Thời gian chờ tối đa giữa 2 lần thử (giây)
+OUTBOX_CLAIM_TIMEOUT = 120            # Giây sau đó dòng 'sending' của worker chết/treo được giành lại
+OUTBOX_RETENTION_DAYS = 7             # Giữ dòng đã gửi trong outbox bao nhiêu ngày
+
+# ============================================
+# CẤU HÌNH LỆNH /check
+# ============================================
+CHECK_CACHE_TTL = 60                  # Giây giữ kết quả tính tại chỗ cho symbol ngoài watchlist
+CHECK_CACHE_SIZE = 200                # Số symbol tối đa trong cache /check
+
+# ============================================
+# CẤU HÌNH LỆNH /chart
+# ============================================
+CHART_CANDLES = 120                   # Số nến vẽ trên biểu đồ (S/R vẫn tính trên toàn bộ nến)
+CHART_DPI = 100                       # Độ phân giải ảnh
+CHART_WORKERS = 2                     # Số process vẽ biểu đồ
+CHART_CACHE_BYTES = 32 * 1024 * 1024  # Dung lượng tối đa cache ảnh (bỏ ảnh lâu không dùng nhất)
+
+# ============================================
+# CẤU HÌNH CẢNH BÁO GIÁ (/alert)
+# ============================================
+ALERT_MAX_PER_CHAT = 20               # Số cảnh báo đang chờ tối đa mỗi người
+ALERT_RETENTION_DAYS = 30             # Giữ cảnh báo đã kích hoạt bao nhiêu ngày
+ALERT_FETCH_CONCURRENCY = 8           # Số request tải nến song song cho symbol có cảnh báo nhưng không cần quét tín hiệu
@@ -0,0 +1,158 @@
+"""
+Chỉ báo CVD (Cumulative Volume Delta) từ taker-buy volume của nến
+
+Delta mỗi nến = volume mua chủ động - volume bán chủ động
+             = taker_buy_volume - (volume - taker_buy_volume)
+
+Không cần tải aggTrades: Binance trả sẵn taker-buy volume trong klines.
+
+Chế độ cộng dồn (config.CVD_CUMULATIVE_MODE):
+- 'Periodic': Tổng delta của CVD_PERIOD nến gần nhất
+- 'EMA': EMA(CVD_PERIOD) của delta
+"""
+
+from collections import deque
+
+CUMULATIVE_MODES = ('Periodic', 'EMA')
+
+
+class CVDIndicator:
+    """
+    Lớp tính toán CVD - bản vector hóa cho backtest
+    """
+    
+    def __init__(self, period=24, cumulative_mode='EMA'):
+        """
+        Khởi tạo chỉ báo CVD
+        
+        Args:
+            period: Chu kỳ CVD - mặc định 24
+            cumulative_mode: 'Periodic' hoặc 'EMA'
+        """
+        if cumulative_mode not in CUMULATIVE_MODES:
+            raise ValueError(f"Cumulative mode không hợp lệ: {cumulative_mode}")
+        
+        self.period = period
+        self.cumulative_mode = cumulative_mode
+    
+    @staticmethod
+    def delta(df):
+        """
+        Tính delta volume từng nến
+        
+        Args:
+            df: DataFrame với cột ['volume', 'taker_buy_volume']
+        
+        Returns:
+            Series: Delta volume
+        """
+        return 2 * df['taker_buy_volume'] - df['volume']
+    
+    def calculate_from_delta(self, delta):
+        """
+        Tính CVD từ chuỗi delta có sẵn (ví dụ delta từ aggTrades)
+        
+        Args:
+            delta: Series delta volume
+        
+        Returns:
+            Series: CVD
+        """
+        if self.cumulative_mode == 'Periodic':
+            return delta.rolling(window=self.period, min_periods=1).sum()
+        return delta.ewm(span=self.period, adjust=False).mean()
+    
+    def calculate(self, df):
+        """
+        Tính CVD cho toàn bộ chuỗi nến
+        
+        Args:
+            df: DataFrame với cột ['volume', 'taker_buy_volume']
+        
+        Returns:
+            Series: CVD
+        """
+        return self.calculate_from_delta(self.delta(df))
+    
+    def create_state(self):
+        """Tạo trạng thái tính CVD từng nến (dùng cho quét live)"""
+        return CVDState(self.period, self.cumulative_mode)
+
+
+class CVDState:
+    """
+    Trạng thái CVD cập nhật theo từng nến đã đóng - O(1) mỗi nến
+    
+    Cho kết quả giống CVDIndicator.calculate trên cùng chuỗi nến.
+    """
+    
+    def __init__(self, period=24, cumulative_mode='EMA'):
+        self.period = period
+        self.cumulative_mode = cumulative_mode
+        self.alpha = 2 / (period + 1)
+        
+        self.window = deque(maxlen=period)
+        self.window_sum = 0.0
+        self.value = None
+        self.last_time = None
+    
+    def update(self, delta, candle_time=None):
+        """
+        Thêm delta của một nến đã đóng
+        
+        Args:
+            delta: Delta volume của nến
+            candle_time: Open time của nến
+        
+        Returns:
+            float: CVD mới
+        """
+        if self.cumulative_mode == 'Periodic':
+            if len(self.window) == self.period:
+                self.window_sum -= self.window[0]
+            self.window.append(delta)
+            self.window_sum += delta
+            self.value = self.window_sum
+        elif self.value is None:
+            self.value = delta
+        else:
+            self.value += self.alpha * (delta - self.value)
+        
+        self.last_time = candle_time
+        return self.value
+    
+    def update_from_candles(self, df):
+        """
+        Cập nhật bằng các nến đã đóng mới hơn nến cuối đã xử lý
+        
+        Args:
+            df: DataFrame nến đã đóng với cột ['volume', 'taker_buy_volume']
+        
+        Returns:
+            float: CVD mới (None nếu chưa có nến)
+        """
+        if self.last_time is not None:
+            df = df[df.index > self.last_time]
+        
+        deltas = CVDIndicator.delta(df)
+        for candle_time, delta in zip(deltas.index, deltas.to_numpy()):
+            self.update(float(delta), candle_time)
+        
+        return self.value
+
+
+# Hàm tiện ích
+def calculate_cvd(df, period=24, cumulative_mode='EMA'):
+    """
+    Hàm tiện ích tính CVD
+    
+    Args:
+        df: DataFrame với cột ['volume', 'taker_buy_volume']
+        period: Chu kỳ CVD
+        cumulative_mode: 'Periodic' hoặc 'EMA'
+    
+    Returns:
+        Series: CVD
+    """
+    indicator = CVDIndicator(period, cumulative_mode)
+    return indicator.calculate(df)
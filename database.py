@@ -2,11 +2,13 @@
 Quản lý database PostgreSQL cho bot
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy import (create_engine, Column, Integer, BigInteger, Float, String, Text, Date, DateTime, Boolean, Index, inspect, text,
+                        select, insert, update, delete, literal, func, bindparam, and_, or_)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+from datetime import datetime, timedelta, timezone
 import config
+import signal_archive
 
 Base = declarative_base()
 
@@ -26,6 +28,47 @@ class WatchlistSymbol(Base):
         return f"<WatchlistSymbol(symbol='{self.symbol}', active={self.is_active})>"
 
 
+class UserSubscription(Base):
+    """
+    Bảng đăng ký theo dõi của từng chat (người dùng /add trong chat riêng)
+    """
+    __tablename__ = 'user_subscriptions'
+    
+    chat_id = Column(BigInteger, primary_key=True)
+    symbol = Column(String(20), primary_key=True)
+    added_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (Index('ix_user_subscriptions_symbol', 'symbol'),)
+    
+    def __repr__(self):
+        return f"<UserSubscription(chat_id={self.chat_id}, symbol='{self.symbol}')>"
+
+
+class PriceAlert(Base):
+    """
+    Bảng cảnh báo giá của từng chat: một mức giá (price_low = price_high) hoặc một vùng
+    """
+    __tablename__ = 'price_alerts'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    symbol = Column(String(20), nullable=False)
+    price_low = Column(Float, nullable=False)
+    price_high = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    created_price = Column(Float, nullable=True)             # Giá lúc tạo (chỉ xét giá từ lúc này)
+    triggered_at = Column(DateTime, nullable=True)           # NULL = đang chờ
+    triggered_price = Column(Float, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_price_alerts_symbol_triggered', 'symbol', 'triggered_at'),
+        Index('ix_price_alerts_chat', 'chat_id'),
+    )
+    
+    def __repr__(self):
+        return f"<PriceAlert(id={self.id}, symbol='{self.symbol}', {self.price_low}-{self.price_high})>"
+
+
 class SignalHistory(Base):
     """
     Bảng lưu lịch sử tín hiệu đã gửi (để tránh gửi trùng)
@@ -41,14 +84,233 @@ class SignalHistory(Base):
     stoch_m15 = Column(String(10), nullable=False)
     stoch_h1 = Column(String(10), nullable=False)
     sent_at = Column(DateTime, default=datetime.utcnow)
+    # 'pending': đã giành quyền gửi, 'sent': đã gửi lên channel
+    status = Column(String(10), nullable=False, default='sent', server_default='sent')
+    confirm_time = Column(DateTime, nullable=True)
+    
+    # Độ trễ từng bước (giờ server Binance, UTC): đóng nến -> có dữ liệu -> ra quyết định -> Telegram xác nhận
+    candle_close_at = Column(DateTime, nullable=True)
+    data_received_at = Column(DateTime, nullable=True)
+    decided_at = Column(DateTime, nullable=True)
+    acked_at = Column(DateTime, nullable=True)
+    latency_ms = Column(Integer, nullable=True)  # Từ đóng nến đến khi Telegram xác nhận
+    
+    # Giá trị dạng số (các cột chuỗi ở trên giữ lại cho tương thích) - dùng cho thống kê
+    price_value = Column(Float, nullable=True)
+    stoch_m15_value = Column(Float, nullable=True)
+    stoch_h1_value = Column(Float, nullable=True)
+    timeframes = Column(String(20), nullable=True)  # Khung chạm S/R, ví dụ 'M15 & H1'
+    
+    __table_args__ = tuple(Index(name, *columns) for name, columns in signal_archive.SIGNAL_HISTORY_INDEXES.items())
     
     def __repr__(self):
         return f"<SignalHistory(id='{self.signal_id}', symbol='{self.symbol}', type='{self.signal_type}')>"
 
 
+class SignalOutcome(Base):
+    """
+    Kết quả thực tế của tín hiệu ở từng mốc thời gian (outcome_tracker.py)
+    """
+    __tablename__ = 'signal_outcomes'
+    
+    signal_id = Column(String(50), primary_key=True)
+    horizon = Column(String(10), primary_key=True)  # Ví dụ '1h', '4h', '1d'
+    symbol = Column(String(20), nullable=False)
+    signal_type = Column(String(10), nullable=False)
+    entry_price = Column(Float, nullable=False)
+    horizon_bars = Column(Integer, nullable=False)
+    return_pct = Column(Float, nullable=False)      # Lợi nhuận theo hướng tín hiệu tại cuối mốc
+    mfe_pct = Column(Float, nullable=False)         # Biến động thuận lợi lớn nhất (>= 0)
+    mae_pct = Column(Float, nullable=False)         # Biến động bất lợi lớn nhất (<= 0)
+    result = Column(String(10), nullable=False)     # 'tp' / 'sl' / 'open' / 'invalid' (không đánh giá được)
+    bars_to_exit = Column(Integer, nullable=True)   # Số nến đến khi chạm TP/SL
+    evaluated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (Index('ix_signal_outcomes_symbol_horizon', 'symbol', 'horizon'),)
+    
+    def __repr__(self):
+        return f"<SignalOutcome(id='{self.signal_id}', horizon='{self.horizon}', result='{self.result}')>"
+
+
+class SignalDailyStats(Base):
+    """
+    Thống kê tín hiệu theo ngày (giờ VN) - cộng dồn khi tín hiệu được gửi và
+    khi có kết quả ở mốc STATS_HORIZON, để /stats không phải quét cả lịch sử
+    """
+    __tablename__ = 'signal_daily_stats'
+    
+    day = Column(Date, primary_key=True)
+    symbol = Column(String(20), primary_key=True)
+    signal_type = Column(String(10), primary_key=True)
+    timeframes = Column(String(20), primary_key=True)  # '' nếu tín hiệu cũ không lưu khung
+    signals = Column(Integer, nullable=False, default=0)     # Số tín hiệu đã gửi
+    evaluated = Column(Integer, nullable=False, default=0)   # Số tín hiệu đã có kết quả
+    wins = Column(Integer, nullable=False, default=0)        # Chạm TP trước
+    losses = Column(Integer, nullable=False, default=0)      # Chạm SL trước
+    return_sum = Column(Float, nullable=False, default=0.0)
+    mfe_sum = Column(Float, nullable=False, default=0.0)
+    mae_sum = Column(Float, nullable=False, default=0.0)
+    
+    __table_args__ = (Index('ix_signal_daily_stats_symbol_day', 'symbol', 'day'),)
+    
+    def __repr__(self):
+        return f"<SignalDailyStats(day={self.day}, symbol='{self.symbol}', signals={self.signals})>"
+
+
+# Khóa và cột cộng dồn của SignalDailyStats
+DAILY_STATS_KEYS = ('day', 'symbol', 'signal_type', 'timeframes')
+DAILY_STATS_COUNTERS = ('signals', 'evaluated', 'wins', 'losses', 'return_sum', 'mfe_sum', 'mae_sum')
+
+
+class SignalOutbox(Base):
+    """
+    Outbox tín hiệu chờ gửi: lần quét ghi tín hiệu (cùng transaction với
+    signal_history), dispatcher gửi đi, thử lại khi lỗi và đánh dấu đã gửi
+    """
+    __tablename__ = 'signal_outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    signal_id = Column(String(50), unique=True, nullable=False)
+    symbol = Column(String(20), nullable=False)
+    text = Column(Text, nullable=False)
+    # 'pending': chờ gửi, 'sending': worker đã giành và đang gửi, 'delivered': đã gửi, 'failed': hết số lần thử
+    status = Column(String(10), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = Column(String(100), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (Index('ix_signal_outbox_status_next', 'status', 'next_attempt_at'),)
+    
+    def __repr__(self):
+        return f"<SignalOutbox(id='{self.signal_id}', status='{self.status}', attempts={self.attempts})>"
+
+
+class PendingDelivery(Base):
+    """
+    Tin Telegram chưa gửi được khi dừng bot (gửi tiếp ở lần chạy sau)
+    """
+    __tablename__ = 'pending_deliveries'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String(64), nullable=False)
+    text = Column(Text, nullable=False)
+    priority = Column(Integer, nullable=False, default=1)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<PendingDelivery(chat_id='{self.chat_id}', priority={self.priority})>"
+
+
+class WorkerHeartbeat(Base):
+    """
+    Bảng heartbeat của các worker quét (chia symbol khi chạy nhiều worker)
+    """
+    __tablename__ = 'worker_heartbeats'
+    
+    worker_id = Column(String(100), primary_key=True)
+    hostname = Column(String(100), nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<WorkerHeartbeat(worker_id='{self.worker_id}', last_seen={self.last_seen})>"
+
+
+# Cột thêm vào signal_history sau phiên bản đầu: tên -> kiểu khi ALTER TABLE
+SIGNAL_HISTORY_MIGRATIONS = {
+    'status': "VARCHAR(10) NOT NULL DEFAULT 'sent'",
+    'confirm_time': 'TIMESTAMP',
+    'candle_close_at': 'TIMESTAMP',
+    'data_received_at': 'TIMESTAMP',
+    'decided_at': 'TIMESTAMP',
+    'acked_at': 'TIMESTAMP',
+    'latency_ms': 'INTEGER',
+    'price_value': 'DOUBLE PRECISION',
+    'stoch_m15_value': 'DOUBLE PRECISION',
+    'stoch_h1_value': 'DOUBLE PRECISION',
+    'timeframes': 'VARCHAR(20)',
+}
+
+# Cột số -> cột chuỗi cũ (điền giá trị cho các dòng có từ trước)
+NUMERIC_BACKFILL = {
+    'price_value': 'price',
+    'stoch_m15_value': 'stoch_m15',
+    'stoch_h1_value': 'stoch_h1',
+}
+
+
+def normalize_symbol(symbol):
+    """Chuẩn hóa symbol: 'btc' / 'BTC/USDT' -> 'BTCUSDT'"""
+    symbol = symbol.upper().replace('/', '')
+    if not symbol.endswith('USDT'):
+        symbol = symbol + 'USDT'
+    return symbol
+
+
+def signal_day(signal_id):
+    """Ngày (giờ VN) của tín hiệu từ signal_id: {symbol}_{YYYYmmddHHMM}_..."""
+    return datetime.strptime(signal_id.split('_')[1][:8], '%Y%m%d').date()
+
+
+def signal_time_window(signal_id):
+    """
+    Khoảng chắc chắn chứa signal_time của tín hiệu (thời gian trong signal_id là giờ VN,
+    cột lưu theo giờ UTC hoặc giờ VN tùy driver) - đủ để PostgreSQL bỏ các partition khác
+    """
+    local = datetime.strptime(signal_id.split('_')[1][:12], '%Y%m%d%H%M')
+    return local - timedelta(days=1), local + timedelta(days=1)
+
+
+def signal_filter(signal_ids):
+    """Điều kiện signal_id kèm khoảng signal_time suy từ signal_id (tìm theo id trên bảng partition)"""
+    windows = [signal_time_window(signal_id) for signal_id in signal_ids]
+    return and_(
+        SignalHistory.signal_id.in_(signal_ids),
+        SignalHistory.signal_time.between(min(w[0] for w in windows), max(w[1] for w in windows)),
+    )
+
+
+def sum_daily_stats(rows, totals=None):
+    """
+    Gộp các dòng thống kê theo khóa DAILY_STATS_KEYS
+    
+    Returns:
+        dict: khóa -> dict (khóa + tổng các cột DAILY_STATS_COUNTERS)
+    """
+    totals = {} if totals is None else totals
+    for row in rows:
+        key = tuple(row[k] for k in DAILY_STATS_KEYS)
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = dict(zip(DAILY_STATS_KEYS, key), **{name: 0 for name in DAILY_STATS_COUNTERS})
+        for name in DAILY_STATS_COUNTERS:
+            total[name] += row.get(name, 0)
+    return totals
+
+
+def to_utc(value):
+    """Epoch (giây) hoặc datetime có múi giờ -> datetime UTC không múi giờ (như cột DateTime)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class DatabaseManager:
     """
     Lớp quản lý database
+    
+    Mỗi thao tác dùng một session ngắn hạn (mở -> commit/rollback -> đóng) nên
+    object ORM không tích lũy trong identity map khi bot chạy nhiều tuần.
+    Các truy vấn chỉ đọc/kiểm tra tồn tại dùng SQLAlchemy Core, không tạo object ORM.
     """
     
     def __init__(self, database_url=None):
@@ -62,10 +324,71 @@ class DatabaseManager:
         if database_url.startswith('postgresql://'):
             database_url = database_url.replace('postgresql://', 'postgresql+psycopg://')
         
-        self.engine = create_engine(database_url)
+        self.engine = create_engine(database_url, pool_pre_ping=True)
+        existing_tables = set(inspect(self.engine).get_table_names())
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self._migrate()
+        self.partitioned = self._setup_partitions()
+        self.Session = sessionmaker(bind=self.engine)
+        
+        # Bảng thống kê mới tạo trên database đã có lịch sử -> dựng lại một lần
+        if 'signal_daily_stats' not in existing_tables and 'signal_history' in existing_tables:
+            self.rebuild_daily_stats()
+    
+    def _migrate(self):
+        """Thêm các cột/index mới vào bảng đã có từ phiên bản trước"""
+        columns = {c['name'] for c in inspect(self.engine).get_columns('signal_history')}
+        missing = [name for name in SIGNAL_HISTORY_MIGRATIONS if name not in columns]
+        with self.engine.begin() as conn:
+            for name in missing:
+                conn.execute(text(f"ALTER TABLE signal_history ADD COLUMN {name} {SIGNAL_HISTORY_MIGRATIONS[name]}"))
+            
+            # Điền cột số từ cột chuỗi cho các dòng cũ
+            backfill = [name for name in NUMERIC_BACKFILL if name in missing]
+            if backfill:
+                assignments = ', '.join(f"{name} = CAST({NUMERIC_BACKFILL[name]} AS DOUBLE PRECISION)" for name in backfill)
+                updated = conn.execute(text(f"UPDATE signal_history SET {assignments}")).rowcount
+                if updated:
+                    print(f"✅ Đã điền cột số cho {updated} tín hiệu cũ")
+            
+            signal_archive.create_indexes(conn)
+    
+    def _setup_partitions(self):
+        """
+        PostgreSQL: chuyển signal_history sang bảng partition theo tháng (lần đầu)
+        và tạo sẵn partition cho các tháng tới
+        
+        Returns:
+            bool: True nếu signal_history là bảng partition
+        """
+        if self.engine.dialect.name != 'postgresql' or not config.SIGNAL_PARTITIONING_ENABLED:
+            return False
+        
+        with self.engine.connect() as conn:
+            partitioned = signal_archive.is_partitioned(conn)
+        if not partitioned:
+            moved = signal_archive.partition_table(self.engine, SignalHistory.__table__)
+            print(f"✅ Đã chuyển signal_history sang bảng partition theo tháng ({moved} tín hiệu)")
+        
+        with self.engine.begin() as conn:
+            signal_archive.ensure_partitions(conn)
+        return True
+    
+    def _upsert_insert(self):
+        """insert() có ON CONFLICT của PostgreSQL/SQLite (None với database khác)"""
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            upsert = None
+        return upsert
+    
+    def _exists(self, *criteria):
+        """SELECT 1 ... LIMIT 1 (không tạo object ORM)"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(literal(1)).where(*criteria).limit(1)).first() is not None
     
     def add_symbol(self, symbol):
         """
@@ -78,32 +401,26 @@ class DatabaseManager:
             tuple: (success, message)
         """
         try:
-            # Chuẩn hóa symbol
-            symbol = symbol.upper().replace('/', '')
-            if not symbol.endswith('USDT'):
-                symbol = symbol + 'USDT'
-            
-            # Kiểm tra đã tồn tại chưa
-            existing = self.session.query(WatchlistSymbol).filter_by(symbol=symbol).first()
-            
-            if existing:
-                if existing.is_active:
-                    return False, f"❌ {symbol} đã có trong danh sách theo dõi"
-                else:
-                    # Kích hoạt lại
-                    existing.is_active = True
-                    self.session.commit()
-                    return True, f"✅ Đã kích hoạt lại {symbol}"
+            symbol = normalize_symbol(symbol)
             
-            # Thêm mới
-            new_symbol = WatchlistSymbol(symbol=symbol)
-            self.session.add(new_symbol)
-            self.session.commit()
+            with self.Session.begin() as session:
+                # Kiểm tra đã tồn tại chưa
+                existing = session.query(WatchlistSymbol).filter_by(symbol=symbol).first()
+                
+                if existing:
+                    if existing.is_active:
+                        return False, f"❌ {symbol} đã có trong danh sách theo dõi"
+                    else:
+                        # Kích hoạt lại
+                        existing.is_active = True
+                        return True, f"✅ Đã kích hoạt lại {symbol}"
+                
+                # Thêm mới
+                session.add(WatchlistSymbol(symbol=symbol))
             
             return True, f"✅ Đã thêm {symbol} vào danh sách theo dõi"
             
         except Exception as e:
-            self.session.rollback()
             return False, f"❌ Lỗi: {str(e)}"
     
     def remove_symbol(self, symbol):
@@ -117,25 +434,22 @@ class DatabaseManager:
             tuple: (success, message)
         """
         try:
-            # Chuẩn hóa symbol
-            symbol = symbol.upper().replace('/', '')
-            if not symbol.endswith('USDT'):
-                symbol = symbol + 'USDT'
+            symbol = normalize_symbol(symbol)
             
-            # Tìm symbol
-            existing = self.session.query(WatchlistSymbol).filter_by(symbol=symbol).first()
+            # Đánh dấu không active (soft delete)
+            with self.engine.begin() as conn:
+                removed = conn.execute(
+                    update(WatchlistSymbol)
+                    .where(WatchlistSymbol.symbol == symbol, WatchlistSymbol.is_active.is_(True))
+                    .values(is_active=False)
+                ).rowcount
             
-            if not existing or not existing.is_active:
+            if not removed:
                 return False, f"❌ {symbol} không có trong danh sách theo dõi"
             
-            # Đánh dấu không active (soft delete)
-            existing.is_active = False
-            self.session.commit()
-            
             return True, f"✅ Đã xóa {symbol} khỏi danh sách theo dõi"
             
         except Exception as e:
-            self.session.rollback()
             return False, f"❌ Lỗi: {str(e)}"
     
     def get_active_symbols(self):
@@ -146,10 +460,11 @@ class DatabaseManager:
             list: Danh sách symbol
         """
         try:
-            symbols = self.session.query(WatchlistSymbol).filter_by(is_active=True).all()
-            return [s.symbol for s in symbols]
+            with self.engine.connect() as conn:
+                return list(conn.execute(
+                    select(WatchlistSymbol.symbol).where(WatchlistSymbol.is_active.is_(True))
+                ).scalars())
         except Exception as e:
-            self.session.rollback()
             print(f"Lỗi khi lấy danh sách symbol: {str(e)}")
             return []
     
@@ -161,16 +476,249 @@ class DatabaseManager:
             list: Danh sách dict chứa thông tin symbol
         """
         try:
-            symbols = self.session.query(WatchlistSymbol).filter_by(is_active=True).order_by(WatchlistSymbol.added_at).all()
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(WatchlistSymbol.symbol, WatchlistSymbol.added_at)
+                    .where(WatchlistSymbol.is_active.is_(True))
+                    .order_by(WatchlistSymbol.added_at)
+                ).all()
             return [{
-                'symbol': s.symbol,
-                'added_at': s.added_at
-            } for s in symbols]
+                'symbol': row.symbol,
+                'added_at': row.added_at
+            } for row in rows]
         except Exception as e:
-            self.session.rollback()
             print(f"Lỗi khi lấy thông tin watchlist: {str(e)}")
             return []
     
+    def add_subscription(self, chat_id, symbol):
+        """
+        Thêm symbol vào danh sách theo dõi của một chat
+        
+        Returns:
+            tuple: (success, message, symbol đã chuẩn hóa)
+        """
+        try:
+            symbol = normalize_symbol(symbol)
+            
+            with self.engine.begin() as conn:
+                count = conn.execute(
+                    select(func.count()).select_from(UserSubscription).where(UserSubscription.chat_id == chat_id)
+                ).scalar()
+                if count >= config.SUBSCRIPTION_MAX_SYMBOLS:
+                    return False, f"❌ Tối đa {config.SUBSCRIPTION_MAX_SYMBOLS} coin mỗi người", symbol
+                
+                conn.execute(insert(UserSubscription).values(chat_id=chat_id, symbol=symbol, added_at=datetime.utcnow()))
+            
+            return True, f"✅ Đã thêm {symbol} vào danh sách theo dõi của bạn", symbol
+            
+        except IntegrityError:
+            return False, f"❌ {symbol} đã có trong danh sách theo dõi của bạn", symbol
+        except Exception as e:
+            return False, f"❌ Lỗi: {str(e)}", symbol
+    
+    def remove_subscription(self, chat_id, symbol):
+        """
+        Xóa symbol khỏi danh sách theo dõi của một chat
+        
+        Returns:
+            tuple: (success, message, symbol đã chuẩn hóa)
+        """
+        try:
+            symbol = normalize_symbol(symbol)
+            
+            with self.engine.begin() as conn:
+                removed = conn.execute(delete(UserSubscription).where(
+                    UserSubscription.chat_id == chat_id, UserSubscription.symbol == symbol
+                )).rowcount
+            
+            if not removed:
+                return False, f"❌ {symbol} không có trong danh sách theo dõi của bạn", symbol
+            
+            return True, f"✅ Đã xóa {symbol} khỏi danh sách theo dõi của bạn", symbol
+            
+        except Exception as e:
+            return False, f"❌ Lỗi: {str(e)}", symbol
+    
+    def remove_chat(self, chat_id):
+        """Xóa mọi đăng ký và cảnh báo giá của một chat (người dùng đã chặn bot)"""
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(PriceAlert).where(PriceAlert.chat_id == chat_id))
+                return conn.execute(delete(UserSubscription).where(UserSubscription.chat_id == chat_id)).rowcount
+        except Exception as e:
+            print(f"Lỗi khi xóa đăng ký của chat {chat_id}: {str(e)}")
+            return 0
+    
+    def get_chat_subscriptions(self, chat_id):
+        """
+        Danh sách theo dõi của một chat
+        
+        Returns:
+            list: Danh sách dict {'symbol', 'added_at'}
+        """
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(UserSubscription.symbol, UserSubscription.added_at)
+                    .where(UserSubscription.chat_id == chat_id)
+                    .order_by(UserSubscription.added_at)
+                ).all()
+            return [{'symbol': row.symbol, 'added_at': row.added_at} for row in rows]
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách theo dõi của chat {chat_id}: {str(e)}")
+            return []
+    
+    def get_subscriptions(self, channel_id=None):
+        """
+        Mọi cặp (chat_id, symbol) nhận tín hiệu - để dựng chỉ mục symbol -> chat
+        
+        Args:
+            channel_id: Chat của channel, nhận các symbol active trong watchlist chung
+            
+        Returns:
+            list: [(chat_id, symbol)], None nếu lỗi (giữ nguyên chỉ mục cũ)
+        """
+        try:
+            with self.engine.connect() as conn:
+                pairs = [tuple(row) for row in conn.execute(
+                    select(UserSubscription.chat_id, UserSubscription.symbol)
+                )]
+                if channel_id is not None:
+                    pairs.extend((channel_id, symbol) for symbol in conn.execute(
+                        select(WatchlistSymbol.symbol).where(WatchlistSymbol.is_active.is_(True))
+                    ).scalars())
+            return pairs
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách đăng ký: {str(e)}")
+            return None
+    
+    def add_price_alert(self, chat_id, symbol, price_low, price_high, created_at=None, created_price=None):
+        """
+        Thêm cảnh báo giá cho một chat
+        
+        Args:
+            created_at: Thời điểm tạo (giờ server, mặc định giờ hiện tại)
+            created_price: Giá lúc tạo
+        
+        Returns:
+            tuple: (success, message, id cảnh báo hoặc None)
+        """
+        try:
+            with self.engine.begin() as conn:
+                count = conn.execute(
+                    select(func.count()).select_from(PriceAlert)
+                    .where(PriceAlert.chat_id == chat_id, PriceAlert.triggered_at.is_(None))
+                ).scalar()
+                if count >= config.ALERT_MAX_PER_CHAT:
+                    return False, f"❌ Tối đa {config.ALERT_MAX_PER_CHAT} cảnh báo đang chờ mỗi người", None
+                
+                alert_id = conn.execute(insert(PriceAlert).values(
+                    chat_id=chat_id, symbol=symbol, price_low=price_low, price_high=price_high,
+                    created_at=to_utc(created_at) or datetime.utcnow(), created_price=created_price
+                )).inserted_primary_key[0]
+            
+            return True, f"✅ Đã tạo cảnh báo #{alert_id} cho {symbol}", alert_id
+            
+        except Exception as e:
+            return False, f"❌ Lỗi: {str(e)}", None
+    
+    def remove_price_alert(self, chat_id, alert_id):
+        """
+        Xóa cảnh báo đang chờ của một chat
+        
+        Returns:
+            tuple: (success, message)
+        """
+        try:
+            with self.engine.begin() as conn:
+                removed = conn.execute(delete(PriceAlert).where(
+                    PriceAlert.id == alert_id, PriceAlert.chat_id == chat_id, PriceAlert.triggered_at.is_(None)
+                )).rowcount
+            
+            if not removed:
+                return False, f"❌ Không có cảnh báo #{alert_id} đang chờ"
+            
+            return True, f"✅ Đã xóa cảnh báo #{alert_id}"
+            
+        except Exception as e:
+            return False, f"❌ Lỗi: {str(e)}"
+    
+    def get_chat_alerts(self, chat_id):
+        """
+        Cảnh báo đang chờ của một chat
+        
+        Returns:
+            list: Danh sách dict {'id', 'symbol', 'price_low', 'price_high', 'created_at'}
+        """
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(PriceAlert.id, PriceAlert.symbol, PriceAlert.price_low, PriceAlert.price_high, PriceAlert.created_at)
+                    .where(PriceAlert.chat_id == chat_id, PriceAlert.triggered_at.is_(None))
+                    .order_by(PriceAlert.id)
+                ).all()
+            return [dict(row._mapping) for row in rows]
+        except Exception as e:
+            print(f"Lỗi khi lấy cảnh báo giá của chat {chat_id}: {str(e)}")
+            return []
+    
+    def get_active_alerts(self):
+        """
+        Mọi cảnh báo đang chờ - để dựng chỉ mục ngưỡng giá
+        
+        Returns:
+            list: [(id, chat_id, symbol, price_low, price_high, created_at, created_price)],
+                  None nếu lỗi (giữ nguyên chỉ mục cũ)
+        """
+        try:
+            with self.engine.connect() as conn:
+                return [tuple(row) for row in conn.execute(
+                    select(PriceAlert.id, PriceAlert.chat_id, PriceAlert.symbol, PriceAlert.price_low,
+                           PriceAlert.price_high, PriceAlert.created_at, PriceAlert.created_price)
+                    .where(PriceAlert.triggered_at.is_(None))
+                )]
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách cảnh báo giá: {str(e)}")
+            return None
+    
+    def mark_alerts_triggered(self, hits):
+        """
+        Đánh dấu các cảnh báo đã kích hoạt: [(id, giá kích hoạt)]
+        
+        Chỉ cập nhật dòng còn chờ nên mỗi cảnh báo chỉ được gửi một lần
+        (kể cả khi nhiều worker cùng thấy).
+        
+        Returns:
+            set: id các cảnh báo vừa đánh dấu (cần gửi)
+        """
+        if not hits:
+            return set()
+        try:
+            marked = set()
+            prices = dict(hits)
+            ids = list(prices)
+            now = datetime.utcnow()
+            with self.engine.begin() as conn:
+                # Giành các cảnh báo còn chờ (UPDATE ... RETURNING), mỗi lần tối đa 5000 id
+                for start in range(0, len(ids), 5000):
+                    marked.update(conn.execute(
+                        update(PriceAlert)
+                        .where(PriceAlert.id.in_(ids[start:start + 5000]), PriceAlert.triggered_at.is_(None))
+                        .values(triggered_at=now)
+                        .returning(PriceAlert.id)
+                    ).scalars())
+                if marked:
+                    conn.execute(
+                        update(PriceAlert.__table__)
+                        .where(PriceAlert.__table__.c.id == bindparam('alert_id'))
+                        .values(triggered_price=bindparam('price')),
+                        [{'alert_id': alert_id, 'price': prices[alert_id]} for alert_id in marked]
+                    )
+            return marked
+        except Exception as e:
+            print(f"Lỗi khi đánh dấu cảnh báo giá: {str(e)}")
+            return set()
+    
     def save_signal(self, signal_id, symbol, signal_type, signal_time, price, stoch_m15, stoch_h1):
         """
         Lưu lịch sử tín hiệu
@@ -186,8 +734,7 @@ class DatabaseManager:
         """
         try:
             # Kiểm tra đã tồn tại chưa
-            existing = self.session.query(SignalHistory).filter_by(signal_id=signal_id).first()
-            if existing:
+            if self._exists(signal_filter([signal_id])):
                 print(f"⚠️ Signal {signal_id} đã tồn tại, bỏ qua")
                 return False
             
@@ -195,26 +742,293 @@ class DatabaseManager:
             stoch_m15_str = f"{float(stoch_m15):.2f}"
             stoch_h1_str = f"{float(stoch_h1):.2f}"
             
-            signal = SignalHistory(
-                signal_id=signal_id,
-                symbol=symbol,
-                signal_type=signal_type,
-                signal_time=signal_time,
-                price=str(price),
-                stoch_m15=stoch_m15_str,
-                stoch_h1=stoch_h1_str
-            )
-            self.session.add(signal)
-            self.session.commit()
+            with self.engine.begin() as conn:
+                conn.execute(insert(SignalHistory).values(
+                    signal_id=signal_id,
+                    symbol=symbol,
+                    signal_type=signal_type,
+                    signal_time=signal_time,
+                    price=str(price),
+                    stoch_m15=stoch_m15_str,
+                    stoch_h1=stoch_h1_str,
+                    price_value=float(price),
+                    stoch_m15_value=float(stoch_m15),
+                    stoch_h1_value=float(stoch_h1),
+                    sent_at=datetime.utcnow()
+                ))
             print(f"✅ Đã lưu signal {signal_id} vào database")
             return True
         except Exception as e:
-            self.session.rollback()
             print(f"❌ LỖI KHI LƯU SIGNAL {signal_id}: {str(e)}")
             import traceback
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def _signal_values(signal):
+        """Giá trị dòng signal_history (trạng thái 'pending') của tín hiệu từ scanner"""
+        return {
+            'signal_id': signal['signal_id'],
+            'symbol': signal['symbol'],
+            'signal_type': signal['signal_type'],
+            'signal_time': signal['signal_time'],
+            'price': str(signal['price']),
+            'stoch_m15': f"{float(signal['stoch_d_m15']):.2f}",
+            'stoch_h1': f"{float(signal['stoch_d_h1']):.2f}",
+            'price_value': float(signal['price']),
+            'stoch_m15_value': float(signal['stoch_d_m15']),
+            'stoch_h1_value': float(signal['stoch_d_h1']),
+            'timeframes': signal.get('timeframes'),
+            'sent_at': datetime.utcnow(),
+            'status': 'pending',
+            'confirm_time': to_utc(signal.get('confirm_time')),
+            'candle_close_at': to_utc(signal.get('candle_close_at')),
+            'data_received_at': to_utc(signal.get('data_received_at')),
+            'decided_at': to_utc(signal.get('decided_at')),
+        }
+    
+    def enqueue_signals(self, signals):
+        """
+        Giành quyền gửi và ghi outbox cho các tín hiệu của một lần quét - một transaction
+        
+        signal_history: INSERT ... ON CONFLICT DO NOTHING RETURNING, chỉ
+        signal_id chưa có (chưa worker/lần quét nào giành) được ghi vào
+        signal_outbox nên tín hiệu không bị gửi trùng.
+        
+        Args:
+            signals: [(tín hiệu từ scanner, nội dung tin nhắn)]
+            
+        Returns:
+            list: signal_id đã giành được (đã vào outbox)
+        """
+        # Trùng signal_id trong cùng lần quét -> giữ tín hiệu đầu tiên
+        messages = {}
+        values = []
+        for signal, message in signals:
+            if signal['signal_id'] not in messages:
+                messages[signal['signal_id']] = (signal['symbol'], message)
+                values.append(self._signal_values(signal))
+        if not values:
+            return []
+        
+        try:
+            upsert = self._upsert_insert()
+            with self.engine.begin() as conn:
+                if upsert is not None:
+                    claimed = list(conn.execute(upsert(SignalHistory).values(values).on_conflict_do_nothing(
+                        # Bảng partition: khóa unique phải chứa cột partition
+                        index_elements=['signal_id', 'signal_time'] if self.partitioned else ['signal_id']
+                    ).returning(SignalHistory.signal_id)).scalars())
+                else:
+                    claimed = []
+                    for row in values:
+                        try:
+                            with conn.begin_nested():
+                                conn.execute(insert(SignalHistory).values(**row))
+                            claimed.append(row['signal_id'])
+                        except IntegrityError:
+                            pass
+                
+                if claimed:
+                    now = datetime.utcnow()
+                    conn.execute(insert(SignalOutbox), [{
+                        'signal_id': signal_id, 'symbol': messages[signal_id][0], 'text': messages[signal_id][1],
+                        'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now,
+                    } for signal_id in claimed])
+            return claimed
+        except Exception as e:
+            print(f"❌ LỖI KHI GHI OUTBOX {len(values)} TÍN HIỆU: {str(e)}")
+            return []
+    
+    def get_due_outbox(self, limit, worker_id):
+        """
+        Giành các tín hiệu trong outbox đến hạn gửi (cũ trước), kèm mốc độ trễ từ signal_history
+        
+        Giành bằng một câu UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP
+        LOCKED) RETURNING: các worker đọc outbox cùng lúc nhận các dòng khác
+        nhau. Dòng 'sending' quá OUTBOX_CLAIM_TIMEOUT giây (worker giành đã
+        chết/treo) được giành lại.
+        
+        Args:
+            worker_id: ID worker giành (ghi vào claimed_by)
+        
+        Returns:
+            list: dict (id, signal_id, symbol, text, attempts, candle_close_at, data_received_at, decided_at)
+        """
+        try:
+            now = datetime.utcnow()
+            due = select(SignalOutbox.id).where(or_(
+                and_(SignalOutbox.status == 'pending', SignalOutbox.next_attempt_at <= now),
+                and_(SignalOutbox.status == 'sending',
+                     SignalOutbox.claimed_at < now - timedelta(seconds=config.OUTBOX_CLAIM_TIMEOUT)),
+            )).order_by(SignalOutbox.id).limit(limit).with_for_update(skip_locked=True)
+            
+            with self.engine.begin() as conn:
+                claimed = conn.execute(
+                    update(SignalOutbox).where(SignalOutbox.id.in_(due)).values(
+                        status='sending', claimed_by=worker_id, claimed_at=now
+                    ).returning(
+                        SignalOutbox.id, SignalOutbox.signal_id, SignalOutbox.symbol,
+                        SignalOutbox.text, SignalOutbox.attempts,
+                    )
+                ).all()
+            if not claimed:
+                return []
+            
+            with self.engine.connect() as conn:
+                timings = {row.signal_id: row for row in conn.execute(
+                    select(SignalHistory.signal_id, SignalHistory.candle_close_at,
+                           SignalHistory.data_received_at, SignalHistory.decided_at)
+                    .where(signal_filter([row.signal_id for row in claimed]))
+                )}
+            rows = []
+            for row in sorted(claimed, key=lambda row: row.id):
+                timing = timings.get(row.signal_id)
+                rows.append({
+                    **row._mapping,
+                    'candle_close_at': timing.candle_close_at if timing else None,
+                    'data_received_at': timing.data_received_at if timing else None,
+                    'decided_at': timing.decided_at if timing else None,
+                })
+            return rows
+        except Exception as e:
+            print(f"Lỗi khi đọc outbox: {str(e)}")
+            return []
+    
+    def mark_outbox_delivered(self, outbox_id, signal_id, worker_id, acked_at=None, latency_ms=None):
+        """
+        Đánh dấu tín hiệu trong outbox đã gửi (và signal_history 'sent') - một transaction
+        
+        Returns:
+            bool: True nếu đã đánh dấu, False nếu lỗi hoặc worker không còn giữ dòng này
+        """
+        try:
+            with self.engine.begin() as conn:
+                return self._mark_outbox_delivered(conn, outbox_id, signal_id, worker_id, acked_at, latency_ms)
+        except Exception as e:
+            print(f"Lỗi khi đánh dấu outbox {signal_id} đã gửi: {str(e)}")
+            return False
+    
+    def _mark_outbox_delivered(self, conn, outbox_id, signal_id, worker_id, acked_at=None, latency_ms=None):
+        """Chỉ đánh dấu khi worker còn giữ dòng (chưa bị giành lại) - không cộng thống kê 2 lần"""
+        marked = conn.execute(update(SignalOutbox).where(
+            SignalOutbox.id == outbox_id, SignalOutbox.status == 'sending', SignalOutbox.claimed_by == worker_id,
+        ).values(
+            status='delivered', delivered_at=datetime.utcnow(), last_error=None, claimed_by=None, claimed_at=None
+        )).rowcount == 1
+        if marked:
+            self._mark_sent(conn, signal_id, acked_at, latency_ms)
+        return marked
+    
+    def refresh_outbox_claims(self, outbox_ids, worker_id):
+        """Gia hạn quyền gửi các dòng worker đang giữ (chờ gửi tin tới người dùng lâu hơn OUTBOX_CLAIM_TIMEOUT)"""
+        if not outbox_ids:
+            return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(update(SignalOutbox).where(
+                    SignalOutbox.id.in_(outbox_ids), SignalOutbox.status == 'sending',
+                    SignalOutbox.claimed_by == worker_id,
+                ).values(claimed_at=datetime.utcnow()))
+        except Exception as e:
+            print(f"Lỗi khi gia hạn outbox: {str(e)}")
+    
+    def retry_outbox(self, outbox_id, attempts, error, worker_id):
+        """
+        Gửi lỗi -> hẹn lần thử sau (backoff nhân đôi), hết OUTBOX_MAX_ATTEMPTS -> 'failed'
+        
+        Chỉ cập nhật khi worker còn giữ dòng (không trả về 'pending' dòng worker khác đang gửi).
+        
+        Returns:
+            bool: True nếu còn thử lại
+        """
+        retry = attempts < config.OUTBOX_MAX_ATTEMPTS
+        delay = min(config.OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1), config.OUTBOX_RETRY_MAX_DELAY)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(update(SignalOutbox).where(
+                    SignalOutbox.id == outbox_id, SignalOutbox.status == 'sending', SignalOutbox.claimed_by == worker_id,
+                ).values(
+                    status='pending' if retry else 'failed', attempts=attempts, last_error=str(error)[:200],
+                    next_attempt_at=datetime.utcnow() + timedelta(seconds=delay), claimed_by=None, claimed_at=None,
+                ))
+        except Exception as e:
+            print(f"Lỗi khi cập nhật outbox {outbox_id}: {str(e)}")
+        return retry
+    
+    def outbox_status(self):
+        """
+        Returns:
+            dict: trạng thái -> số tín hiệu trong outbox
+        """
+        try:
+            with self.engine.connect() as conn:
+                return dict(conn.execute(
+                    select(SignalOutbox.status, func.count()).group_by(SignalOutbox.status)
+                ).all())
+        except Exception as e:
+            print(f"Lỗi khi đếm outbox: {str(e)}")
+            return {}
+    
+    def purge_outbox(self, days=None):
+        """Xóa các dòng outbox đã gửi quá OUTBOX_RETENTION_DAYS ngày"""
+        days = config.OUTBOX_RETENTION_DAYS if days is None else days
+        try:
+            with self.engine.begin() as conn:
+                return conn.execute(delete(SignalOutbox).where(
+                    SignalOutbox.status == 'delivered',
+                    SignalOutbox.delivered_at < datetime.utcnow() - timedelta(days=days),
+                )).rowcount
+        except Exception as e:
+            print(f"Lỗi khi dọn outbox: {str(e)}")
+            return 0
+    
+    def purge_price_alerts(self, days=None):
+        """Xóa các cảnh báo giá đã kích hoạt quá ALERT_RETENTION_DAYS ngày"""
+        days = config.ALERT_RETENTION_DAYS if days is None else days
+        try:
+            with self.engine.begin() as conn:
+                return conn.execute(delete(PriceAlert).where(
+                    PriceAlert.triggered_at < datetime.utcnow() - timedelta(days=days)
+                )).rowcount
+        except Exception as e:
+            print(f"Lỗi khi dọn cảnh báo giá: {str(e)}")
+            return 0
+    
+    def _mark_sent(self, conn, signal_id, acked_at, latency_ms):
+        """Cập nhật signal_history 'sent' và cộng thống kê ngày"""
+        conn.execute(
+            update(SignalHistory).where(signal_filter([signal_id])).values(
+                status='sent', sent_at=datetime.utcnow(),
+                acked_at=to_utc(acked_at), latency_ms=latency_ms
+            )
+        )
+        row = conn.execute(
+            select(SignalHistory.symbol, SignalHistory.signal_type, SignalHistory.timeframes)
+            .where(signal_filter([signal_id]))
+        ).first()
+        if row is not None:
+            self._add_daily_stats(conn, [{
+                'day': signal_day(signal_id), 'symbol': row.symbol, 'signal_type': row.signal_type,
+                'timeframes': row.timeframes or '', 'signals': 1,
+            }])
+    
+    def mark_signal_sent(self, signal_id, acked_at=None, latency_ms=None):
+        """
+        Đánh dấu tín hiệu đã gửi thành công
+        
+        Args:
+            acked_at: Thời điểm Telegram xác nhận (epoch giây, giờ server)
+            latency_ms: Độ trễ từ đóng nến đến khi Telegram xác nhận
+        """
+        try:
+            with self.engine.begin() as conn:
+                self._mark_sent(conn, signal_id, acked_at, latency_ms)
+            return True
+        except Exception as e:
+            print(f"Lỗi khi cập nhật trạng thái signal {signal_id}: {str(e)}")
+            return False
+    
     def check_signal_exists(self, signal_id):
         """
         Kiểm tra xem signal_id đã tồn tại chưa
@@ -226,13 +1040,342 @@ class DatabaseManager:
             bool: True nếu đã tồn tại, False nếu chưa
         """
         try:
-            existing = self.session.query(SignalHistory).filter_by(signal_id=signal_id).first()
-            return existing is not None
+            return self._exists(signal_filter([signal_id]))
         except Exception as e:
-            self.session.rollback()
             print(f"Lỗi khi kiểm tra signal: {str(e)}")
             return False
     
+    def get_recent_latencies(self, limit):
+        """
+        Mốc thời gian của các tín hiệu đã gửi gần nhất (để khôi phục thống kê độ trễ)
+        
+        Returns:
+            list: [(candle_close_at, data_received_at, decided_at, acked_at)], cũ trước
+        """
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(
+                        SignalHistory.candle_close_at, SignalHistory.data_received_at,
+                        SignalHistory.decided_at, SignalHistory.acked_at
+                    ).where(
+                        SignalHistory.status == 'sent',
+                        SignalHistory.acked_at.isnot(None),
+                        SignalHistory.candle_close_at.isnot(None),
+                    ).order_by(SignalHistory.acked_at.desc()).limit(limit)
+                ).all()
+            return [tuple(row) for row in reversed(rows)]
+        except Exception as e:
+            print(f"Lỗi khi lấy độ trễ tín hiệu: {str(e)}")
+            return []
+    
+    def get_unevaluated_signals(self, horizon, sent_before, limit):
+        """
+        Tín hiệu đã gửi chưa có kết quả ở mốc horizon (cũ trước)
+        
+        Args:
+            horizon: Mốc dài nhất - đã có kết quả mốc này thì không cần đánh giá lại
+            sent_before: Chỉ lấy tín hiệu gửi trước thời điểm này (UTC)
+            limit: Số tín hiệu tối đa
+        
+        Returns:
+            list: [(signal_id, signal_type, candle_close_at, decided_at)]
+        """
+        try:
+            evaluated = select(literal(1)).where(
+                SignalOutcome.signal_id == SignalHistory.signal_id, SignalOutcome.horizon == horizon
+            ).exists()
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(SignalHistory.signal_id, SignalHistory.signal_type,
+                           SignalHistory.candle_close_at, SignalHistory.decided_at)
+                    .where(SignalHistory.status == 'sent', SignalHistory.sent_at < sent_before, ~evaluated)
+                    .order_by(SignalHistory.sent_at).limit(limit)
+                ).all()
+            return [tuple(row) for row in rows]
+        except Exception as e:
+            print(f"Lỗi khi lấy tín hiệu chưa đánh giá: {str(e)}")
+            return []
+    
+    def upsert_outcomes(self, rows):
+        """
+        Ghi kết quả tín hiệu (một lệnh INSERT ... ON CONFLICT DO UPDATE cho mọi dòng)
+        
+        Args:
+            rows: list dict theo cột của SignalOutcome
+        
+        Returns:
+            int: Số dòng đã ghi
+        """
+        if not rows:
+            return 0
+        try:
+            upsert = self._upsert_insert()
+            with self.engine.begin() as conn:
+                self._add_outcome_stats(conn, rows)
+                if upsert is not None:
+                    stmt = upsert(SignalOutcome)
+                    keys = ('signal_id', 'horizon')
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=list(keys),
+                        set_={name: stmt.excluded[name] for name in rows[0] if name not in keys}
+                    )
+                    conn.execute(stmt, rows)
+                else:
+                    for row in rows:
+                        conn.execute(delete(SignalOutcome).where(
+                            SignalOutcome.signal_id == row['signal_id'], SignalOutcome.horizon == row['horizon']
+                        ))
+                    conn.execute(insert(SignalOutcome), rows)
+            return len(rows)
+        except Exception as e:
+            print(f"Lỗi khi ghi kết quả tín hiệu: {str(e)}")
+            return 0
+    
+    def _add_outcome_stats(self, conn, rows):
+        """Cộng kết quả mốc STATS_HORIZON chưa được tính vào thống kê ngày (gọi trước khi upsert)"""
+        rows = [row for row in rows if row['horizon'] == config.STATS_HORIZON and row['result'] != 'invalid']
+        if not rows:
+            return
+        
+        ids = [row['signal_id'] for row in rows]
+        counted = set(conn.execute(
+            select(SignalOutcome.signal_id)
+            .where(SignalOutcome.horizon == config.STATS_HORIZON, SignalOutcome.signal_id.in_(ids))
+        ).scalars())
+        timeframes = dict(conn.execute(
+            select(SignalHistory.signal_id, SignalHistory.timeframes).where(signal_filter(ids))
+        ).all())
+        
+        self._add_daily_stats(conn, [{
+            'day': signal_day(row['signal_id']), 'symbol': row['symbol'], 'signal_type': row['signal_type'],
+            'timeframes': timeframes.get(row['signal_id']) or '',
+            'evaluated': 1, 'wins': int(row['result'] == 'tp'), 'losses': int(row['result'] == 'sl'),
+            'return_sum': row['return_pct'], 'mfe_sum': row['mfe_pct'], 'mae_sum': row['mae_pct'],
+        } for row in rows if row['signal_id'] not in counted])
+    
+    def _add_daily_stats(self, conn, rows, totals=None):
+        """
+        Cộng dồn vào signal_daily_stats (INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x)
+        
+        Args:
+            rows: list dict gồm khóa (day, symbol, signal_type, timeframes) và các cột cần cộng
+            totals: Tổng đã gộp sẵn theo khóa (từ sum_daily_stats)
+        """
+        totals = sum_daily_stats(rows, totals)
+        if not totals:
+            return
+        
+        keys = DAILY_STATS_KEYS
+        table = SignalDailyStats.__table__
+        upsert = self._upsert_insert()
+        if upsert is not None:
+            stmt = upsert(SignalDailyStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={name: table.c[name] + stmt.excluded[name] for name in DAILY_STATS_COUNTERS}
+            )
+            conn.execute(stmt, list(totals.values()))
+            return
+        
+        for total in totals.values():
+            match = [table.c[k] == total[k] for k in keys]
+            updated = conn.execute(update(table).where(*match).values(
+                {name: table.c[name] + total[name] for name in DAILY_STATS_COUNTERS}
+            )).rowcount
+            if not updated:
+                conn.execute(insert(table).values(**total))
+    
+    def rebuild_daily_stats(self):
+        """Dựng lại signal_daily_stats từ signal_history và signal_outcomes (chạy một lần khi nâng cấp)"""
+        try:
+            outcome = SignalOutcome.__table__
+            query = select(
+                SignalHistory.signal_id, SignalHistory.symbol, SignalHistory.signal_type, SignalHistory.timeframes,
+                outcome.c.result, outcome.c.return_pct, outcome.c.mfe_pct, outcome.c.mae_pct
+            ).outerjoin(outcome, (outcome.c.signal_id == SignalHistory.signal_id) &
+                        (outcome.c.horizon == config.STATS_HORIZON)).where(SignalHistory.status == 'sent')
+            
+            # Gộp theo khóa trong lúc đọc (bộ nhớ theo số ngày x symbol, không theo số tín hiệu)
+            totals = {}
+            count = 0
+            with self.engine.connect() as conn:
+                for row in conn.execution_options(stream_results=True, yield_per=10000).execute(query):
+                    stats = {
+                        'day': signal_day(row.signal_id), 'symbol': row.symbol, 'signal_type': row.signal_type,
+                        'timeframes': row.timeframes or '', 'signals': 1,
+                    }
+                    if row.result not in (None, 'invalid'):
+                        stats.update(evaluated=1, wins=int(row.result == 'tp'), losses=int(row.result == 'sl'),
+                                     return_sum=row.return_pct, mfe_sum=row.mfe_pct, mae_sum=row.mae_pct)
+                    sum_daily_stats([stats], totals)
+                    count += 1
+            
+            with self.engine.begin() as conn:
+                conn.execute(delete(SignalDailyStats))
+                self._add_daily_stats(conn, [], totals)
+            print(f"✅ Đã dựng thống kê ngày từ {count} tín hiệu")
+        except Exception as e:
+            print(f"Lỗi khi dựng thống kê ngày: {str(e)}")
+    
+    def get_signal_stats(self, symbol=None, days=30):
+        """
+        Thống kê tín hiệu trong days ngày gần nhất (đọc từ signal_daily_stats)
+        
+        Args:
+            symbol: Lọc theo symbol (None = tất cả)
+            days: Số ngày (tính cả hôm nay, giờ VN)
+        
+        Returns:
+            list: dict theo (signal_type, timeframes) với các cột cộng dồn (None nếu lỗi)
+        """
+        try:
+            since = datetime.now(config.TIMEZONE).date() - timedelta(days=days - 1)
+            table = SignalDailyStats.__table__
+            query = select(
+                table.c.signal_type, table.c.timeframes,
+                *[func.sum(table.c[name]).label(name) for name in DAILY_STATS_COUNTERS]
+            ).where(table.c.day >= since).group_by(table.c.signal_type, table.c.timeframes)
+            if symbol:
+                query = query.where(table.c.symbol == symbol)
+            
+            with self.engine.connect() as conn:
+                return [dict(row._mapping) for row in conn.execute(query)]
+        except Exception as e:
+            print(f"Lỗi khi lấy thống kê tín hiệu: {str(e)}")
+            return None
+    
+    def save_pending_deliveries(self, items, delivered=(), worker_id=None):
+        """
+        Lưu các tin chưa gửi: [(chat_id, text, priority, attempts)]
+        
+        Args:
+            delivered: Các dòng outbox [(id, signal_id)] chỉ còn chờ các tin này -
+                đánh dấu đã gửi cùng transaction (tin đã nằm trong database)
+            worker_id: Worker đang giữ các dòng delivered
+        
+        Returns:
+            int: Số tin đã lưu
+        """
+        if not items and not delivered:
+            return 0
+        try:
+            now = datetime.utcnow()
+            with self.engine.begin() as conn:
+                if items:
+                    conn.execute(insert(PendingDelivery), [{
+                        'chat_id': str(chat_id), 'text': text, 'priority': priority,
+                        'attempts': attempts, 'created_at': now,
+                    } for chat_id, text, priority, attempts in items])
+                for outbox_id, signal_id in delivered:
+                    self._mark_outbox_delivered(conn, outbox_id, signal_id, worker_id)
+            return len(items)
+        except Exception as e:
+            print(f"Lỗi khi lưu tin chưa gửi: {str(e)}")
+            return 0
+    
+    def pop_pending_deliveries(self):
+        """
+        Lấy và xóa các tin chưa gửi (theo thứ tự đã lưu)
+        
+        Returns:
+            list: [(chat_id dạng chuỗi, text, priority, attempts)]
+        """
+        try:
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(PendingDelivery.id, PendingDelivery.chat_id, PendingDelivery.text,
+                           PendingDelivery.priority, PendingDelivery.attempts)
+                    .order_by(PendingDelivery.id)
+                ).all()
+                if rows:
+                    conn.execute(delete(PendingDelivery).where(PendingDelivery.id <= rows[-1].id))
+            return [(row.chat_id, row.text, row.priority, row.attempts) for row in rows]
+        except Exception as e:
+            print(f"Lỗi khi lấy tin chưa gửi: {str(e)}")
+            return []
+    
+    def heartbeat(self, worker_id, hostname=None):
+        """
+        Cập nhật heartbeat của worker
+        
+        Args:
+            worker_id: ID của worker
+            hostname: Tên máy chạy worker
+            
+        Returns:
+            bool: True nếu thành công
+        """
+        try:
+            with self.Session.begin() as session:
+                worker = session.get(WorkerHeartbeat, worker_id)
+                if worker is None:
+                    worker = WorkerHeartbeat(worker_id=worker_id, hostname=hostname)
+                    session.add(worker)
+                worker.last_seen = datetime.utcnow()
+            return True
+        except Exception as e:
+            print(f"Lỗi khi cập nhật heartbeat {worker_id}: {str(e)}")
+            return False
+    
+    def get_live_workers(self, ttl_seconds):
+        """
+        Lấy danh sách worker còn sống (heartbeat trong ttl_seconds giây)
+        
+        Returns:
+            list: worker_id đã sắp xếp (None nếu lỗi)
+        """
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+            with self.engine.connect() as conn:
+                workers = conn.execute(
+                    select(WorkerHeartbeat.worker_id).where(WorkerHeartbeat.last_seen >= cutoff)
+                ).scalars().all()
+            return sorted(workers)
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách worker: {str(e)}")
+            return None
+    
+    def remove_stale_workers(self, ttl_seconds):
+        """Xóa heartbeat của các worker đã chết"""
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+            with self.engine.begin() as conn:
+                return conn.execute(delete(WorkerHeartbeat).where(WorkerHeartbeat.last_seen < cutoff)).rowcount
+        except Exception as e:
+            print(f"Lỗi khi xóa worker cũ: {str(e)}")
+            return 0
+    
+    def remove_worker(self, worker_id):
+        """Xóa heartbeat của worker (khi dừng bình thường, để chia lại symbol ngay)"""
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(WorkerHeartbeat).where(WorkerHeartbeat.worker_id == worker_id))
+        except Exception as e:
+            print(f"Lỗi khi xóa worker {worker_id}: {str(e)}")
+    
+    def archive_old_signals(self):
+        """
+        Lưu trữ tín hiệu quá SIGNAL_RETENTION_MONTHS tháng ra file gzip và xóa khỏi database
+        
+        Returns:
+            int: Số tín hiệu đã lưu trữ
+        """
+        try:
+            cutoff = signal_archive.retention_cutoff()
+            if self.partitioned:
+                with self.engine.begin() as conn:
+                    signal_archive.ensure_partitions(conn)
+                return signal_archive.archive_partitions(self.engine, cutoff)
+            return signal_archive.archive_rows(self.engine, SignalHistory.__table__, cutoff)
+        except Exception as e:
+            print(f"Lỗi khi lưu trữ tín hiệu cũ: {str(e)}")
+            return 0
+    
+    def pool_status(self):
+        """Trạng thái connection pool (cho báo cáo bộ nhớ)"""
+        return self.engine.pool.status()
+    
     def close(self):
         """Đóng kết nối database"""
-        self.session.close()
\ No newline at end of file
+        self.engine.dispose()
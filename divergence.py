@@ -0,0 +1,199 @@
+"""
+Phát hiện phân kỳ giữa giá và CVD bằng pivot fractal
+
+Swing được xác định bằng pivot fractal trên giá (high cho đỉnh, low cho đáy),
+giá trị CVD của swing là CVD cao nhất/thấp nhất trong cửa sổ fractal quanh
+pivot. Mỗi swing được ghép với swing cùng loại gần nhất cách ít nhất
+CVD_MIN_SWING_DISTANCE nến:
+
+- Phân kỳ thường giảm (regular bearish): giá đỉnh cao hơn, CVD đỉnh thấp hơn
+- Phân kỳ ẩn giảm (hidden bearish): giá đỉnh thấp hơn, CVD đỉnh cao hơn
+- Phân kỳ thường tăng (regular bullish): giá đáy thấp hơn, CVD đáy cao hơn
+- Phân kỳ ẩn tăng (hidden bullish): giá đáy cao hơn, CVD đáy thấp hơn
+
+Tín hiệu được đánh dấu tại nến XÁC NHẬN pivot (pivot + fractal_period nến)
+nên không nhìn trước tương lai.
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from pivots import pivot_high_mask, pivot_low_mask
+
+DIVERGENCE_TYPES = ['regular_bullish', 'hidden_bullish', 'regular_bearish', 'hidden_bearish']
+
+
+def _pair_swings(pivot_idx, min_distance):
+    """Vị trí (trong pivot_idx) của swing ghép cặp với mỗi swing, -1 nếu không có"""
+    return np.searchsorted(pivot_idx, pivot_idx - min_distance, side='right') - 1
+
+
+def _classify(price_now, price_prev, cvd_now, cvd_prev, is_high):
+    """Phân loại phân kỳ giữa 2 swing cùng loại"""
+    if is_high:
+        regular = (price_now > price_prev) & (cvd_now < cvd_prev)
+        hidden = (price_now < price_prev) & (cvd_now > cvd_prev)
+    else:
+        regular = (price_now < price_prev) & (cvd_now > cvd_prev)
+        hidden = (price_now > price_prev) & (cvd_now < cvd_prev)
+    return regular, hidden
+
+
+class DivergenceDetector:
+    """
+    Phát hiện phân kỳ giá/CVD - bản vector hóa cho backtest
+    """
+    
+    def __init__(self, fractal_period=2, min_swing_distance=5):
+        """
+        Args:
+            fractal_period: Số nến mỗi bên của pivot fractal
+            min_swing_distance: Khoảng cách tối thiểu giữa 2 swing (số nến)
+        """
+        self.fractal_period = fractal_period
+        self.min_swing_distance = min_swing_distance
+    
+    def _cvd_extremes(self, cvd):
+        """CVD cao nhất/thấp nhất trong cửa sổ fractal quanh mỗi nến"""
+        window = 2 * self.fractal_period + 1
+        series = pd.Series(cvd)
+        cvd_max = series.rolling(window, center=True, min_periods=1).max().to_numpy()
+        cvd_min = series.rolling(window, center=True, min_periods=1).min().to_numpy()
+        return cvd_max, cvd_min
+    
+    def detect(self, df, cvd):
+        """
+        Tìm phân kỳ trên toàn bộ chuỗi
+        
+        Args:
+            df: DataFrame với cột ['high', 'low']
+            cvd: Series CVD cùng index với df
+        
+        Returns:
+            DataFrame: Các cột bool DIVERGENCE_TYPES, True tại nến xác nhận
+        """
+        n = len(df)
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        cvd_values = np.asarray(cvd, dtype=float)
+        cvd_max, cvd_min = self._cvd_extremes(cvd_values)
+        
+        result = {name: np.zeros(n, dtype=bool) for name in DIVERGENCE_TYPES}
+        
+        for is_high in (True, False):
+            if is_high:
+                mask = pivot_high_mask(high, self.fractal_period)
+                price, cvd_swing = high, cvd_max
+                regular_name, hidden_name = 'regular_bearish', 'hidden_bearish'
+            else:
+                mask = pivot_low_mask(low, self.fractal_period)
+                price, cvd_swing = low, cvd_min
+                regular_name, hidden_name = 'regular_bullish', 'hidden_bullish'
+            
+            pivot_idx = np.flatnonzero(mask)
+            partner = _pair_swings(pivot_idx, self.min_swing_distance)
+            has_partner = partner >= 0
+            
+            now_idx = pivot_idx[has_partner]
+            prev_idx = pivot_idx[partner[has_partner]]
+            
+            regular, hidden = _classify(
+                price[now_idx], price[prev_idx],
+                cvd_swing[now_idx], cvd_swing[prev_idx],
+                is_high
+            )
+            
+            confirm_idx = now_idx + self.fractal_period
+            result[regular_name][confirm_idx[regular]] = True
+            result[hidden_name][confirm_idx[hidden]] = True
+        
+        return pd.DataFrame(result, index=df.index)
+    
+    def create_tracker(self):
+        """Tạo bộ phát hiện phân kỳ từng nến (dùng cho quét live)"""
+        return DivergenceTracker(self.fractal_period, self.min_swing_distance)
+
+
+class DivergenceTracker:
+    """
+    Phát hiện phân kỳ theo từng nến đã đóng
+    
+    Chỉ giữ cửa sổ fractal và vài swing gần nhất nên chi phí mỗi nến là hằng
+    số. Dùng chung kernel pivot với DivergenceDetector nên cho kết quả giống
+    bản vector hóa trên cùng chuỗi nến.
+    """
+    
+    def __init__(self, fractal_period=2, min_swing_distance=5):
+        self.fractal_period = fractal_period
+        self.min_swing_distance = min_swing_distance
+        
+        window = 2 * fractal_period + 1
+        self.highs = deque(maxlen=window)
+        self.lows = deque(maxlen=window)
+        self.cvds = deque(maxlen=window)
+        
+        # Swing gần nhất: (vị trí nến, giá, CVD) - đủ để tìm swing cách >= min_swing_distance
+        self.swing_highs = deque(maxlen=min_swing_distance + 1)
+        self.swing_lows = deque(maxlen=min_swing_distance + 1)
+        
+        self.bar_count = 0
+        self.last_events = []
+    
+    def _check_swing(self, values, swings, price, cvd_swing, is_high):
+        mask_fn = pivot_high_mask if is_high else pivot_low_mask
+        if not mask_fn(np.fromiter(values, dtype=float), self.fractal_period)[self.fractal_period]:
+            return None
+        
+        pivot_pos = self.bar_count - 1 - self.fractal_period
+        
+        partner = None
+        for swing in reversed(swings):
+            if pivot_pos - swing[0] >= self.min_swing_distance:
+                partner = swing
+                break
+        
+        swings.append((pivot_pos, price, cvd_swing))
+        if partner is None:
+            return None
+        
+        regular, hidden = _classify(price, partner[1], cvd_swing, partner[2], is_high)
+        if regular:
+            return 'regular_bearish' if is_high else 'regular_bullish'
+        if hidden:
+            return 'hidden_bearish' if is_high else 'hidden_bullish'
+        return None
+    
+    def update(self, high, low, cvd):
+        """
+        Thêm một nến đã đóng
+        
+        Args:
+            high: Giá cao nhất của nến
+            low: Giá thấp nhất của nến
+            cvd: CVD của nến
+        
+        Returns:
+            list: Các loại phân kỳ được xác nhận tại nến này
+        """
+        self.highs.append(high)
+        self.lows.append(low)
+        self.cvds.append(cvd)
+        self.bar_count += 1
+        self.last_events = []
+        
+        if len(self.highs) < self.highs.maxlen:
+            return self.last_events
+        
+        center = self.fractal_period
+        for is_high in (True, False):
+            values = self.highs if is_high else self.lows
+            swings = self.swing_highs if is_high else self.swing_lows
+            cvd_swing = max(self.cvds) if is_high else min(self.cvds)
+            
+            event = self._check_swing(values, swings, values[center], cvd_swing, is_high)
+            if event:
+                self.last_events.append(event)
+        
+        return self.last_events
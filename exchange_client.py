@@ -0,0 +1,180 @@
+"""
+Kết nối Binance dùng chung cho bot và các script test
+
+- ccxt chỉ được import ở lần dùng đầu tiên (import ccxt mất ~0.4s)
+- Thông tin market (exchangeInfo) được cache ra file MARKETS_CACHE_PATH,
+  hết hạn sau MARKETS_CACHE_TTL giây, nên khởi động lại không phải tải lại
+- Mọi request đi qua WeightGovernor chung (thay cho enableRateLimit của ccxt)
+- Request klines của scanner đi qua HedgedFetcher (nhiều host, có dự phòng)
+- BINANCE_API_URL trỏ mọi request sang server khác (ví dụ fake_exchange.py)
+"""
+
+import json
+import os
+import threading
+import time
+
+import config
+from weight_governor import WeightGovernor, weight_for_url
+
+_exchange = None
+_governor = None
+_fetcher = None
+_lock = threading.RLock()
+
+
+def api_hosts():
+    """Các host API dùng để gọi REST (BINANCE_API_URL thay cho mọi host)"""
+    if config.BINANCE_API_URL:
+        return [url.strip() for url in config.BINANCE_API_URL.split(',') if url.strip()]
+    return list(config.BINANCE_API_HOSTS)
+
+
+def use_host(exchange, host):
+    """
+    Trỏ các URL api.binance.com của exchange ccxt sang host khác
+    
+    Args:
+        host: Tên host (api1.binance.com) hoặc URL đầy đủ (http://127.0.0.1:8900)
+    """
+    base = host.rstrip('/') if '://' in host else f"https://{host}"
+    exchange.urls['api'] = {
+        key: url.replace('https://api.binance.com', base)
+        for key, url in exchange.urls['api'].items()
+    }
+    return exchange
+
+
+def get_governor():
+    """WeightGovernor dùng chung của process"""
+    global _governor
+    if _governor is None:
+        with _lock:
+            if _governor is None:
+                _governor = WeightGovernor(shared_name=config.BINANCE_WEIGHT_SHARED_NAME)
+    return _governor
+
+
+def get_fetcher():
+    """
+    HedgedFetcher dùng chung của process
+    
+    Returns:
+        HedgedFetcher, None nếu tắt HEDGE_ENABLED
+    """
+    global _fetcher
+    if _fetcher is None and config.HEDGE_ENABLED:
+        with _lock:
+            if _fetcher is None:
+                from hedged_fetch import HedgedFetcher
+                _fetcher = HedgedFetcher(hosts=api_hosts(), governor=get_governor())
+    return _fetcher
+
+
+def govern(exchange, governor=None):
+    """
+    Cho mọi request của exchange ccxt đi qua WeightGovernor
+    
+    Returns:
+        exchange (đã gắn governor)
+    """
+    governor = governor or get_governor()
+    raw_fetch = exchange.fetch
+    
+    def fetch(url, method='GET', headers=None, body=None):
+        governor.acquire(weight_for_url(url))
+        exchange.last_response_headers = None
+        try:
+            response = raw_fetch(url, method, headers, body)
+        except Exception:
+            governor.observe(exchange.last_response_headers)
+            raise
+        governor.observe(exchange.last_response_headers)
+        return response
+    
+    exchange.enableRateLimit = False
+    exchange.fetch = fetch
+    return exchange
+
+
+def load_cached_markets(path=None, ttl=None):
+    """
+    Đọc market đã cache
+    
+    Returns:
+        tuple: (markets, currencies) hoặc None nếu không có/hết hạn
+    """
+    path = path or config.MARKETS_CACHE_PATH
+    ttl = ttl or config.MARKETS_CACHE_TTL
+    
+    try:
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached['markets'], cached.get('currencies')
+    except Exception as e:
+        print(f"Lỗi khi đọc cache market {path}: {str(e)}")
+        return None
+
+
+def save_markets(exchange, path=None):
+    """Ghi market của exchange ra file cache (ghi file tạm rồi thay thế)"""
+    path = path or config.MARKETS_CACHE_PATH
+    
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'markets': exchange.markets, 'currencies': exchange.currencies or None}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Lỗi khi ghi cache market {path}: {str(e)}")
+
+
+def apply_cached_markets(exchange):
+    """
+    Nạp market từ cache vào exchange (ccxt hoặc ccxt.pro) để không gọi exchangeInfo
+    
+    Returns:
+        bool: True nếu đã nạp từ cache
+    """
+    cached = load_cached_markets()
+    if cached is None:
+        return False
+    markets, currencies = cached
+    exchange.set_markets(markets, currencies)
+    return True
+
+
+def ensure_markets(exchange):
+    """Đảm bảo exchange đã có market - dùng cache, chỉ tải từ Binance khi cache hết hạn"""
+    if exchange.markets:
+        return exchange.markets
+    if apply_cached_markets(exchange):
+        return exchange.markets
+    exchange.load_markets()
+    save_markets(exchange)
+    return exchange.markets
+
+
+def get_exchange():
+    """
+    Lấy kết nối Binance dùng chung (tạo ở lần gọi đầu)
+    
+    Returns:
+        ccxt.binance
+    """
+    global _exchange
+    if _exchange is None:
+        with _lock:
+            if _exchange is None:
+                import ccxt
+                
+                exchange = govern(ccxt.binance({
+                    'enableRateLimit': False,
+                    'timeout': config.BINANCE_REQUEST_TIMEOUT,
+                }))
+                use_host(exchange, api_hosts()[0])
+                apply_cached_markets(exchange)
+                _exchange = exchange
+    return _exchange
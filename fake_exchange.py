@@ -0,0 +1,520 @@
+"""
+Sàn Binance giả chạy local để chạy thử scanner/bot và load test
+
+Server HTTP giả lập các endpoint REST mà bot dùng:
+- Binance: /api/v3/time, /api/v3/ping, /api/v3/exchangeInfo, /api/v3/klines
+- Telegram: /bot<token>/getMe, /bot<token>/sendMessage (ghi lại tin nhắn)
+
+Dữ liệu nến:
+- SyntheticMarket: nến M15 sinh tất định theo (symbol, open time), không
+  giới hạn số symbol/thời gian, khung lớn hơn được gộp từ M15
+- RecordedMarket: nến M15 ghi từ Binance thật (python fake_exchange.py record ...)
+
+Có thể cấu hình độ trễ (kèm đuôi chậm), tỷ lệ lỗi 503, tỷ lệ chưa chốt nến
+ngay sau khi đóng, giới hạn weight (header X-MBX-USED-WEIGHT-1M, 429 +
+Retry-After). Giờ của sàn giả có thể đặt tùy ý (set_time) để chạy nhanh
+qua nhiều lần đóng nến.
+
+Cách dùng:
+    python fake_exchange.py serve [--port 8900] [--symbols 1000] [--recording file.npz]
+    python fake_exchange.py record BTCUSDT ETHUSDT --out market.npz [--bars 3000]
+
+Rồi trỏ bot/script test vào sàn giả:
+    BINANCE_API_URL=http://127.0.0.1:8900 TELEGRAM_API_URL=http://127.0.0.1:8900 python main.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from weight_governor import weight_for_url
+
+M15_MS = 15 * 60 * 1000
+
+# Các khung hỗ trợ (bội số của M15)
+INTERVAL_MS = {
+    '15m': M15_MS,
+    '30m': 2 * M15_MS,
+    '1h': 4 * M15_MS,
+    '2h': 8 * M15_MS,
+    '4h': 16 * M15_MS,
+    '1d': 96 * M15_MS,
+}
+
+# Cột giá trị nến: open, high, low, close, volume, taker_buy_volume
+_OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _TAKER = range(6)
+
+
+def _uniform(seed, index, stream):
+    """Số ngẫu nhiên [0, 1) tất định theo (seed, index, stream) - splitmix64"""
+    offset = (seed + stream * 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF
+    x = np.asarray(index).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(offset)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+class SyntheticMarket:
+    """
+    Nến M15 giả tất định: giá dao động theo 2 chu kỳ sin + nhiễu
+    (đủ để Stochastic đi qua vùng quá mua/quá bán)
+    """
+    
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.params = {symbol: self._params(symbol) for symbol in self.symbols}
+    
+    @staticmethod
+    def _params(symbol):
+        seed = zlib.crc32(symbol.encode())
+        u = _uniform(seed, np.arange(7), 99)
+        return {
+            'seed': seed,
+            'base': 10 ** (u[0] * 5 - 1),
+            'periods': (60 + 140 * u[1], 400 + 1100 * u[2]),
+            'amplitudes': (0.02 + 0.03 * u[3], 0.05 + 0.1 * u[4]),
+            'phases': (2 * np.pi * u[5], 2 * np.pi * u[6]),
+        }
+    
+    def _closes(self, p, index):
+        (p1, p2), (a1, a2), (f1, f2) = p['periods'], p['amplitudes'], p['phases']
+        noise = _uniform(p['seed'], index, 0) - 0.5
+        log_price = a1 * np.sin(2 * np.pi * index / p1 + f1) + a2 * np.sin(2 * np.pi * index / p2 + f2)
+        return p['base'] * np.exp(log_price + 0.004 * noise)
+    
+    def m15(self, symbol, start_ms, end_ms):
+        """
+        Nến M15 có open time trong [start_ms, end_ms)
+        
+        Returns:
+            tuple: (mảng open time ms, mảng giá trị (n, 6)), None nếu không có symbol
+        """
+        p = self.params.get(symbol)
+        if p is None:
+            return None
+        
+        index = np.arange(-(-start_ms // M15_MS), -(-end_ms // M15_MS), dtype=np.int64)
+        seed = p['seed']
+        close = self._closes(p, index)
+        open_ = self._closes(p, index - 1)
+        body_high = np.maximum(open_, close)
+        body_low = np.minimum(open_, close)
+        volume = 1000 * (0.5 + _uniform(seed, index, 3))
+        
+        values = np.column_stack([
+            open_,
+            body_high * (1 + 0.004 * _uniform(seed, index, 1)),
+            body_low * (1 - 0.004 * _uniform(seed, index, 2)),
+            close,
+            volume,
+            volume * (0.3 + 0.4 * _uniform(seed, index, 4)),
+        ])
+        return index * M15_MS, values
+
+
+class RecordedMarket:
+    """
+    Nến M15 ghi lại từ Binance (file .npz: mỗi symbol một mảng (n, 7), cột đầu là open time ms)
+    """
+    
+    def __init__(self, data):
+        self.data = data
+        self.symbols = list(data)
+    
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            return cls({symbol: f[symbol] for symbol in f.files})
+    
+    def replay_start(self, warmup_bars=2000):
+        """Thời điểm bắt đầu replay (ms) - chừa warmup_bars nến M15 lịch sử (đủ 500 nến H1)"""
+        first_ms = min(int(rows[0, 0]) for rows in self.data.values())
+        last_ms = max(int(rows[-1, 0]) for rows in self.data.values())
+        return min(first_ms + warmup_bars * M15_MS, last_ms) // M15_MS * M15_MS
+    
+    def m15(self, symbol, start_ms, end_ms):
+        rows = self.data.get(symbol)
+        if rows is None:
+            return None
+        times = rows[:, 0].astype(np.int64)
+        lo, hi = np.searchsorted(times, [start_ms, end_ms])
+        return times[lo:hi], rows[lo:hi, 1:]
+
+
+def record_market(symbols, path, bars=3000):
+    """Tải nến M15 từ Binance thật và ghi ra file .npz cho RecordedMarket"""
+    from exchange_client import get_exchange
+    
+    exchange = get_exchange()
+    data = {}
+    for symbol in symbols:
+        end_ms = None
+        chunks = []
+        remaining = bars
+        while remaining > 0:
+            params = {'symbol': symbol, 'interval': '15m', 'limit': min(remaining, 1000)}
+            if end_ms is not None:
+                params['endTime'] = end_ms
+            klines = exchange.publicGetKlines(params)
+            if not klines:
+                break
+            rows = np.array([[k[0], k[1], k[2], k[3], k[4], k[5], k[9]] for k in klines], dtype=np.float64)
+            chunks.insert(0, rows)
+            remaining -= len(rows)
+            end_ms = int(rows[0, 0]) - 1
+        if chunks:
+            data[symbol] = np.concatenate(chunks)
+            print(f"  {symbol}: {len(data[symbol])} nến")
+    
+    np.savez_compressed(path, **data)
+    return data
+
+
+class FakeExchange:
+    """
+    Trạng thái sàn giả: giờ server, độ trễ/lỗi, weight đã dùng và tin nhắn Telegram đã nhận
+    """
+    
+    def __init__(self, market, latency=0.0, tail_probability=0.0, tail_latency=0.0,
+                 error_rate=0.0, lag_probability=0.0, lag_seconds=3.0, weight_limit=6000, seed=0):
+        """
+        Args:
+            market: SyntheticMarket hoặc RecordedMarket
+            latency: Độ trễ mỗi request REST (giây)
+            tail_probability: Tỷ lệ request bị chậm thêm tail_latency giây
+            error_rate: Tỷ lệ request trả 503
+            lag_probability: Tỷ lệ klines chưa có nến mới trong lag_seconds giây đầu sau khi đóng nến
+            weight_limit: Weight tối đa mỗi phút (vượt -> 429)
+        """
+        self.market = market
+        self.latency = latency
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.lag_probability = lag_probability
+        self.lag_seconds = lag_seconds
+        self.weight_limit = weight_limit
+        self.random = random.Random(seed)
+        
+        self.offset = 0.0
+        self.weight_window = None
+        self.weight_used = 0
+        self.lock = threading.Lock()
+        
+        # Thống kê
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.messages = []
+    
+    def time(self):
+        """Giờ server (giây, epoch)"""
+        return time.time() + self.offset
+    
+    def set_time(self, timestamp):
+        """Đặt giờ server (giây, epoch) - giờ vẫn chạy tiếp từ thời điểm này"""
+        self.offset = timestamp - time.time()
+    
+    def delay(self):
+        """Độ trễ của một request (có đuôi chậm)"""
+        with self.lock:
+            tail = self.random.random() < self.tail_probability
+        return self.latency + (self.tail_latency if tail else 0.0)
+    
+    def take_weight(self, weight):
+        """
+        Cộng weight của request
+        
+        Returns:
+            tuple: (weight đã dùng trong phút, số giây phải chờ nếu vượt giới hạn hoặc None)
+        """
+        now = self.time()
+        with self.lock:
+            window = int(now // 60)
+            if window != self.weight_window:
+                self.weight_window = window
+                self.weight_used = 0
+            if self.weight_used + weight > self.weight_limit:
+                self.rate_limited += 1
+                return self.weight_used, (window + 1) * 60 - now
+            self.weight_used += weight
+            return self.weight_used, None
+    
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+    
+    def server_time(self, params):
+        return {'serverTime': int(self.time() * 1000)}
+    
+    def exchange_info(self, params):
+        symbols = []
+        for symbol in self.market.symbols:
+            base = symbol[:-4] if symbol.endswith('USDT') else symbol[:-3]
+            symbols.append({
+                'symbol': symbol,
+                'status': 'TRADING',
+                'baseAsset': base,
+                'quoteAsset': symbol[len(base):],
+                'baseAssetPrecision': 8,
+                'quoteAssetPrecision': 8,
+                'orderTypes': ['LIMIT', 'MARKET'],
+                'isSpotTradingAllowed': True,
+                'permissions': ['SPOT'],
+                'filters': [],
+            })
+        return {
+            'timezone': 'UTC',
+            'serverTime': int(self.time() * 1000),
+            'rateLimits': [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE',
+                            'intervalNum': 1, 'limit': self.weight_limit}],
+            'symbols': symbols,
+        }
+    
+    def klines(self, params):
+        """
+        Nến theo khung (gộp từ M15), nến cuối là nến đang hình thành
+        
+        Returns:
+            list: Định dạng như /api/v3/klines, None nếu symbol/interval không hợp lệ
+        """
+        step = INTERVAL_MS.get(params.get('interval'))
+        if step is None:
+            return None
+        limit = min(int(params.get('limit', 500)), 1000)
+        now_ms = int(self.time() * 1000)
+        
+        last_open = now_ms // step * step
+        
+        # Sàn chưa chốt nến vừa đóng -> chưa trả nến mới
+        current_m15 = now_ms // M15_MS * M15_MS
+        if now_ms - current_m15 < self.lag_seconds * 1000:
+            with self.lock:
+                lagging = self.random.random() < self.lag_probability
+            if lagging:
+                last_open = (current_m15 - 1) // step * step
+        
+        if 'endTime' in params:
+            last_open = min(last_open, int(params['endTime']) // step * step)
+        first_open = last_open - (limit - 1) * step
+        if 'startTime' in params:
+            # Có startTime: trả limit nến tính từ startTime (như Binance)
+            first_open = -(-int(params['startTime']) // step) * step
+            last_open = min(last_open, first_open + (limit - 1) * step)
+        
+        candles = self.market.m15(params.get('symbol'), first_open, min(last_open + step, current_m15 + M15_MS))
+        if candles is None:
+            return None
+        times, values = candles
+        if not len(times):
+            return []
+        
+        # Gộp M15 thành nến khung lớn
+        groups = (times - first_open) // step
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        ends = np.r_[starts[1:], len(times)] - 1
+        opens = first_open + groups[starts] * step
+        rows = np.column_stack([
+            values[starts, _OPEN],
+            np.maximum.reduceat(values[:, _HIGH], starts),
+            np.minimum.reduceat(values[:, _LOW], starts),
+            values[ends, _CLOSE],
+            np.add.reduceat(values[:, _VOLUME], starts),
+            np.add.reduceat(values[:, _TAKER], starts),
+        ])
+        
+        return [
+            [int(t), f"{o:.8f}", f"{h:.8f}", f"{l:.8f}", f"{c:.8f}", f"{v:.8f}",
+             int(t) + step - 1, f"{v * c:.8f}", 100, f"{tb:.8f}", f"{tb * c:.8f}", "0"]
+            for t, (o, h, l, c, v, tb) in zip(opens, rows.tolist())
+        ]
+    
+    def telegram(self, method, params):
+        """Trả lời Bot API Telegram (ghi lại sendMessage)"""
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+                    'can_join_groups': True, 'can_read_all_group_messages': False,
+                    'supports_inline_queries': False}
+        if method == 'sendMessage':
+            with self.lock:
+                self.messages.append((self.time(), params.get('chat_id'), params.get('text', '')))
+                message_id = len(self.messages)
+            return {'message_id': message_id, 'date': int(self.time()),
+                    'chat': {'id': -1001, 'type': 'channel', 'title': 'Fake'},
+                    'text': params.get('text', '')}
+        if method == 'getUpdates':
+            return []
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    BINANCE_ROUTES = {
+        '/api/v3/time': FakeExchange.server_time,
+        '/api/v3/ping': lambda exchange, params: {},
+        '/api/v3/exchangeInfo': FakeExchange.exchange_info,
+        '/api/v3/klines': FakeExchange.klines,
+    }
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_text(self, status, text, headers=None):
+        """Trả lỗi dạng text như load balancer của Binance (ccxt coi là lỗi mạng)"""
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _params(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if 'json' in (self.headers.get('Content-Type') or ''):
+                params.update(json.loads(body))
+            else:
+                params.update({key: values[-1] for key, values in parse_qs(body).items()})
+        return url.path, params
+    
+    def _handle(self):
+        exchange = self.server.exchange
+        path, params = self._params()
+        
+        if path.startswith('/bot'):
+            method = path.rsplit('/', 1)[-1]
+            self._send(200, {'ok': True, 'result': exchange.telegram(method, params)})
+            return
+        
+        route = self.BINANCE_ROUTES.get(path)
+        if route is None:
+            self._send(404, {'code': -1000, 'msg': 'Unknown endpoint'})
+            return
+        
+        time.sleep(exchange.delay())
+        used, retry_after = exchange.take_weight(weight_for_url(path))
+        headers = {'X-MBX-USED-WEIGHT-1M': used}
+        
+        if retry_after is not None:
+            headers['Retry-After'] = int(retry_after) + 1
+            self._send(429, {'code': -1003, 'msg': 'Too much request weight used'}, headers)
+            return
+        if exchange.should_fail():
+            self._send_text(503, 'Service Unavailable', headers)
+            return
+        
+        result = route(exchange, params)
+        if result is None:
+            self._send(400, {'code': -1121, 'msg': 'Invalid symbol.'}, headers)
+            return
+        self._send(200, result, headers)
+    
+    do_GET = _handle
+    do_POST = _handle
+
+
+class FakeExchangeServer(ThreadingHTTPServer):
+    """
+    HTTP server của sàn giả (chạy ở thread nền)
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, exchange, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.exchange = exchange
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-exchange', daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def synthetic_symbols(count):
+    """Tên symbol giả: SYN0001USDT, SYN0002USDT..."""
+    return [f"SYN{i:04d}USDT" for i in range(1, count + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sàn Binance giả chạy local')
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    serve = sub.add_parser('serve', help='Chạy server sàn giả')
+    serve.add_argument('--port', type=int, default=8900)
+    serve.add_argument('--symbols', type=int, default=1000, help='Số symbol giả')
+    serve.add_argument('--recording', help='File .npz nến đã ghi (thay cho dữ liệu giả)')
+    serve.add_argument('--latency', type=float, default=0.02)
+    serve.add_argument('--tail-probability', type=float, default=0.0)
+    serve.add_argument('--tail-latency', type=float, default=0.0)
+    serve.add_argument('--error-rate', type=float, default=0.0)
+    serve.add_argument('--lag-probability', type=float, default=0.0)
+    serve.add_argument('--start', type=float, help='Giờ server lúc khởi động (epoch giây)')
+    
+    record = sub.add_parser('record', help='Ghi nến M15 từ Binance thật')
+    record.add_argument('symbols', nargs='+')
+    record.add_argument('--out', required=True)
+    record.add_argument('--bars', type=int, default=3000)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'record':
+        record_market(args.symbols, args.out, args.bars)
+        return
+    
+    market = RecordedMarket.load(args.recording) if args.recording else SyntheticMarket(synthetic_symbols(args.symbols))
+    exchange = FakeExchange(market, latency=args.latency, tail_probability=args.tail_probability,
+                            tail_latency=args.tail_latency, error_rate=args.error_rate,
+                            lag_probability=args.lag_probability)
+    if args.start is not None:
+        exchange.set_time(args.start)
+    elif args.recording:
+        exchange.set_time(market.replay_start() / 1000)
+    server = FakeExchangeServer(exchange, port=args.port)
+    print(f"Sàn giả: {server.url} - {len(market.symbols)} symbols")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""
+Gửi tín hiệu tới nhiều chat trong giới hạn tốc độ của Telegram
+
+Telegram giới hạn khoảng 30 tin/giây cho cả bot, 1 tin/giây mỗi chat riêng
+và 20 tin/phút mỗi nhóm/channel; vượt giới hạn bị 429 (RetryAfter).
+FanoutDispatcher:
+- Token bucket toàn cục + token bucket mỗi chat, gửi song song tối đa
+  FANOUT_CONCURRENCY request nên luôn dùng hết ngân sách toàn cục khi còn
+  chat sẵn sàng (thời gian gửi ~ số tin / TELEGRAM_GLOBAL_RATE)
+- Ưu tiên theo priority (channel trước người dùng), cùng ưu tiên thì xoay
+  vòng giữa các chat
+- Các tín hiệu cùng một lần quét cho cùng một chat được gộp thành một tin
+  tổng hợp (tách nhiều tin nếu dài hơn TELEGRAM_MESSAGE_LIMIT)
+- RetryAfter -> dừng toàn bộ đến hết thời gian chờ; lỗi mạng -> thử lại
+  với backoff; tin chưa gửi được lấy ra để lưu database khi dừng bot
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SEPARATOR = "\n\n──────────\n\n"
+
+
+def is_group_chat(chat_id):
+    """Nhóm/channel có chat_id âm (hoặc @username của channel)"""
+    return str(chat_id).startswith(('-', '@'))
+
+
+def parse_chat_id(value):
+    """chat_id lưu dạng chuỗi trong database -> kiểu như lúc gửi (int, channel giữ nguyên chuỗi cấu hình)"""
+    value = str(value)
+    if value == str(config.TELEGRAM_CHANNEL_ID):
+        return config.TELEGRAM_CHANNEL_ID
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def build_digests(texts, limit=None):
+    """
+    Gộp các tin tín hiệu thành ít tin nhất, mỗi tin không quá limit ký tự
+    
+    Returns:
+        list: Các tin đã gộp
+    """
+    limit = limit or config.TELEGRAM_MESSAGE_LIMIT
+    if len(texts) == 1:
+        return [texts[0][:limit]]
+    
+    digests = []
+    current = []
+    length = 0
+    for text in texts:
+        text = text[:limit]
+        added = len(text) + (len(DIGEST_SEPARATOR) if current else 0)
+        if current and length + added > limit:
+            digests.append(DIGEST_SEPARATOR.join(current))
+            current, length = [], 0
+            added = len(text)
+        current.append(text)
+        length += added
+    if current:
+        digests.append(DIGEST_SEPARATOR.join(current))
+    return digests
+
+
+class TokenBucket:
+    """
+    Token bucket: rate token/giây, tối đa capacity token
+    """
+    
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+    
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def wait_time(self, now):
+        """Số giây đến khi có 1 token"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def pause(self, now, seconds):
+        """Không cấp token trong seconds giây (sau 429 RetryAfter)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, now + seconds)
+    
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class FanoutDispatcher:
+    """
+    Hàng đợi gửi tin Telegram theo ưu tiên, tôn trọng giới hạn toàn cục và từng chat
+    """
+    
+    def __init__(self, send, on_forbidden=None, global_rate=None, global_burst=None, concurrency=None):
+        """
+        Args:
+            send: async send(chat_id, text) - gửi một tin, ném lỗi telegram.error khi thất bại
+            on_forbidden: async on_forbidden(chat_id) - chat đã chặn bot/không tồn tại
+            global_rate: Số tin/giây cho cả bot (mặc định TELEGRAM_GLOBAL_RATE)
+            concurrency: Số request gửi song song (mặc định FANOUT_CONCURRENCY)
+        """
+        self.send = send
+        self.on_forbidden = on_forbidden
+        self.global_bucket = TokenBucket(global_rate or config.TELEGRAM_GLOBAL_RATE,
+                                         global_burst or config.TELEGRAM_GLOBAL_BURST)
+        self.slots = asyncio.Semaphore(concurrency or config.FANOUT_CONCURRENCY)
+        self.chat_buckets = {}
+        
+        # chat_id -> deque tin chờ gửi (dict: chat_id, text, priority, attempts, future)
+        self.queues = {}
+        # Chat có tin và sẵn sàng: (priority, thứ tự, chat_id); chat đang chờ bucket/backoff: (thời điểm, chat_id)
+        self.ready = []
+        self.delayed = []
+        self.scheduled = set()
+        self.sequence = itertools.count()
+        
+        # Tín hiệu của lần quét hiện tại chờ gộp: chat_id -> (priority, [tin], future kết quả tin tổng hợp)
+        self.digests = {}
+        
+        self.inflight = set()
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+        
+        # Thống kê
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+    
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(config.TELEGRAM_GROUP_RATE, config.TELEGRAM_GROUP_BURST)
+            else:
+                bucket = TokenBucket(config.TELEGRAM_CHAT_RATE, 1)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+    
+    @property
+    def queued(self):
+        return sum(len(queue) for queue in self.queues.values())
+    
+    def add_signal(self, chat_id, text, priority=1):
+        """
+        Thêm tín hiệu vào tin tổng hợp của chat (gửi khi flush)
+        
+        Returns:
+            asyncio.Future: Kết quả gửi tin tổng hợp chứa tín hiệu (True nếu gửi được mọi phần)
+        """
+        entry = self.digests.get(chat_id)
+        if entry is None:
+            entry = self.digests[chat_id] = (priority, [], asyncio.get_running_loop().create_future())
+        entry[1].append(text)
+        return entry[2]
+    
+    def flush(self):
+        """
+        Đưa các tin tổng hợp của lần quét vào hàng đợi gửi
+        
+        Returns:
+            int: Số tin đã đưa vào hàng đợi
+        """
+        digests, self.digests = self.digests, {}
+        count = 0
+        for chat_id, (priority, texts, future) in digests.items():
+            parts = [self.enqueue(chat_id, text, priority) for text in build_digests(texts)]
+            asyncio.gather(*parts).add_done_callback(
+                lambda done, future=future: future.done() or future.set_result(all(done.result()))
+            )
+            count += len(parts)
+        self._prune_buckets()
+        return count
+    
+    def enqueue(self, chat_id, text, priority=1, attempts=0):
+        """
+        Thêm một tin vào hàng đợi
+        
+        Returns:
+            asyncio.Future: Kết quả gửi (True/False)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._push(chat_id, {'chat_id': chat_id, 'text': text, 'priority': priority,
+                             'attempts': attempts, 'future': future})
+        self.start()
+        return future
+    
+    async def send_now(self, chat_id, text, priority=0):
+        """Gửi một tin (ưu tiên cao) và chờ Telegram xác nhận"""
+        return await self.enqueue(chat_id, text, priority)
+    
+    def _push(self, chat_id, item, front=False):
+        queue = self.queues.setdefault(chat_id, deque())
+        if front:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+        if chat_id not in self.scheduled:
+            self._schedule(chat_id, time.monotonic())
+        self.idle.clear()
+        self.wakeup.set()
+    
+    def _schedule(self, chat_id, at):
+        """Đưa chat vào danh sách sẵn sàng (hoặc chờ đến at)"""
+        self.scheduled.add(chat_id)
+        now = time.monotonic()
+        at = max(at, now + self.chat_bucket(chat_id).wait_time(now))
+        if at <= now:
+            heapq.heappush(self.ready, (self.queues[chat_id][0]['priority'], next(self.sequence), chat_id))
+        else:
+            heapq.heappush(self.delayed, (at, next(self.sequence), chat_id))
+    
+    def _prune_buckets(self):
+        """Bỏ bucket đã đầy của chat không còn tin (giữ bộ nhớ nhỏ với nhiều người dùng)"""
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.chat_buckets.items() if c not in self.queues and b.is_full(now)]:
+            del self.chat_buckets[chat_id]
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+    
+    async def run(self):
+        """Vòng lặp gửi: lấy chat ưu tiên cao nhất đã sẵn sàng khi còn ngân sách toàn cục"""
+        while True:
+            now = time.monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self.delayed)
+                heapq.heappush(self.ready, (self.queues[chat_id][0]['priority'], next(self.sequence), chat_id))
+            
+            if not self.ready:
+                if not self.delayed and not self.inflight:
+                    self.idle.set()
+                self.wakeup.clear()
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            
+            await self.slots.acquire()
+            if not self.ready:
+                self.slots.release()
+                continue
+            _, _, chat_id = heapq.heappop(self.ready)
+            now = time.monotonic()
+            self.global_bucket.take(now)
+            self.chat_bucket(chat_id).take(now)
+            
+            queue = self.queues[chat_id]
+            item = queue.popleft()
+            if queue:
+                self._schedule(chat_id, now)
+            else:
+                del self.queues[chat_id]
+                self.scheduled.discard(chat_id)
+            
+            task = asyncio.create_task(self._deliver(item))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+    
+    async def _deliver(self, item):
+        """Gửi một tin, xử lý lỗi và thử lại"""
+        chat_id = item['chat_id']
+        try:
+            await self.send(chat_id, item['text'])
+            self.sent += 1
+            self._resolve(item, True)
+        except RetryAfter as e:
+            seconds = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+            self.rate_limited += 1
+            logger.warning(f"Telegram giới hạn tốc độ, dừng gửi {seconds:.0f}s")
+            self.global_bucket.pause(time.monotonic(), seconds)
+            self._push(chat_id, item, front=True)
+        except Forbidden as e:
+            logger.info(f"Chat {chat_id} không nhận được tin nhắn ({str(e)})")
+            self._drop_chat(chat_id, item)
+            if self.on_forbidden is not None:
+                await self.on_forbidden(chat_id)
+        except BadRequest as e:
+            # Chat không tồn tại / nội dung không hợp lệ -> thử lại cũng không được
+            logger.error(f"Lỗi khi gửi tin tới {chat_id}: {str(e)}")
+            self.failed += 1
+            self._resolve(item, False)
+        except Exception as e:
+            item['attempts'] += 1
+            if item['attempts'] >= config.FANOUT_MAX_ATTEMPTS:
+                logger.error(f"Bỏ tin tới {chat_id} sau {item['attempts']} lần lỗi: {str(e)}")
+                self.failed += 1
+                self._resolve(item, False)
+            else:
+                self.retries += 1
+                self._push(chat_id, item, front=True)
+                self._delay_chat(chat_id, config.FANOUT_RETRY_BACKOFF * 2 ** (item['attempts'] - 1))
+        finally:
+            self.inflight.discard(asyncio.current_task())
+            self.slots.release()
+            self.wakeup.set()
+    
+    def _unschedule(self, chat_id):
+        if chat_id not in self.scheduled:
+            return
+        self.scheduled.discard(chat_id)
+        self.ready = [entry for entry in self.ready if entry[2] != chat_id]
+        self.delayed = [entry for entry in self.delayed if entry[2] != chat_id]
+        heapq.heapify(self.ready)
+        heapq.heapify(self.delayed)
+    
+    def _delay_chat(self, chat_id, seconds):
+        """Chat chỉ được gửi lại sau seconds giây (backoff khi lỗi)"""
+        self.chat_bucket(chat_id).pause(time.monotonic(), seconds)
+        self._unschedule(chat_id)
+        self._schedule(chat_id, time.monotonic())
+    
+    def _drop_chat(self, chat_id, item):
+        """Bỏ mọi tin chờ gửi tới chat"""
+        self.failed += 1
+        self._resolve(item, False)
+        self._unschedule(chat_id)
+        for dropped in self.queues.pop(chat_id, ()):
+            self._resolve(dropped, False)
+        digest = self.digests.pop(chat_id, None)
+        if digest is not None:
+            self._resolve({'future': digest[2]}, False)
+    
+    @staticmethod
+    def _resolve(item, result):
+        future = item.get('future')
+        if future is not None and not future.done():
+            future.set_result(result)
+    
+    async def join(self):
+        """Chờ gửi hết hàng đợi"""
+        await self.idle.wait()
+    
+    def restore(self, items):
+        """Nạp lại tin chưa gửi (từ database): [(chat_id, text, priority, attempts)]"""
+        for chat_id, text, priority, attempts in items:
+            self.enqueue(chat_id, text, priority, attempts)
+    
+    async def stop(self):
+        """
+        Dừng gửi, trả về các tin chưa gửi để lưu lại
+        
+        Returns:
+            list: [(chat_id, text, priority, attempts)]
+        """
+        if self.task is not None:
+            self.task.cancel()
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+        
+        pending = []
+        for queue in self.queues.values():
+            for item in queue:
+                pending.append((item['chat_id'], item['text'], item['priority'], item['attempts']))
+                self._resolve(item, False)
+        for chat_id, (priority, texts, future) in self.digests.items():
+            pending.extend((chat_id, text, priority, 0) for text in build_digests(texts))
+            self._resolve({'future': future}, False)
+        self.queues.clear()
+        self.digests.clear()
+        self.ready, self.delayed = [], []
+        self.scheduled.clear()
+        return pending
+    
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'chats': len(self.queues),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+        }
@@ -0,0 +1,285 @@
+"""
+Gọi REST Binance có dự phòng (hedged request) qua nhiều host API
+
+Một response chậm (5s+) làm trễ cả lần quét nối tiếp phía sau. Binance có
+nhiều host cùng dữ liệu (api, api1, api2, api3...), nên:
+- Request gửi tới host khỏe nhất; quá hạn p95 độ trễ gần đây mà chưa có
+  kết quả -> gửi thêm một bản sang host khác, lấy kết quả về trước
+- Host lỗi mạng/timeout -> chuyển ngay sang host khác
+- Mỗi host có điểm sức khỏe (độ trễ EWMA + tỷ lệ lỗi) và circuit breaker:
+  lỗi liên tiếp HOST_BREAKER_FAILURES lần -> ngắt HOST_BREAKER_COOLDOWN giây,
+  hết thời gian cho thử lại một request (half-open)
+- Mọi host dùng chung WeightGovernor (weight tính theo IP, không theo host),
+  đang dùng nhiều weight thì không gửi bản dự phòng
+
+Mỗi thread có instance ccxt riêng cho từng host (ccxt sync không an toàn
+khi dùng chung giữa các thread).
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import config
+
+# Trạng thái circuit breaker
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class LatencyWindow:
+    """
+    Độ trễ của N request gần nhất (mảng vòng numpy)
+    """
+    
+    def __init__(self, size):
+        self.values = np.zeros(size, dtype=np.float64)
+        self.count = 0
+    
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+    
+    def __len__(self):
+        return min(self.count, len(self.values))
+    
+    def percentile(self, q):
+        """Phân vị q (0-100) của các mẫu, None nếu chưa có mẫu"""
+        if not len(self):
+            return None
+        return float(np.percentile(self.values[:len(self)], q))
+
+
+class HostHealth:
+    """
+    Sức khỏe một host API: độ trễ, tỷ lệ lỗi và circuit breaker
+    """
+    
+    def __init__(self, host, alpha=0.2):
+        self.host = host
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = None
+        self.probing = False
+        
+        self.requests = 0
+        self.errors = 0
+        self.trips = 0
+    
+    @property
+    def score(self):
+        """Điểm ước lượng thời gian trả lời (thấp = khỏe, host chưa đo coi như nhanh)"""
+        latency = self.latency if self.latency is not None else config.HEDGE_MIN_DELAY
+        return latency * (1 + 4 * self.error_rate)
+    
+    def available(self, now):
+        """Có được gửi request tới host không (hết cooldown -> half-open thử một request)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= config.HOST_BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+        return self.state == HALF_OPEN and not self.probing
+    
+    def record_success(self, seconds):
+        self.requests += 1
+        self.latency = seconds if self.latency is None else \
+            self.alpha * seconds + (1 - self.alpha) * self.latency
+        self.error_rate *= 1 - self.alpha
+        self.failures = 0
+        self.state = CLOSED
+        self.probing = False
+    
+    def record_failure(self, now):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.failures += 1
+        self.probing = False
+        
+        if self.state == HALF_OPEN or self.failures >= config.HOST_BREAKER_FAILURES:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = now
+
+
+class HedgedFetcher:
+    """
+    Gọi API public Binance có hedged request và chọn host theo sức khỏe
+    """
+    
+    def __init__(self, hosts=None, governor=None, workers=None):
+        """
+        Args:
+            hosts: Danh sách host API (mặc định BINANCE_API_HOSTS)
+            governor: WeightGovernor dùng chung
+            workers: Số thread gửi request
+        """
+        self.hosts = {host: HostHealth(host) for host in (hosts or config.BINANCE_API_HOSTS)}
+        self.governor = governor
+        self.latencies = LatencyWindow(config.HEDGE_LATENCY_WINDOW)
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.HEDGE_WORKERS,
+                                           thread_name_prefix='binance-rest')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        
+        # Thống kê
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+    
+    def _exchange(self, host):
+        """Instance ccxt của thread hiện tại trỏ tới host"""
+        exchanges = getattr(self._local, 'exchanges', None)
+        if exchanges is None:
+            exchanges = self._local.exchanges = {}
+        
+        if host not in exchanges:
+            import ccxt
+            from exchange_client import govern, use_host
+            
+            exchange = govern(ccxt.binance({
+                'enableRateLimit': False,
+                'timeout': config.BINANCE_REQUEST_TIMEOUT,
+            }), self.governor)
+            exchanges[host] = use_host(exchange, host)
+        return exchanges[host]
+    
+    def hedge_delay(self):
+        """Thời gian chờ trước khi gửi bản dự phòng - phân vị HEDGE_PERCENTILE độ trễ gần đây"""
+        with self._lock:
+            if len(self.latencies) < config.HEDGE_MIN_SAMPLES:
+                return config.HEDGE_MAX_DELAY
+            delay = self.latencies.percentile(config.HEDGE_PERCENTILE)
+        return min(max(delay, config.HEDGE_MIN_DELAY), config.HEDGE_MAX_DELAY)
+    
+    def ranked_hosts(self):
+        """Các host có thể dùng, khỏe nhất trước (breaker đều ngắt -> thử host ngắt lâu nhất)"""
+        now = time.monotonic()
+        with self._lock:
+            hosts = [h for h in self.hosts.values() if h.available(now)]
+            if not hosts:
+                hosts = [min(self.hosts.values(), key=lambda h: h.opened_at)]
+            return [h.host for h in sorted(hosts, key=lambda h: h.score)]
+    
+    def can_hedge(self):
+        """Chỉ gửi bản dự phòng khi còn dư weight"""
+        return self.governor is None or self.governor.utilization < config.HEDGE_MAX_UTILIZATION
+    
+    def _call(self, host, method, params):
+        """Gửi request tới một host và ghi nhận sức khỏe host"""
+        import ccxt
+        
+        health = self.hosts[host]
+        with self._lock:
+            if health.state == HALF_OPEN:
+                health.probing = True
+        
+        started = time.monotonic()
+        try:
+            result = getattr(self._exchange(host), method)(params)
+        except ccxt.NetworkError as e:
+            # Bị giới hạn weight là theo IP, đổi host không giúp gì
+            if isinstance(e, ccxt.DDoSProtection):
+                with self._lock:
+                    health.probing = False
+                raise
+            with self._lock:
+                health.record_failure(time.monotonic())
+            raise HostError(host, e) from e
+        except Exception:
+            with self._lock:
+                health.probing = False
+            raise
+        
+        seconds = time.monotonic() - started
+        with self._lock:
+            health.record_success(seconds)
+            self.latencies.add(seconds)
+        return result
+    
+    def request(self, method, params):
+        """
+        Gọi một endpoint public (ví dụ 'publicGetKlines')
+        
+        Returns:
+            Kết quả từ host trả lời sớm nhất
+        
+        Raises:
+            Lỗi của request cuối cùng nếu mọi host đều lỗi
+        """
+        self.requests += 1
+        backups = self.ranked_hosts()
+        primary = backups.pop(0)
+        pending = {self.executor.submit(self._call, primary, method, params): primary}
+        delay = self.hedge_delay()
+        hedged = False
+        last_error = None
+        
+        while pending:
+            timeout = delay if backups and not hedged else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            # Quá hạn -> gửi bản dự phòng tới host khác, request cũ vẫn chạy tiếp
+            if not done:
+                hedged = True
+                if self.can_hedge():
+                    self.hedges += 1
+                    host = backups.pop(0)
+                    pending[self.executor.submit(self._call, host, method, params)] = host
+                continue
+            
+            for future in done:
+                host = pending.pop(future)
+                try:
+                    result = future.result()
+                except HostError as e:
+                    last_error = e.error
+                    # Host lỗi -> chuyển sang host kế tiếp nếu không còn request nào đang chạy
+                    if backups and not pending:
+                        self.failovers += 1
+                        host = backups.pop(0)
+                        pending[self.executor.submit(self._call, host, method, params)] = host
+                    continue
+                
+                if host != primary:
+                    self.hedge_wins += 1
+                return result
+        
+        raise last_error
+    
+    def stats(self):
+        """Thống kê để log/giám sát"""
+        with self._lock:
+            p50, p95, p99 = (self.latencies.percentile(q) for q in (50, 95, 99))
+            hosts = {
+                h.host: {'state': h.state, 'latency': h.latency, 'error_rate': h.error_rate, 'trips': h.trips}
+                for h in self.hosts.values()
+            }
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'hosts': hosts,
+        }
+    
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HostError(Exception):
+    """Lỗi mạng của một host (có thể thử host khác)"""
+    
+    def __init__(self, host, error):
+        super().__init__(f"{host}: {error}")
+        self.host = host
+        self.error = error
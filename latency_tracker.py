@@ -0,0 +1,104 @@
+"""
+Thống kê độ trễ tín hiệu từ lúc đóng nến đến khi Telegram xác nhận
+
+Mỗi tín hiệu mang các mốc thời gian theo giờ server Binance:
+candle_close_at -> data_received_at -> decided_at -> acked_at
+(đóng nến -> có đủ nến -> ra quyết định -> Telegram xác nhận đã gửi).
+
+LatencyTracker giữ p50/p95/p99 của từng bước trên LATENCY_WINDOW tín hiệu
+gần nhất và báo động khi p95 tổng vượt LATENCY_SLO_SECONDS.
+"""
+
+import time
+
+import config
+from hedged_fetch import LatencyWindow
+
+# Bước -> (mốc bắt đầu, mốc kết thúc)
+STAGES = {
+    'fetch': ('candle_close_at', 'data_received_at'),
+    'decide': ('data_received_at', 'decided_at'),
+    'send': ('decided_at', 'acked_at'),
+    'total': ('candle_close_at', 'acked_at'),
+}
+
+
+def stage_seconds(marks):
+    """
+    Thời gian từng bước của một tín hiệu
+    
+    Args:
+        marks: dict mốc -> epoch giây (hoặc datetime)
+    
+    Returns:
+        dict: bước -> giây (bỏ bước thiếu mốc)
+    """
+    result = {}
+    for stage, (start, end) in STAGES.items():
+        if marks.get(start) is None or marks.get(end) is None:
+            continue
+        seconds = marks[end] - marks[start]
+        result[stage] = seconds.total_seconds() if hasattr(seconds, 'total_seconds') else seconds
+    return result
+
+
+class LatencyTracker:
+    """
+    p50/p95/p99 độ trễ từng bước trên các tín hiệu gần nhất
+    """
+    
+    def __init__(self, window=None, slo_seconds=None):
+        """
+        Args:
+            window: Số tín hiệu gần nhất (mặc định LATENCY_WINDOW)
+            slo_seconds: Ngưỡng p95 tổng (mặc định LATENCY_SLO_SECONDS)
+        """
+        window = window or config.LATENCY_WINDOW
+        self.slo_seconds = slo_seconds or config.LATENCY_SLO_SECONDS
+        self.windows = {stage: LatencyWindow(window) for stage in STAGES}
+        self.last_alert = None
+    
+    def record(self, marks):
+        """Ghi độ trễ một tín hiệu, trả về dict bước -> giây"""
+        seconds = stage_seconds(marks)
+        for stage, value in seconds.items():
+            self.windows[stage].add(value)
+        return seconds
+    
+    def load(self, rows):
+        """Khôi phục từ database: [(candle_close_at, data_received_at, decided_at, acked_at)]"""
+        for row in rows:
+            self.record(dict(zip(('candle_close_at', 'data_received_at', 'decided_at', 'acked_at'), row)))
+    
+    @property
+    def count(self):
+        return len(self.windows['total'])
+    
+    def summary(self):
+        """
+        Returns:
+            dict: bước -> {'p50', 'p95', 'p99'} (None nếu chưa có mẫu)
+        """
+        return {
+            stage: {f"p{q}": window.percentile(q) for q in (50, 95, 99)}
+            for stage, window in self.windows.items()
+        }
+    
+    def check_slo(self, now=None):
+        """
+        Kiểm tra p95 tổng so với SLO (báo động tối đa một lần mỗi LATENCY_ALERT_COOLDOWN)
+        
+        Returns:
+            float: p95 tổng (giây) nếu vượt SLO và cần báo động, None nếu không
+        """
+        if self.count < config.LATENCY_MIN_SAMPLES:
+            return None
+        p95 = self.windows['total'].percentile(95)
+        if p95 <= self.slo_seconds:
+            return None
+        
+        now = time.time() if now is None else now
+        if self.last_alert is not None and now - self.last_alert < config.LATENCY_ALERT_COOLDOWN:
+            return None
+        self.last_alert = now
+        return p95
@@ -2,9 +2,17 @@
 Main entry point - Khởi chạy bot
 """
 
+# Import đầu tiên để tính thời gian khởi động từ lúc process chạy
+from startup import startup_timer
+
+import memory_usage
+memory_usage.start()
+
 import logging
 from telegram_bot import TelegramBot
 
+startup_timer.mark('imports')
+
 # Cấu hình logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
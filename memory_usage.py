@@ -0,0 +1,97 @@
+"""
+Báo cáo bộ nhớ của bot khi chạy lâu dài (lệnh /mem)
+
+RSS đọc từ /proc (Linux) nên luôn có. Khi bật MEMORY_TRACE_ENABLED,
+tracemalloc được bật lúc khởi động để báo các dòng code giữ nhiều bộ nhớ
+nhất và phần tăng thêm so với lần báo cáo trước (tìm chỗ rò rỉ).
+"""
+
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+
+import config
+
+# Snapshot lần báo cáo trước (để so sánh phần tăng)
+_last_snapshot = None
+
+
+def start():
+    """Bật tracemalloc nếu MEMORY_TRACE_ENABLED (gọi càng sớm càng tốt)"""
+    if config.MEMORY_TRACE_ENABLED and not tracemalloc.is_tracing():
+        tracemalloc.start(config.MEMORY_TRACE_FRAMES)
+
+
+def rss_bytes():
+    """
+    Bộ nhớ thực đang dùng của process
+    
+    Returns:
+        tuple: (rss hiện tại, rss cao nhất) - byte, rss hiện tại None nếu không đọc được
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    peak = peak if sys.platform == 'darwin' else peak * 1024
+    
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        current = None
+    return current, peak
+
+
+def _location(stat):
+    frame = stat.traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+def report(top=None):
+    """
+    Thống kê bộ nhớ
+    
+    Args:
+        top: Số dòng code giữ nhiều bộ nhớ nhất (mặc định MEMORY_REPORT_TOP)
+    
+    Returns:
+        dict: rss, rss_peak, gc_objects, tracing và (nếu bật tracemalloc)
+              traced, traced_peak, top [(vị trí, byte)], growth [(vị trí, byte tăng)]
+    """
+    global _last_snapshot
+    top = top or config.MEMORY_REPORT_TOP
+    
+    rss, rss_peak = rss_bytes()
+    result = {
+        'rss': rss,
+        'rss_peak': rss_peak,
+        'gc_objects': len(gc.get_objects()),
+        'tracing': tracemalloc.is_tracing(),
+    }
+    if not result['tracing']:
+        return result
+    
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    result['traced'], result['traced_peak'] = tracemalloc.get_traced_memory()
+    result['top'] = [(_location(stat), stat.size) for stat in snapshot.statistics('lineno')[:top]]
+    
+    if _last_snapshot is not None:
+        diff = [stat for stat in snapshot.compare_to(_last_snapshot, 'lineno') if stat.size_diff > 0]
+        result['growth'] = [(_location(stat), stat.size_diff) for stat in diff[:top]]
+    _last_snapshot = snapshot
+    return result
+
+
+def format_bytes(value):
+    """Byte -> chuỗi dễ đọc (KB/MB/GB)"""
+    if value is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB'):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == 'B' else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.2f}GB"
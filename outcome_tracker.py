@@ -0,0 +1,245 @@
+"""
+Đánh giá kết quả thực tế của tín hiệu đã gửi
+
+Định kỳ lấy các tín hiệu chưa đánh giá trong signal_history, lấy nến
+OUTCOME_TIMEFRAME sau thời điểm tín hiệu (từ kho nến, thiếu thì tải lịch sử
+từ Binance - mỗi symbol một khoảng liền), rồi tính bằng numpy cho mọi tín
+hiệu cùng lúc ở từng mốc OUTCOME_HORIZONS:
+- return_pct: lợi nhuận theo hướng tín hiệu tại cuối mốc
+- mfe_pct / mae_pct: biến động thuận lợi nhất / bất lợi nhất trong mốc
+- result: 'tp' / 'sl' / 'open' - chạm TP hay SL trước (cùng nến -> tính SL)
+Kết quả được ghi vào signal_outcomes bằng một lệnh upsert.
+
+Tín hiệu được đo từ nến nó thực sự được quyết định: nến bắt đầu tại
+candle_close_at (thời điểm đóng nến của lần quét, không có thì decided_at) và
+giá vào lệnh là giá đóng của nến OUTCOME_TIMEFRAME kết thúc tại đó - không
+dùng giá/nến trước lúc tín hiệu được gửi. Tín hiệu cũ chưa lưu các mốc này
+tính từ lúc đóng nến bối cảnh trong signal_id (giờ Việt Nam).
+"""
+
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import config
+from candle_store import floor_to_timeframe, timeframe_delta
+from signal_scanner import DEFAULT_PAIR, VIETNAM_TZ
+
+# signal_id: {symbol}_{YYYYmmddHHMM}_{BUY|SELL}_SR[_{nhãn vào lệnh}{nhãn bối cảnh}]
+SIGNAL_ID_PATTERN = re.compile(r'^(?P<symbol>[A-Z0-9]+)_(?P<time>\d{12})_(?P<direction>BUY|SELL)_SR(?:_(?P<pair>\w+))?$')
+LABEL_PATTERN = re.compile(r'([MHD])(\d+)$')
+
+
+def parse_signal_id(signal_id):
+    """
+    Tách signal_id
+    
+    Returns:
+        tuple: (symbol, signal_time (giờ VN), hướng, khung bối cảnh) hoặc None nếu không đúng định dạng
+    """
+    match = SIGNAL_ID_PATTERN.match(signal_id)
+    if match is None:
+        return None
+    
+    context = DEFAULT_PAIR[1]
+    if match['pair']:
+        label = LABEL_PATTERN.search(match['pair'])
+        if label is None:
+            return None
+        context = label[2] + {'M': 'm', 'H': 'h', 'D': 'd'}[label[1]]
+    
+    signal_time = pd.Timestamp(datetime.strptime(match['time'], '%Y%m%d%H%M')).tz_localize(VIETNAM_TZ)
+    return match['symbol'], signal_time, match['direction'], context
+
+
+def horizon_bars(timeframe=None, horizons=None):
+    """Tên mốc -> số nến timeframe (ví dụ '4h' -> 16 nến M15)"""
+    delta = timeframe_delta(timeframe or config.OUTCOME_TIMEFRAME)
+    return {name: int(pd.Timedelta(name) // delta) for name in (horizons or config.OUTCOME_HORIZONS)}
+
+
+def evaluate(high, low, close, start, entry, is_long, bars, tp_pct=None, sl_pct=None):
+    """
+    Tính kết quả của nhiều tín hiệu trên cùng một chuỗi nến (vector hóa)
+    
+    Args:
+        high, low, close: Mảng giá của symbol
+        start: Vị trí nến đầu tiên sau tín hiệu của từng tín hiệu
+        entry: Giá vào lệnh
+        is_long: Hướng tín hiệu (bool)
+        bars: Tên mốc -> số nến
+    
+    Returns:
+        dict: tên mốc -> dict mảng (valid, return_pct, mfe_pct, mae_pct, result, bars_to_exit)
+    """
+    tp_pct = config.OUTCOME_TP_PCT if tp_pct is None else tp_pct
+    sl_pct = config.OUTCOME_SL_PCT if sl_pct is None else sl_pct
+    n = len(close)
+    longest = max(bars.values())
+    
+    # Ma trận (tín hiệu x nến sau tín hiệu), vị trí ngoài dữ liệu lấy nến cuối (bị loại bởi valid)
+    index = np.minimum(start[:, None] + np.arange(longest)[None, :], n - 1)
+    sign = np.where(is_long, 1.0, -1.0)[:, None]
+    entry = entry[:, None]
+    
+    # Biến động theo hướng tín hiệu (%): thuận lợi nhất và bất lợi nhất trong từng nến
+    favorable = np.where(is_long[:, None], high[index] / entry - 1, 1 - low[index] / entry) * 100
+    adverse = np.where(is_long[:, None], low[index] / entry - 1, 1 - high[index] / entry) * 100
+    returns = sign * (close[index] / entry - 1) * 100
+    
+    # Nến đầu tiên chạm TP / SL (longest = chưa chạm)
+    tp_hits = favorable >= tp_pct
+    sl_hits = adverse <= -sl_pct
+    tp_bar = np.where(tp_hits.any(axis=1), tp_hits.argmax(axis=1), longest)
+    sl_bar = np.where(sl_hits.any(axis=1), sl_hits.argmax(axis=1), longest)
+    
+    results = {}
+    for name, count in bars.items():
+        valid = start + count <= n
+        sl_first = (sl_bar < count) & (sl_bar <= tp_bar)
+        tp_first = (tp_bar < count) & ~sl_first
+        results[name] = {
+            'valid': valid,
+            'return_pct': returns[:, count - 1],
+            'mfe_pct': np.maximum(favorable[:, :count].max(axis=1), 0),
+            'mae_pct': np.minimum(adverse[:, :count].min(axis=1), 0),
+            'result': np.where(tp_first, 'tp', np.where(sl_first, 'sl', 'open')),
+            'bars_to_exit': np.where(tp_first, tp_bar + 1, np.where(sl_first, sl_bar + 1, -1)),
+        }
+    return results
+
+
+class OutcomeTracker:
+    """
+    Đánh giá các tín hiệu chưa có kết quả và ghi vào signal_outcomes
+    """
+    
+    def __init__(self, db, scanner):
+        """
+        Args:
+            db: DatabaseManager
+            scanner: SignalScanner (kho nến + tải nến lịch sử)
+        """
+        self.db = db
+        self.scanner = scanner
+        self.timeframe = config.OUTCOME_TIMEFRAME
+        self.bars = horizon_bars(self.timeframe)
+        self.longest = max(self.bars, key=self.bars.get)
+    
+    def candles(self, symbol, start, end):
+        """Nến [start, end) từ kho nến nếu phủ đủ khoảng, không thì tải lịch sử"""
+        store = self.scanner.store
+        stored = store.get(symbol, self.timeframe) if store is not None else None
+        if (stored is not None and not stored.empty and stored.index[0] <= start
+                and stored.index[-1] + timeframe_delta(self.timeframe) >= end):
+            return stored[stored.index >= start]
+        return self.scanner.fetch_history(symbol, self.timeframe, start, end)
+    
+    def evaluate_symbol(self, symbol, signals, now):
+        """
+        Args:
+            signals: DataFrame tín hiệu của symbol (signal_id, signal_type, start)
+        
+        Returns:
+            list: Dòng kết quả để upsert
+        """
+        delta = timeframe_delta(self.timeframe)
+        end = min(signals['start'].max() + delta * self.bars[self.longest], now)
+        # Cần cả nến kết thúc tại start (giá vào lệnh)
+        df = self.candles(symbol, signals['start'].min() - delta, end)
+        if df is None or df.empty:
+            return []
+        
+        # Chỉ dùng nến đã đóng
+        df = df[df.index + delta <= now]
+        if df.empty:
+            return []
+        
+        times = df.index.as_unit('ms').asi8
+        start_ms = pd.DatetimeIndex(signals['start']).as_unit('ms').asi8
+        start = np.searchsorted(times, start_ms)
+        # Nến đầu tiên phải đúng thời điểm bắt đầu và có nến ngay trước (không thiếu dữ liệu)
+        previous = np.maximum(start - 1, 0)
+        aligned = ((start > 0) & (times[np.minimum(start, len(times) - 1)] == start_ms) &
+                   (times[previous] == start_ms - int(delta.total_seconds() * 1000)))
+        close = df['close'].to_numpy()
+        entry = close[previous]
+        results = evaluate(
+            df['high'].to_numpy(), df['low'].to_numpy(), close,
+            start, entry, (signals['signal_type'] == 'BUY').to_numpy(), self.bars
+        )
+        
+        evaluated_at = datetime.utcnow()
+        rows = []
+        for name, values in results.items():
+            for i in np.flatnonzero(values['valid'] & aligned):
+                rows.append({
+                    'signal_id': signals['signal_id'].iat[i],
+                    'horizon': name,
+                    'symbol': symbol,
+                    'signal_type': signals['signal_type'].iat[i],
+                    'entry_price': float(entry[i]),
+                    'horizon_bars': self.bars[name],
+                    'return_pct': float(values['return_pct'][i]),
+                    'mfe_pct': float(values['mfe_pct'][i]),
+                    'mae_pct': float(values['mae_pct'][i]),
+                    'result': str(values['result'][i]),
+                    'bars_to_exit': int(values['bars_to_exit'][i]) if values['bars_to_exit'][i] >= 0 else None,
+                    'evaluated_at': evaluated_at,
+                })
+        return rows
+    
+    def invalid_row(self, signal_id, signal_type):
+        """Dòng kết quả 'invalid' ở mốc dài nhất cho tín hiệu không đánh giá được (không tính vào thống kê)"""
+        return {
+            'signal_id': signal_id, 'horizon': self.longest, 'symbol': signal_id.split('_')[0][:20],
+            'signal_type': signal_type, 'entry_price': 0.0, 'horizon_bars': self.bars[self.longest],
+            'return_pct': 0.0, 'mfe_pct': 0.0, 'mae_pct': 0.0, 'result': 'invalid', 'bars_to_exit': None,
+            'evaluated_at': datetime.utcnow(),
+        }
+    
+    def run(self, limit=None):
+        """
+        Đánh giá một lượt tín hiệu chưa có kết quả ở mốc dài nhất
+        
+        Returns:
+            dict: signals (số tín hiệu lấy ra), rows (số dòng kết quả đã ghi),
+                  completed (số tín hiệu đã đủ mốc dài nhất), seconds
+        """
+        started = time.perf_counter()
+        shortest = min(pd.Timedelta(name) for name in self.bars)
+        pending = self.db.get_unevaluated_signals(
+            self.longest, datetime.utcnow() - shortest.to_pytimedelta(), limit or config.OUTCOME_BATCH
+        )
+        
+        parsed = []
+        rows = []
+        for signal_id, signal_type, candle_close_at, decided_at in pending:
+            info = parse_signal_id(signal_id)
+            if info is None:
+                # Ghi kết quả cuối để không bị lấy lại mãi và chặn các lượt sau
+                rows.append(self.invalid_row(signal_id, signal_type))
+                continue
+            symbol, signal_time, _, context = info
+            decided = candle_close_at or decided_at
+            if decided is not None:
+                # Nến chứa thời điểm quyết định (đóng nến của lần quét -> nến vừa mở)
+                decided = pd.Timestamp(decided).tz_localize('UTC').tz_convert(VIETNAM_TZ)
+                start = floor_to_timeframe(pd.DatetimeIndex([decided]), self.timeframe)[0]
+            else:
+                start = signal_time + timeframe_delta(context)
+            parsed.append((signal_id, symbol, signal_type, start))
+        
+        if parsed:
+            signals = pd.DataFrame(parsed, columns=['signal_id', 'symbol', 'signal_type', 'start'])
+            now = self.scanner.clock.now()
+            for symbol, group in signals.groupby('symbol', sort=False):
+                rows.extend(self.evaluate_symbol(symbol, group.reset_index(drop=True), now))
+        
+        written = self.db.upsert_outcomes(rows) if rows else 0
+        completed = sum(1 for row in rows if row['horizon'] == self.longest) if written else 0
+        return {'signals': len(pending), 'rows': written, 'completed': completed,
+                'seconds': time.perf_counter() - started}
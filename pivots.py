@@ -0,0 +1,64 @@
+"""
+Kernel tìm pivot (fractal) dùng chung cho S/R Channel và phân kỳ CVD
+
+Logic giống ta.pivothigh / ta.pivotlow của TradingView:
+- Pivot High tại i: cao hơn hoặc bằng `left` nến bên trái và cao hơn hẳn `right` nến bên phải
+- Pivot Low tại i: thấp hơn hoặc bằng `left` nến bên trái và thấp hơn hẳn `right` nến bên phải
+
+Vector hóa bằng numpy: O(n * (left + right)) phép so sánh trên mảng,
+không vòng lặp Python theo từng nến.
+"""
+
+import numpy as np
+
+
+def pivot_high_mask(values, left, right=None):
+    """
+    Đánh dấu các Pivot High
+    
+    Args:
+        values: Mảng giá trị (ví dụ giá high)
+        left: Số nến bên trái
+        right: Số nến bên phải (mặc định bằng left)
+    
+    Returns:
+        ndarray[bool]: True tại nến là Pivot High
+    """
+    return _pivot_mask(np.asarray(values, dtype=float), left, left if right is None else right, True)
+
+
+def pivot_low_mask(values, left, right=None):
+    """
+    Đánh dấu các Pivot Low
+    
+    Args:
+        values: Mảng giá trị (ví dụ giá low)
+        left: Số nến bên trái
+        right: Số nến bên phải (mặc định bằng left)
+    
+    Returns:
+        ndarray[bool]: True tại nến là Pivot Low
+    """
+    return _pivot_mask(np.asarray(values, dtype=float), left, left if right is None else right, False)
+
+
+def _pivot_mask(values, left, right, is_high):
+    n = len(values)
+    mask = np.zeros(n, dtype=bool)
+    if n < left + right + 1:
+        return mask
+    
+    # Các nến có đủ left nến trái và right nến phải
+    center = values[left:n - right]
+    valid = np.ones(len(center), dtype=bool)
+    
+    for j in range(1, left + 1):
+        neighbor = values[left - j:n - right - j]
+        valid &= (center >= neighbor) if is_high else (center <= neighbor)
+    
+    for j in range(1, right + 1):
+        neighbor = values[left + j:n - right + j]
+        valid &= (center > neighbor) if is_high else (center < neighbor)
+    
+    mask[left:n - right] = valid
+    return mask
@@ -0,0 +1,264 @@
+"""
+Cảnh báo giá của người dùng ("báo khi ETH chạm 3200", "khi giá vào vùng 3200-3250")
+
+Mỗi symbol giữ một mảng ngưỡng giá đã sắp xếp (kèm id cảnh báo tương ứng).
+Cảnh báo một mức giá có một ngưỡng; cảnh báo vùng có 2 ngưỡng là 2 biên -
+giá vào vùng từ bên ngoài phải đi qua một trong hai biên.
+
+Giá đi liên tục giữa 2 lần xét nên mọi ngưỡng bị chạm nằm trong khoảng
+[min(giá đóng trước, low), max(giá đóng trước, high)] của các nến mới. Tìm
+bằng bisect: O(log n + số cảnh báo kích hoạt) mỗi symbol, không duyệt mọi
+cảnh báo. Nến lấy từ trạng thái scanner của khung nhỏ nhất (cùng dữ liệu lần
+quét đã tải), symbol chưa được quét ở nến này thì tải bổ sung qua kho nến.
+"""
+
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+
+from candle_store import closed_candles, floor_to_timeframe, timeframe_delta
+
+
+class AlertIndex:
+    """
+    Chỉ mục ngưỡng giá: symbol -> (mảng ngưỡng tăng dần, mảng id cảnh báo cùng vị trí)
+    """
+    
+    def __init__(self, alerts=()):
+        """
+        Args:
+            alerts: Các cảnh báo ban đầu [(id, chat_id, symbol, price_low, price_high)]
+        """
+        self.load(alerts)
+    
+    def load(self, alerts):
+        """Dựng lại toàn bộ chỉ mục"""
+        self.alerts = {}
+        entries = {}
+        for alert_id, chat_id, symbol, low, high in alerts:
+            self.alerts[alert_id] = (chat_id, symbol, low, high)
+            for price in self._thresholds(low, high):
+                entries.setdefault(symbol, []).append((price, alert_id))
+        
+        self.prices = {}
+        self.ids = {}
+        for symbol, values in entries.items():
+            values.sort()
+            self.prices[symbol] = [price for price, _ in values]
+            self.ids[symbol] = [alert_id for _, alert_id in values]
+    
+    @staticmethod
+    def _thresholds(low, high):
+        return (low,) if low == high else (low, high)
+    
+    def add(self, alert_id, chat_id, symbol, low, high):
+        self.alerts[alert_id] = (chat_id, symbol, low, high)
+        prices = self.prices.setdefault(symbol, [])
+        ids = self.ids.setdefault(symbol, [])
+        for price in self._thresholds(low, high):
+            i = bisect_right(prices, price)
+            prices.insert(i, price)
+            ids.insert(i, alert_id)
+    
+    def remove(self, alert_id):
+        """Bỏ cảnh báo (đã kích hoạt hoặc người dùng xóa)"""
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return
+        _, symbol, low, high = alert
+        prices, ids = self.prices[symbol], self.ids[symbol]
+        for price in self._thresholds(low, high):
+            i = bisect_left(prices, price)
+            while i < len(prices) and prices[i] == price:
+                if ids[i] == alert_id:
+                    del prices[i], ids[i]
+                    break
+                i += 1
+        if not prices:
+            del self.prices[symbol], self.ids[symbol]
+    
+    def crossed(self, symbol, low, high):
+        """
+        Các cảnh báo có ngưỡng trong [low, high]
+        
+        Returns:
+            dict: id -> ngưỡng bị chạm (cảnh báo vùng: biên gặp trước theo giá tăng dần)
+        """
+        prices = self.prices.get(symbol)
+        if not prices:
+            return {}
+        ids = self.ids[symbol]
+        hits = {}
+        for i in range(bisect_left(prices, low), bisect_right(prices, high)):
+            hits.setdefault(ids[i], prices[i])
+        return hits
+    
+    def __contains__(self, symbol):
+        return symbol in self.prices
+    
+    def symbols(self):
+        return set(self.prices)
+    
+    def __len__(self):
+        return len(self.alerts)
+
+
+class PriceAlertEngine:
+    """
+    Xét cảnh báo giá theo nến đã đóng của khung nhỏ nhất mà scanner quét
+    
+    Cảnh báo mới chưa vào chỉ mục: nến chứa thời điểm tạo có cả giá trước khi
+    tạo nên cảnh báo chỉ xét từ nến mở sau thời điểm tạo, tính từ giá lúc tạo.
+    Xét xong lần đầu (không kích hoạt) thì vào chỉ mục chung của symbol.
+    """
+    
+    def __init__(self, scanner, alerts=()):
+        """
+        Args:
+            scanner: SignalScanner (trạng thái chỉ báo + kho nến)
+            alerts: Các cảnh báo đang chờ [(id, chat_id, symbol, price_low, price_high, created_at, created_price)]
+        """
+        self.scanner = scanner
+        self.index = AlertIndex()
+        self.timeframe = scanner.timeframes[0]
+        
+        # Cảnh báo chưa xét lần đầu: id -> (chat_id, symbol, low, high, nến đầu tiên được xét, giá lúc tạo)
+        self.pending = {}
+        self.pending_by_symbol = {}
+        
+        # symbol -> (open time nến cuối đã xét, giá đóng nến đó)
+        self.last_seen = {}
+        self.load(alerts)
+    
+    def load(self, alerts):
+        """
+        Đồng bộ với các cảnh báo đang chờ trong database
+        
+        Cảnh báo đã biết giữ nguyên trạng thái; cảnh báo mới (worker khác tạo,
+        hoặc mới khởi động) chờ xét lần đầu như khi vừa /alert.
+        """
+        alerts = {alert[0]: alert for alert in alerts}
+        self.index.load([(alert_id, *alert) for alert_id, alert in self.index.alerts.items() if alert_id in alerts])
+        for alert_id in [i for i in self.pending if i not in alerts]:
+            self._pop_pending(alert_id)
+        for alert_id, alert in alerts.items():
+            if alert_id not in self.index.alerts and alert_id not in self.pending:
+                self.add(*alert)
+        self._forget_unused()
+    
+    def add(self, alert_id, chat_id, symbol, low, high, created_at, created_price=None):
+        """
+        Args:
+            created_at: Thời điểm tạo (datetime có múi giờ, hoặc UTC không múi giờ như cột DateTime)
+            created_price: Giá lúc tạo (None = giá đóng nến trước nến đầu tiên được xét)
+        """
+        created_at = pd.Timestamp(created_at)
+        if created_at.tzinfo is None:
+            created_at = created_at.tz_localize('UTC')
+        first = floor_to_timeframe(pd.DatetimeIndex([created_at]), self.timeframe)[0] + timeframe_delta(self.timeframe)
+        self.pending[alert_id] = (chat_id, symbol, low, high, first, created_price)
+        self.pending_by_symbol.setdefault(symbol, set()).add(alert_id)
+    
+    def remove(self, alert_ids):
+        for alert_id in alert_ids:
+            self._pop_pending(alert_id)
+            self.index.remove(alert_id)
+        self._forget_unused()
+    
+    def _pop_pending(self, alert_id):
+        alert = self.pending.pop(alert_id, None)
+        if alert is not None:
+            ids = self.pending_by_symbol[alert[1]]
+            ids.discard(alert_id)
+            if not ids:
+                del self.pending_by_symbol[alert[1]]
+        return alert
+    
+    def _forget_unused(self):
+        # Cảnh báo mới sau này xét từ lúc tạo, không cần mốc đã xét cũ
+        for symbol in [s for s in self.last_seen if s not in self]:
+            del self.last_seen[symbol]
+    
+    def alert(self, alert_id):
+        """(chat_id, symbol, low, high) của cảnh báo (trong chỉ mục hoặc chưa xét lần đầu)"""
+        alert = self.index.alerts.get(alert_id) or self.pending.get(alert_id)
+        return alert[:4] if alert is not None else None
+    
+    def chat_alerts(self, chat_id):
+        return [alert_id for alert_id in (*self.index.alerts, *self.pending) if self.alert(alert_id)[0] == chat_id]
+    
+    def __contains__(self, symbol):
+        return symbol in self.index or symbol in self.pending_by_symbol
+    
+    def symbols(self):
+        return self.index.symbols() | set(self.pending_by_symbol)
+    
+    def __len__(self):
+        return len(self.index) + len(self.pending)
+    
+    def candles(self, symbol, as_of):
+        """
+        Nến đã đóng tại as_of của khung cảnh báo (chạy ở thread riêng)
+        
+        Dùng nến lần quét vừa tính; symbol bị lịch bỏ qua hoặc ngoài watchlist
+        thì chỉ lấy nến qua kho nến (tải các nến còn thiếu, không tính chỉ báo).
+        
+        Returns:
+            DataFrame hoặc None nếu chưa có dữ liệu (sàn chưa chốt nến)
+        """
+        latest = floor_to_timeframe(pd.DatetimeIndex([as_of]), self.timeframe)[0] - timeframe_delta(self.timeframe)
+        state = self.scanner.states.get((symbol, self.timeframe))
+        if state is not None and state.df.index[-1] >= latest:
+            return state.df
+        
+        df = self.scanner.load_candles(symbol, {self.timeframe})[self.timeframe]
+        return closed_candles(df, self.timeframe, as_of) if df is not None else None
+    
+    def update(self, symbol, df):
+        """
+        Xét các nến chưa xét của symbol
+        
+        Lần đầu (mới khởi động) chỉ xét nến cuối, tính từ giá đóng nến trước đó.
+        Cảnh báo chưa xét lần đầu chỉ xét các nến mở sau thời điểm tạo.
+        
+        Returns:
+            list: [(id cảnh báo, ngưỡng bị chạm)]
+        """
+        if df is None or df.empty:
+            return []
+        last = self.last_seen.get(symbol)
+        if last is None:
+            new = df.iloc[-1:]
+            prev_close = float(df['close'].iloc[-2]) if len(df) > 1 else float(new['open'].iloc[0])
+        else:
+            new = df[df.index > last[0]]
+            prev_close = last[1]
+        if new.empty:
+            return []
+        
+        self.last_seen[symbol] = (new.index[-1], float(new['close'].iloc[-1]))
+        low = min(prev_close, float(new['low'].min()))
+        high = max(prev_close, float(new['high'].max()))
+        hits = list(self.index.crossed(symbol, low, high).items())
+        
+        for alert_id in list(self.pending_by_symbol.get(symbol, ())):
+            chat_id, _, alert_low, alert_high, first, created_price = self.pending[alert_id]
+            # Không xét nến trước lần xét cuối của symbol (khởi động lại: chỉ nến cuối như chỉ mục)
+            start = max(first, new.index[0])
+            candles = new[new.index >= start]
+            if candles.empty:
+                continue
+            
+            base = created_price if start == first and created_price is not None else (
+                prev_close if start == new.index[0] else float(df['close'][df.index < start].iloc[-1])
+            )
+            range_low = min(base, float(candles['low'].min()))
+            range_high = max(base, float(candles['high'].max()))
+            touched = [p for p in AlertIndex._thresholds(alert_low, alert_high) if range_low <= p <= range_high]
+            
+            # Đã xét lần đầu -> vào chỉ mục chung (cảnh báo kích hoạt được bỏ sau khi đánh dấu trong database)
+            self._pop_pending(alert_id)
+            self.index.add(alert_id, chat_id, symbol, alert_low, alert_high)
+            if touched:
+                hits.append((alert_id, touched[0]))
+        return hits
@@ -0,0 +1,120 @@
+"""
+Lịch quét thông minh - Bỏ qua symbol CHƯA THỂ có tín hiệu
+
+%K là SMA của %K thô (0-100), %D là SMA của %K nên trong vài nến tới
+Stoch chỉ dịch chuyển được một lượng giới hạn. Từ biên này tính được nến
+SỚM NHẤT mà điều kiện Stoch của _check_signal_stoch_sr có thể thỏa.
+Trước thời điểm đó không cần lấy dữ liệu hay tính toán symbol.
+"""
+
+import numpy as np
+import pandas as pd
+from candle_store import floor_to_timeframe, timeframe_delta
+import config
+
+
+class StochSkipScheduler:
+    """Tính thời điểm quét tiếp theo cho từng symbol dựa trên biên Stoch"""
+    
+    def __init__(self, stoch, horizon=None, entry_timeframe='15m', context_timeframe='1h'):
+        """
+        Args:
+            stoch: StochasticIndicator dùng để tính biên
+            horizon: Số nến khung vào lệnh tối đa được bỏ qua
+            entry_timeframe: Khung vào lệnh (ví dụ '15m')
+            context_timeframe: Khung bối cảnh (ví dụ '1h')
+        """
+        self.stoch = stoch
+        self.horizon = horizon if horizon is not None else config.SKIP_SCHEDULER_HORIZON
+        self.entry_timeframe = entry_timeframe
+        self.context_timeframe = context_timeframe
+        self.entry_delta = timeframe_delta(entry_timeframe)
+        self.context_delta = timeframe_delta(context_timeframe)
+        
+        # symbol -> thời điểm đóng nến khung vào lệnh cần quét lại
+        self.next_check = {}
+    
+    def is_due(self, symbol, now=None):
+        """
+        Kiểm tra symbol đã đến lúc quét chưa
+        
+        Args:
+            symbol: Mã coin
+            now: Thời điểm hiện tại (mặc định: giờ hệ thống)
+        
+        Returns:
+            bool: True nếu cần quét
+        """
+        next_time = self.next_check.get(symbol)
+        if next_time is None:
+            return True
+        
+        if now is None:
+            now = pd.Timestamp.now(tz=config.TIMEZONE)
+        
+        now = pd.DatetimeIndex([pd.Timestamp(now)])
+        return floor_to_timeframe(now, self.entry_timeframe)[0] >= next_time
+    
+    def update(self, symbol, df_entry, df_context):
+        """
+        Cập nhật thời điểm quét tiếp theo sau khi đã quét symbol
+        
+        Args:
+            symbol: Mã coin
+            df_entry: DataFrame khung vào lệnh vừa quét (chỉ nến đã đóng)
+            df_context: DataFrame khung bối cảnh vừa quét (chỉ nến đã đóng)
+        
+        Returns:
+            Timestamp: Thời điểm đóng nến khung vào lệnh cần quét lại (None = quét mọi nến)
+        """
+        context_steps = int(self.horizon * self.entry_delta // self.context_delta) + 2
+        bounds_entry = self.stoch.forecast_bounds(df_entry, self.horizon, known_bars=len(df_entry))
+        bounds_context = self.stoch.forecast_bounds(df_context, context_steps, known_bars=len(df_context))
+        
+        if bounds_entry is None or bounds_context is None:
+            self.next_check.pop(symbol, None)
+            return None
+        
+        # Bước 0 của khung bối cảnh = nến đã đóng hiện tại (giá trị đã biết)
+        k_context, d_context = self.stoch.calculate(df_context)
+        context_d_min = np.concatenate(([d_context.iloc[-1]], bounds_context['d_min']))
+        context_k_max = np.concatenate(([k_context.iloc[-1]], bounds_context['k_max']))
+        
+        last_entry = df_entry.index[-1]
+        last_context = df_context.index[-1]
+        
+        # Lần quét tại scan_time đánh giá nến khung vào lệnh mở lúc scan_time - 1 nến
+        # và nến khung bối cảnh đã đóng gần nhất
+        scan_times = pd.date_range(last_entry + 2 * self.entry_delta, periods=self.horizon, freq=self.entry_delta)
+        context_times = floor_to_timeframe(scan_times, self.context_timeframe) - self.context_delta
+        
+        next_time = last_entry + (self.horizon + 2) * self.entry_delta
+        
+        for scan_time, context_time in zip(scan_times, context_times):
+            n_entry = (scan_time - self.entry_delta - last_entry) // self.entry_delta
+            n_context = (context_time - last_context) // self.context_delta
+            
+            # Ngoài phạm vi biên -> không chứng minh được, quét bình thường
+            if not (0 <= n_context <= context_steps):
+                next_time = scan_time
+                break
+            
+            long_possible = (
+                context_d_min[n_context] < config.STOCH_H1_THRESHOLD_LOW and
+                bounds_entry['d_min'][n_entry - 1] < config.STOCH_OVERSOLD
+            )
+            short_possible = (
+                context_k_max[n_context] > config.STOCH_H1_THRESHOLD_HIGH and
+                bounds_entry['k_max'][n_entry - 1] > config.STOCH_OVERBOUGHT
+            )
+            
+            if long_possible or short_possible:
+                next_time = scan_time
+                break
+        
+        self.next_check[symbol] = next_time
+        return next_time
+    
+    def forget(self, symbol):
+        """Xóa lịch của symbol (quét lại ở lần tới)"""
+        self.next_check.pop(symbol, None)
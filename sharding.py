@@ -0,0 +1,140 @@
+"""
+Chia symbol giữa nhiều worker quét - consistent hashing + heartbeat PostgreSQL
+
+Mỗi worker ghi heartbeat vào bảng worker_heartbeats (cùng DATABASE_URL).
+Các worker còn sống (heartbeat trong WORKER_HEARTBEAT_TTL giây) được đặt lên
+hash ring (md5, SHARD_VIRTUAL_NODES virtual node mỗi worker); symbol thuộc
+worker đứng sau nó trên ring:
+- Thêm/bớt worker chỉ chuyển ~1/N symbol, các symbol khác giữ nguyên worker
+- Worker chết -> hết TTL thì các worker còn lại tự chia lại symbol của nó
+- Worker có ID nhỏ nhất là leader: dọn heartbeat cũ và nhận lệnh Telegram
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key):
+    """Hash ổn định giữa các process/máy (không dùng hash() của Python)"""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Hash ring với virtual node
+    """
+    
+    def __init__(self, workers=(), virtual_nodes=100):
+        """
+        Args:
+            workers: Danh sách worker_id
+            virtual_nodes: Số điểm trên ring mỗi worker (càng nhiều càng chia đều)
+        """
+        self.workers = sorted(workers)
+        points = sorted(
+            (_hash(f"{worker}#{i}"), worker)
+            for worker in self.workers
+            for i in range(virtual_nodes)
+        )
+        self.keys = [point[0] for point in points]
+        self.owners = [point[1] for point in points]
+    
+    def owner(self, key):
+        """Worker sở hữu key (None nếu ring rỗng)"""
+        if not self.keys:
+            return None
+        pos = bisect.bisect_right(self.keys, _hash(key)) % len(self.keys)
+        return self.owners[pos]
+
+
+class ShardCoordinator:
+    """
+    Quản lý heartbeat và phần symbol của worker hiện tại
+    """
+    
+    def __init__(self, db, worker_id=None, ttl=None, virtual_nodes=None):
+        """
+        Args:
+            db: DatabaseManager
+            worker_id: ID worker (mặc định config.WORKER_ID hoặc hostname-pid)
+            ttl: Số giây không heartbeat thì coi worker đã chết
+            virtual_nodes: Số virtual node mỗi worker
+        """
+        self.db = db
+        self.hostname = socket.gethostname()
+        self.worker_id = worker_id or config.WORKER_ID or f"{self.hostname}-{os.getpid()}"
+        self.ttl = ttl or config.WORKER_HEARTBEAT_TTL
+        self.virtual_nodes = virtual_nodes or config.SHARD_VIRTUAL_NODES
+        
+        self.ring = HashRing([self.worker_id], self.virtual_nodes)
+        self.last_heartbeat = None
+    
+    @property
+    def workers(self):
+        return self.ring.workers
+    
+    @property
+    def is_leader(self):
+        """Worker có ID nhỏ nhất trong các worker còn sống"""
+        return bool(self.workers) and self.workers[0] == self.worker_id
+    
+    @property
+    def is_alive(self):
+        """Heartbeat gần nhất còn trong TTL (nếu không, worker khác đã nhận symbol của mình)"""
+        return self.last_heartbeat is not None and time.monotonic() - self.last_heartbeat < self.ttl
+    
+    def refresh(self):
+        """
+        Gửi heartbeat và cập nhật danh sách worker
+        
+        Returns:
+            bool: True nếu danh sách worker thay đổi
+        """
+        if self.db.heartbeat(self.worker_id, self.hostname):
+            self.last_heartbeat = time.monotonic()
+        
+        workers = self.db.get_live_workers(self.ttl)
+        if workers is None:
+            return False
+        
+        if self.worker_id not in workers and self.is_alive:
+            workers = sorted(workers + [self.worker_id])
+        
+        if workers == self.workers:
+            return False
+        
+        logger.info(f"Chia lại symbol: {len(workers)} worker {workers} (worker này: {self.worker_id})")
+        self.ring = HashRing(workers, self.virtual_nodes)
+        
+        if self.is_leader:
+            self.db.remove_stale_workers(self.ttl)
+        return True
+    
+    def owns(self, symbol):
+        """Symbol có thuộc worker này không"""
+        return self.is_alive and self.ring.owner(symbol) == self.worker_id
+    
+    def filter_symbols(self, symbols):
+        """
+        Lọc danh sách symbol thuộc worker này
+        
+        Returns:
+            list: Symbol worker này cần quét (rỗng nếu mất kết nối database quá TTL)
+        """
+        if not self.is_alive:
+            logger.warning(f"Worker {self.worker_id} mất heartbeat quá {self.ttl}s, tạm dừng quét")
+            return []
+        return [symbol for symbol in symbols if self.ring.owner(symbol) == self.worker_id]
+    
+    def leave(self):
+        """Rời nhóm worker (khi dừng bình thường)"""
+        self.db.remove_worker(self.worker_id)
+        self.last_heartbeat = None
@@ -0,0 +1,292 @@
+"""
+Chia bảng signal_history theo tháng và lưu trữ tín hiệu cũ
+
+PostgreSQL: signal_history là bảng partition theo RANGE (signal_time), mỗi
+tháng một partition (signal_history_pYYYYMM). Partition đã quá hạn
+SIGNAL_RETENTION_MONTHS được xuất ra file JSONL nén gzip rồi DETACH + DROP,
+không phải DELETE từng dòng. File được ghi tạm (.tmp) và chỉ đổi tên sau khi
+DROP đã commit: DETACH lỗi hoặc process chết giữa chừng không để lại dòng
+trùng ở lần lưu trữ sau. Bảng partition yêu cầu khóa unique chứa cột
+partition nên khóa chống trùng là (signal_id, signal_time) - signal_id đã
+chứa thời gian tín hiệu nên tương đương unique(signal_id).
+
+Database khác (SQLite khi chạy thử): không partition, tín hiệu quá hạn được
+xuất ra cùng định dạng file rồi xóa.
+"""
+
+import glob
+import gzip
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, select, text
+
+import config
+
+TABLE = 'signal_history'
+PARTITION_PREFIX = f'{TABLE}_p'
+
+# Index thêm vào signal_history: tên -> cột
+SIGNAL_HISTORY_INDEXES = {
+    'ix_signal_history_symbol_time': ('symbol', 'signal_time'),
+    'ix_signal_history_sent_at': ('sent_at',),
+}
+
+
+def month_start(value):
+    """Đầu tháng chứa value (datetime không múi giờ)"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """Cộng count tháng vào đầu tháng month"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def partition_month(name):
+    """signal_history_pYYYYMM -> đầu tháng (None nếu không phải partition theo tháng)"""
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m')
+    except ValueError:
+        return None
+
+
+def retention_cutoff(now=None, months=None):
+    """Tín hiệu có signal_time trước mốc này được lưu trữ"""
+    now = now or datetime.utcnow()
+    months = config.SIGNAL_RETENTION_MONTHS if months is None else months
+    return add_months(month_start(now), -months)
+
+
+def create_indexes(conn):
+    """Tạo các index ghép nếu chưa có (bảng thường hoặc bảng partition)"""
+    for name, columns in SIGNAL_HISTORY_INDEXES.items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} ({', '.join(columns)})"))
+
+
+def is_partitioned(conn):
+    """signal_history đã là bảng partition (PostgreSQL) chưa"""
+    if conn.dialect.name != 'postgresql':
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': TABLE}).first() is not None
+
+
+def list_partitions(conn, parent=TABLE):
+    """Các partition theo tháng của bảng parent: [(tên, đầu tháng)] cũ trước"""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+    ), {'table': parent}).scalars()
+    partitions = [(name, partition_month(name)) for name in rows]
+    return sorted((p for p in partitions if p[1] is not None), key=lambda p: p[1])
+
+
+def ensure_partitions(conn, start=None, months_ahead=None, parent=TABLE):
+    """
+    Tạo partition cho các tháng từ start đến hiện tại + months_ahead
+    
+    Args:
+        start: Tháng đầu tiên (mặc định tháng hiện tại)
+        parent: Bảng partition (khác TABLE khi đang chuyển đổi bảng)
+    
+    Returns:
+        int: Số partition mới tạo
+    """
+    months_ahead = config.SIGNAL_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    existing = {name for name, _ in list_partitions(conn, parent)}
+    month = month_start(start or datetime.utcnow())
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    
+    created = 0
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def _column_ddl(column, dialect):
+    if column.primary_key:
+        return f"{column.name} SERIAL NOT NULL"
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    return ddl
+
+
+def partition_table(engine, table):
+    """
+    Chuyển signal_history (bảng thường) sang bảng partition theo tháng, giữ nguyên dữ liệu
+    
+    Tạo bảng partition mới, tạo partition cho mọi tháng đã có tín hiệu, copy
+    toàn bộ dòng, rồi thay bảng cũ - tất cả trong một transaction.
+    
+    Args:
+        table: Table SQLAlchemy của signal_history (để lấy danh sách cột)
+    
+    Returns:
+        int: Số dòng đã chuyển
+    """
+    new_table = f"{TABLE}_new"
+    columns = [c.name for c in table.columns]
+    ddl = ',\n    '.join(_column_ddl(c, engine.dialect) for c in table.columns)
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE {new_table} (\n    {ddl},\n"
+            f"    PRIMARY KEY (id, signal_time),\n    UNIQUE (signal_id, signal_time)\n"
+            f") PARTITION BY RANGE (signal_time)"
+        ))
+        
+        first = conn.execute(text(f"SELECT MIN(signal_time) FROM {TABLE}")).scalar()
+        ensure_partitions(conn, start=first, parent=new_table)
+        
+        column_list = ', '.join(columns)
+        moved = conn.execute(text(
+            f"INSERT INTO {new_table} ({column_list}) SELECT {column_list} FROM {TABLE}"
+        )).rowcount
+        
+        conn.execute(text(f"DROP TABLE {TABLE}"))
+        conn.execute(text(f"ALTER TABLE {new_table} RENAME TO {TABLE}"))
+        conn.execute(text(f"ALTER SEQUENCE {new_table}_id_seq RENAME TO {TABLE}_id_seq"))
+        conn.execute(text(
+            f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)"
+        ))
+        create_indexes(conn)
+    return moved
+
+
+def _archive_path(month):
+    return os.path.join(config.SIGNAL_ARCHIVE_DIR, f"{TABLE}_{month:%Y%m}.jsonl.gz")
+
+
+def _temp_path(month):
+    return _archive_path(month) + '.tmp'
+
+
+def _write_rows(rows):
+    """
+    Ghi các dòng (đã sắp theo signal_time) vào file lưu trữ theo tháng
+    
+    File đã có (lần trước bị ngắt giữa chừng) được ghi nối thêm một gzip member.
+    
+    Returns:
+        dict: đầu tháng -> số dòng đã ghi
+    """
+    os.makedirs(config.SIGNAL_ARCHIVE_DIR, exist_ok=True)
+    written = {}
+    month = f = None
+    try:
+        for row in rows:
+            row = dict(row._mapping)
+            row_month = month_start(row['signal_time'])
+            if row_month != month:
+                if f is not None:
+                    f.close()
+                month = row_month
+                f = gzip.open(_archive_path(month), 'at', encoding='utf-8')
+            f.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+            written[month] = written.get(month, 0) + 1
+    finally:
+        if f is not None:
+            f.close()
+    return written
+
+
+def _export_partition(engine, name, path):
+    """
+    Ghi toàn bộ partition ra file (ghi đè file tạm của lần trước)
+    
+    Returns:
+        int: Số dòng đã ghi
+    """
+    count = 0
+    with engine.connect() as conn:
+        rows = conn.execution_options(stream_results=True, yield_per=config.SIGNAL_ARCHIVE_BATCH).execute(
+            text(f"SELECT * FROM {name} ORDER BY signal_time")
+        )
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(dict(row._mapping), default=str, ensure_ascii=False) + '\n')
+                count += 1
+    return count
+
+
+def _finish_interrupted(partitions):
+    """
+    File tạm của lần trước: partition đã bị xóa -> file là bản lưu trữ duy nhất,
+    đổi tên; partition còn -> bỏ (sẽ xuất lại)
+    """
+    for path in glob.glob(os.path.join(config.SIGNAL_ARCHIVE_DIR, f"{TABLE}_*.jsonl.gz.tmp")):
+        month = datetime.strptime(os.path.basename(path)[len(TABLE) + 1:][:6], '%Y%m')
+        if partition_name(month) in partitions:
+            os.remove(path)
+        else:
+            os.replace(path, _archive_path(month))
+
+
+def archive_partitions(engine, cutoff):
+    """
+    Xuất các partition trước cutoff ra file gzip rồi tách và xóa partition
+    
+    Returns:
+        int: Số dòng đã lưu trữ
+    """
+    with engine.connect() as conn:
+        partitions = list_partitions(conn)
+    
+    os.makedirs(config.SIGNAL_ARCHIVE_DIR, exist_ok=True)
+    _finish_interrupted({name for name, _ in partitions})
+    
+    archived = 0
+    for name, month in partitions:
+        if add_months(month, 1) > cutoff:
+            continue
+        count = _export_partition(engine, name, _temp_path(month))
+        
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        os.replace(_temp_path(month), _archive_path(month))
+        archived += count
+    return archived
+
+
+def archive_rows(engine, table, cutoff):
+    """
+    Database không partition: xuất các tín hiệu trước cutoff ra file gzip rồi xóa
+    
+    Args:
+        table: Table SQLAlchemy của signal_history (để đọc đúng kiểu cột)
+    
+    Returns:
+        int: Số dòng đã lưu trữ
+    """
+    expired = table.c.signal_time < cutoff
+    with engine.connect() as conn:
+        rows = conn.execution_options(stream_results=True, yield_per=config.SIGNAL_ARCHIVE_BATCH).execute(
+            select(table).where(expired).order_by(table.c.signal_time)
+        )
+        archived = sum(_write_rows(rows).values())
+    
+    if archived:
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(expired))
+    return archived
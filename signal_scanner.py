@@ -2,7 +2,10 @@
 Scanner tín hiệu - Stoch + S/R
 Logic S/R từ TradingView (support_resistance_channel.py)
 
-ĐIỀU KIỆN STOCH (SIẾT CHẶT M15):
+Mỗi chiến lược là một cặp (khung vào lệnh, khung bối cảnh) trong
+config.STRATEGY_PAIRS, mặc định (M15, H1).
+
+ĐIỀU KIỆN STOCH (SIẾT CHẶT KHUNG VÀO LỆNH):
 - LONG: H1 %D < 25 & M15 %D < 20
 - SHORT: H1 %K > 75 & M15 %K > 80
 
@@ -12,56 +15,175 @@ LOGIC CHÍNH XÁC - CHECK HIGH/LOW:
 """
 
 import pandas as pd
-import ccxt
 import pytz
 from datetime import datetime
 from stochastic_indicator import StochasticIndicator
+from cvd_indicator import CVDIndicator
+from divergence import DivergenceDetector
 from support_resistance import SupportResistanceChannel
+from scan_scheduler import StochSkipScheduler
+from candle_store import CandleStore, closed_candles, floor_to_timeframe, timeframe_delta, timeframe_label
+from close_scheduler import ExchangeClock
+from exchange_client import get_exchange, get_fetcher, get_governor
 import config
 
 VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
 
+DEFAULT_PAIR = ('15m', '1h')
+
+# Các cột klines của Binance
+KLINE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_volume', 'trades',
+    'taker_buy_volume', 'taker_buy_quote_volume', 'ignore'
+]
+
+
+class TimeframeState:
+    """
+    Trạng thái chỉ báo của một (symbol, timeframe) tại một lần quét
+    
+    Dùng chung cho mọi cặp chiến lược có cùng timeframe. S/R chỉ được
+    tính khi có cặp cần đến (điều kiện Stoch đã thỏa).
+    """
+    
+    def __init__(self, timeframe, df, stoch_k, stoch_d, sr_calculator):
+        self.timeframe = timeframe
+        self.df = df
+        self.stoch_k = stoch_k
+        self.stoch_d = stoch_d
+        self._sr_calculator = sr_calculator
+        self._sr = None
+        
+        # CVD và phân kỳ giá/CVD của nến đã đóng gần nhất (None nếu tắt CVD)
+        self.cvd = None
+        self.divergence = None
+        
+        # Thời điểm nhận đủ dữ liệu nến (giờ server, epoch giây)
+        self.received_at = None
+    
+    @property
+    def sr(self):
+        """Kết quả S/R (tính lần đầu khi cần)"""
+        if self._sr is None:
+            self._sr = self._sr_calculator.analyze(self.df)
+        return self._sr
+
 
 class SignalScanner:
     """Lớp quét tín hiệu - STOCH + S/R"""
     
-    def __init__(self):
-        """Khởi tạo scanner"""
-        self.exchange = ccxt.binance({'enableRateLimit': True})
+    def __init__(self, pairs=None):
+        """
+        Khởi tạo scanner
+        
+        Args:
+            pairs: Danh sách cặp (khung vào lệnh, khung bối cảnh),
+                mặc định config.STRATEGY_PAIRS
+        """
         self.stoch = StochasticIndicator(
             k_period=config.STOCH_K_PERIOD,
             k_smooth=config.STOCH_K_SMOOTH,
             d_smooth=config.STOCH_D_SMOOTH
         )
-        # S/R cho H1
-        self.sr = SupportResistanceChannel(
-            pivot_period=config.SR_PIVOT_PERIOD,
-            channel_width_percent=config.SR_CHANNEL_WIDTH_PERCENT,
-            loopback_period=config.SR_LOOPBACK_PERIOD,
-            min_strength=config.SR_MIN_STRENGTH,
-            max_channels=config.SR_MAX_CHANNELS
-        )
-        # S/R cho M15
-        self.sr_m15 = SupportResistanceChannel(
-            pivot_period=config.SR_M15_PIVOT_PERIOD,
-            channel_width_percent=config.SR_M15_CHANNEL_WIDTH_PERCENT,
-            loopback_period=config.SR_M15_LOOPBACK_PERIOD,
-            min_strength=config.SR_M15_MIN_STRENGTH,
-            max_channels=config.SR_M15_MAX_CHANNELS
-        )
+        self.pairs = [tuple(p) for p in (pairs or config.STRATEGY_PAIRS)]
+        
+        # Mọi timeframe dùng trong các cặp, từ nhỏ đến lớn
+        self.timeframes = sorted({tf for pair in self.pairs for tf in pair}, key=timeframe_delta)
+        
+        # S/R cho từng timeframe (mỗi timeframe một bộ tham số)
+        self.sr_by_timeframe = {
+            tf: SupportResistanceChannel(**config.SR_TIMEFRAME_PARAMS.get(tf, config.SR_DEFAULT_PARAMS))
+            for tf in self.timeframes
+        }
+        
+        # Lịch bỏ qua symbol chưa thể có tín hiệu (mỗi cặp một lịch)
+        self.skip_schedulers = {}
+        if config.SKIP_SCHEDULER_ENABLED:
+            self.skip_schedulers = {
+                pair: StochSkipScheduler(self.stoch, entry_timeframe=pair[0], context_timeframe=pair[1])
+                for pair in self.pairs
+            }
+        
+        # Kho nến: khung lớn dựng từ khung nhỏ, chỉ tải phần còn thiếu
+        self.store = CandleStore() if config.CANDLE_STORE_ENABLED else None
+        
+        # CVD cập nhật từng nến: (symbol, timeframe) -> CVDState
+        self.cvd = None
+        if config.CVD_ENABLED:
+            self.cvd = CVDIndicator(period=config.CVD_PERIOD, cumulative_mode=config.CVD_CUMULATIVE_MODE)
+        self.cvd_states = {}
+        
+        # Phân kỳ giá/CVD từng nến: (symbol, timeframe) -> DivergenceTracker
+        self.divergence = None
+        if config.CVD_ENABLED and config.CVD_DIVERGENCE_ENABLED:
+            self.divergence = DivergenceDetector(
+                fractal_period=config.CVD_DIVERGENCE_PERIOD,
+                min_swing_distance=config.CVD_MIN_SWING_DISTANCE
+            )
+        self.divergence_trackers = {}
+        
+        # Delta chính xác từ aggTrades (TradeBucketStore, gắn bởi bot khi bật)
+        self.trade_buckets = None
+        
+        # Trạng thái chỉ báo của lần quét gần nhất: (symbol, timeframe) -> TimeframeState
+        self.states = {}
+        
+        # Giờ server Binance (đồng bộ bởi CloseScheduler của bot)
+        self.clock = ExchangeClock()
+        
+        # Ngân sách request weight theo phút của server
+        self.governor = get_governor()
+        self.governor.clock = self.clock.time
+        
+        # Gọi klines qua nhiều host API, gửi bản dự phòng khi host chậm
+        self.fetcher = get_fetcher()
+    
+    @property
+    def exchange(self):
+        """Kết nối Binance dùng chung (ccxt được import ở lần dùng đầu)"""
+        return get_exchange()
+    
+    def _pairs_for(self, closed_timeframes):
+        """Các cặp có khung vào lệnh vừa đóng nến (None = tất cả)"""
+        if closed_timeframes is None:
+            return list(self.pairs)
+        return [pair for pair in self.pairs if pair[0] in closed_timeframes]
     
-    def fetch_data(self, symbol, timeframe, limit=100):
-        """Lấy dữ liệu từ Binance"""
+    def is_due(self, symbol, closed_timeframes=None, now=None):
+        """Kiểm tra symbol có cặp nào cần quét ở nến này không"""
+        for pair in self._pairs_for(closed_timeframes):
+            scheduler = self.skip_schedulers.get(pair)
+            if scheduler is None or scheduler.is_due(symbol, now):
+                return True
+        return False
+    
+    def fetch_data(self, symbol, timeframe, limit=100, start_time=None):
+        """
+        Lấy dữ liệu từ Binance (giữ cả taker-buy volume để tính CVD)
+        
+        Args:
+            start_time: Open time nến đầu tiên (ms) - None = các nến mới nhất
+        """
         try:
-            if '/' not in symbol:
-                symbol = symbol[:-4] + '/' + symbol[-4:]
-            
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            params = {
+                'symbol': symbol.replace('/', ''),
+                'interval': timeframe,
+                'limit': limit
+            }
+            if start_time is not None:
+                params['startTime'] = int(start_time)
+            if self.fetcher is not None:
+                klines = self.fetcher.request('publicGetKlines', params)
+            else:
+                klines = self.exchange.publicGetKlines(params)
+            df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
+            df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume', 'taker_buy_volume']]
             
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+            df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'), unit='ms', utc=True)
             df['timestamp'] = df['timestamp'].dt.tz_convert(VIETNAM_TZ)
             df.set_index('timestamp', inplace=True)
+            df = df.astype(float)
             
             return df
             
@@ -69,191 +191,446 @@ class SignalScanner:
             print(f"Lỗi khi lấy dữ liệu {symbol}: {str(e)}")
             return None
     
-    def check_signal(self, symbol):
-        """Kiểm tra tín hiệu Stoch + S/R"""
+    def fetch_history(self, symbol, timeframe, start, end):
+        """
+        Lấy nến lịch sử trong khoảng [start, end) - mỗi request tối đa HISTORY_PAGE_LIMIT nến
+        
+        Args:
+            start, end: Timestamp có timezone
+        
+        Returns:
+            DataFrame hoặc None nếu lỗi
+        """
+        frames = []
+        start_ms = start.value // 10**6
+        end_ms = end.value // 10**6
+        delta_ms = timeframe_delta(timeframe).value // 10**6
+        
+        while start_ms < end_ms:
+            df = self.fetch_data(symbol, timeframe, limit=config.HISTORY_PAGE_LIMIT, start_time=start_ms)
+            if df is None:
+                return None
+            if df.empty:
+                break
+            frames.append(df)
+            start_ms = df.index[-1].value // 10**6 + delta_ms
+            if len(df) < config.HISTORY_PAGE_LIMIT:
+                break
+        
+        if not frames:
+            return None
+        df = pd.concat(frames)
+        return df[~df.index.duplicated(keep='last')]
+    
+    def get_candles(self, symbol, timeframe, limit):
+        """
+        Lấy nến từ kho, chỉ tải từ Binance các nến còn thiếu
+        
+        Returns:
+            tuple: (DataFrame limit nến cuối, open time nến đầu tiên vừa cập nhật)
+        """
+        stored = self.store.get(symbol, timeframe)
+        fetch_limit = limit
+        
+        if stored is not None and len(stored) >= limit:
+            now = self.clock.now()
+            current_open = floor_to_timeframe(pd.DatetimeIndex([now]), timeframe)[0]
+            missing = (current_open - stored.index[-1]) // timeframe_delta(timeframe)
+            
+            # Tải lại cả nến cuối đã lưu (có thể còn đang hình thành)
+            if missing < limit:
+                fetch_limit = max(int(missing), 0) + 2
+        
+        df = self.fetch_data(symbol, timeframe, limit=fetch_limit)
+        if df is None or df.empty:
+            return None, None
+        
+        self.store.merge(symbol, timeframe, df)
+        return self.store.get(symbol, timeframe, limit), df.index[0]
+    
+    def get_derived_candles(self, symbol, base_timeframe, timeframe, since, limit):
+        """
+        Lấy nến khung lớn dựng từ khung nhỏ, backfill từ Binance khi thiếu lịch sử
+        
+        Args:
+            symbol: Mã coin
+            base_timeframe: Khung nhỏ (ví dụ '15m')
+            timeframe: Khung lớn (ví dụ '1h')
+            since: Open time nến khung nhỏ đầu tiên vừa cập nhật
+            limit: Số nến cần lấy
+        """
+        stored = self.store.get(symbol, timeframe)
+        
+        if stored is None or len(stored) < limit or \
+                not self.store.derive(symbol, base_timeframe, timeframe, since):
+            df = self.fetch_data(symbol, timeframe, limit=limit)
+            if df is None or df.empty:
+                return None
+            self.store.merge(symbol, timeframe, df)
+        
+        return self.store.get(symbol, timeframe, limit)
+    
+    def load_candles(self, symbol, timeframes):
+        """
+        Lấy nến cho các timeframe - mỗi timeframe đúng một lần
+        
+        Chỉ khung nhỏ nhất được tải từ Binance, các khung là bội số của
+        nó được dựng lại từ kho nến.
+        
+        Returns:
+            dict: timeframe -> DataFrame (None nếu lỗi)
+        """
+        timeframes = sorted(timeframes, key=timeframe_delta)
+        limits = {tf: config.CANDLES_LIMITS.get(tf, config.CANDLES_LIMIT) for tf in timeframes}
+        
+        if self.store is None:
+            return {tf: self.fetch_data(symbol, tf, limit=limits[tf]) for tf in timeframes}
+        
+        base = timeframes[0]
+        base_delta = timeframe_delta(base)
+        candles = {}
+        candles[base], since = self.get_candles(symbol, base, limits[base])
+        
+        for tf in timeframes[1:]:
+            if candles[base] is not None and timeframe_delta(tf) % base_delta == pd.Timedelta(0):
+                candles[tf] = self.get_derived_candles(symbol, base, tf, since, limits[tf])
+            else:
+                candles[tf] = self.get_candles(symbol, tf, limits[tf])[0]
+        
+        return candles
+    
+    def update_cvd(self, symbol, timeframe, df):
+        """
+        Cập nhật CVD và phân kỳ giá/CVD bằng các nến vừa đóng - O(1) mỗi nến mới
+        
+        Args:
+            df: DataFrame các nến đã đóng
+        
+        Returns:
+            tuple: (CVD của nến đã đóng gần nhất, danh sách phân kỳ tại nến đó)
+            - (None, None) nếu tắt CVD
+        """
+        if self.cvd is None or 'taker_buy_volume' not in df.columns:
+            return None, None
+        
+        if df.empty:
+            return None, None
+        
+        key = (symbol, timeframe)
+        state = self.cvd_states.get(key)
+        tracker = self.divergence_trackers.get(key)
+        
+        # Lần đầu hoặc có khoảng trống dữ liệu -> tính lại từ đầu chuỗi nến
+        if state is None or state.last_time is None or state.last_time < df.index[0]:
+            state = self.cvd.create_state()
+            self.cvd_states[key] = state
+            tracker = self.divergence.create_tracker() if self.divergence else None
+            self.divergence_trackers[key] = tracker
+        else:
+            df = df[df.index > state.last_time]
+        
+        deltas = CVDIndicator.delta(df).to_numpy()
+        
+        # Symbol có stream aggTrades -> dùng delta theo từng lệnh khớp
+        if self.trade_buckets is not None and timeframe == self.trade_buckets.timeframe:
+            deltas = self.trade_buckets.delta_for(symbol, df.index, deltas)
+        
+        highs = df['high'].to_numpy()
+        lows = df['low'].to_numpy()
+        
+        for i, candle_time in enumerate(df.index):
+            value = state.update(float(deltas[i]), candle_time)
+            if tracker is not None:
+                tracker.update(highs[i], lows[i], value)
+        
+        return state.value, (tracker.last_events if tracker is not None else None)
+    
+    def build_states(self, symbol, timeframes, as_of):
+        """
+        Tính trạng thái chỉ báo cho mỗi (symbol, timeframe) đúng một lần
+        
+        Chỉ dùng các nến đã đóng tại as_of (bỏ nến đang hình thành).
+        
+        Returns:
+            dict: timeframe -> TimeframeState (None nếu thiếu dữ liệu),
+            None nếu sàn chưa chốt nến tại as_of (cần quét lại)
+        """
+        candles = self.load_candles(symbol, timeframes)
+        received_at = self.clock.time()
+        
+        for tf, df in candles.items():
+            if df is not None:
+                candles[tf] = closed_candles(df, tf, as_of)
+                if candles[tf] is None:
+                    return None
+        
+        states = {}
+        for tf, df in candles.items():
+            if df is None or df.empty:
+                states[tf] = None
+                continue
+            
+            stoch_k, stoch_d = self.stoch.calculate(df)
+            states[tf] = TimeframeState(tf, df, stoch_k, stoch_d, self.sr_by_timeframe[tf])
+            states[tf].cvd, states[tf].divergence = self.update_cvd(symbol, tf, df)
+            states[tf].received_at = received_at
+            self.states[(symbol, tf)] = states[tf]
+        
+        return states
+    
+    def scan_symbol(self, symbol, closed_timeframes=None, as_of=None):
+        """
+        Quét mọi cặp chiến lược có khung vào lệnh vừa đóng nến
+        
+        Args:
+            symbol: Mã coin
+            closed_timeframes: Các timeframe vừa đóng nến (None = tất cả)
+            as_of: Thời điểm đóng nến đang quét (mặc định: giờ server hiện tại)
+        
+        Returns:
+            list: Danh sách tín hiệu
+            None nếu sàn chưa chốt nến tại as_of (cần quét lại symbol này)
+        """
         try:
-            df_m15 = self.fetch_data(symbol, '15m', limit=300)
-            df_h1 = self.fetch_data(symbol, '1h', limit=500)
+            if as_of is None:
+                as_of = self.clock.now()
             
-            if df_m15 is None or df_h1 is None:
+            pairs = [
+                pair for pair in self._pairs_for(closed_timeframes)
+                if pair not in self.skip_schedulers or self.skip_schedulers[pair].is_due(symbol, as_of)
+            ]
+            if not pairs:
+                return []
+            
+            states = self.build_states(symbol, {tf for pair in pairs for tf in pair}, as_of)
+            if states is None:
                 return None
             
-            # Tính Stochastic - LẤY CẢ %K VÀ %D
-            stoch_k_m15, stoch_d_m15 = self.stoch.calculate(df_m15)
-            stoch_k_h1, stoch_d_h1 = self.stoch.calculate(df_h1)
+            signals = []
             
-            return self._check_signal_stoch_sr(
-                symbol, df_m15, df_h1, 
-                stoch_k_m15, stoch_d_m15, 
-                stoch_k_h1, stoch_d_h1
-            )
+            for entry_tf, context_tf in pairs:
+                entry = states.get(entry_tf)
+                context = states.get(context_tf)
+                if entry is None or context is None:
+                    continue
+                
+                scheduler = self.skip_schedulers.get((entry_tf, context_tf))
+                if scheduler is not None:
+                    scheduler.update(symbol, entry.df, context.df)
+                
+                signal = self._check_signal_stoch_sr(symbol, entry, context)
+                if signal:
+                    # Mốc thời gian để đo độ trễ từ đóng nến đến khi gửi
+                    signal['candle_close_at'] = as_of.timestamp()
+                    signal['data_received_at'] = entry.received_at
+                    signal['decided_at'] = self.clock.time()
+                    signals.append(signal)
             
+            return signals
+        
         except Exception as e:
             print(f"Lỗi khi kiểm tra tín hiệu {symbol}: {str(e)}")
-            return None
+            return []
     
-    def _check_signal_stoch_sr(self, symbol, df_m15, df_h1, 
-                                stoch_k_m15, stoch_d_m15, 
-                                stoch_k_h1, stoch_d_h1):
+    def check_signal(self, symbol):
+        """Kiểm tra tín hiệu Stoch + S/R (tín hiệu đầu tiên của các cặp)"""
+        signals = self.scan_symbol(symbol)
+        return signals[0] if signals else None
+    
+    def _check_signal_stoch_sr(self, symbol, entry, context):
         """
         Signal: Stoch + S/R - Logic đơn giản: Chỉ check Open
+        
+        Nến "hiện tại" là nến đã đóng gần nhất của mỗi khung.
+        
+        Args:
+            symbol: Mã coin
+            entry: TimeframeState khung vào lệnh (ví dụ M15)
+            context: TimeframeState khung bối cảnh (ví dụ H1)
         """
         try:
+            df_entry = entry.df
+            df_context = context.df
+            entry_label = timeframe_label(entry.timeframe)
+            context_label = timeframe_label(context.timeframe)
+            
             # Lấy giá trị Stoch hiện tại
-            stoch_d_h1_value = stoch_d_h1.iloc[-1]
-            stoch_d_m15_value = stoch_d_m15.iloc[-1]
-            stoch_k_h1_value = stoch_k_h1.iloc[-1]
-            stoch_k_m15_value = stoch_k_m15.iloc[-1]
+            stoch_d_context_value = context.stoch_d.iloc[-1]
+            stoch_d_entry_value = entry.stoch_d.iloc[-1]
+            stoch_k_context_value = context.stoch_k.iloc[-1]
+            stoch_k_entry_value = entry.stoch_k.iloc[-1]
             
-            signal_time = df_h1.index[-1]
-            candle_close = df_h1['close'].iloc[-1]
+            # Giá/thời gian tín hiệu: nến khung bối cảnh nếu nó vừa đóng cùng nến vào lệnh
+            # (giữ signal_id cũ), không thì nến vào lệnh vừa đóng - nến bối cảnh đã đóng
+            # từ trước nên giá của nó đã cũ và signal_id sẽ trùng tín hiệu lúc nó đóng
+            entry_close_time = df_entry.index[-1] + timeframe_delta(entry.timeframe)
+            context_close_time = df_context.index[-1] + timeframe_delta(context.timeframe)
+            if entry_close_time > context_close_time:
+                signal_time = df_entry.index[-1]
+                candle_close = df_entry['close'].iloc[-1]
+            else:
+                signal_time = df_context.index[-1]
+                candle_close = df_context['close'].iloc[-1]
             
             # ĐIỀU KIỆN STOCH
-            is_long = stoch_d_h1_value < 25 and stoch_d_m15_value < 20
-            is_short = stoch_k_h1_value > 75 and stoch_k_m15_value > 80
+            is_long = (stoch_d_context_value < config.STOCH_H1_THRESHOLD_LOW and
+                       stoch_d_entry_value < config.STOCH_OVERSOLD)
+            is_short = (stoch_k_context_value > config.STOCH_H1_THRESHOLD_HIGH and
+                        stoch_k_entry_value > config.STOCH_OVERBOUGHT)
             
             if not (is_long or is_short):
                 return None
             
-            # Tính S/R
-            sr_h1 = self.sr.analyze(df_h1)
-            sr_m15 = self.sr_m15.analyze(df_m15)
+            # Tính S/R (dùng chung giữa các cặp)
+            sr_context = context.sr
+            sr_entry = entry.sr
             
             timeframes_touched = []
             
             # ========================================================================
-            # CHECK H1 - LOGIC ĐƠN GIẢN
+            # CHECK KHUNG BỐI CẢNH (H1) - LOGIC ĐƠN GIẢN
             # ========================================================================
-            if sr_h1['success'] and sr_h1['in_channel']:
-                h1_low = df_h1['low'].iloc[-1]
-                h1_high = df_h1['high'].iloc[-1]
-                h1_close = df_h1['close'].iloc[-1]
-                h1_open = df_h1['open'].iloc[-1]
+            if sr_context['success'] and sr_context['in_channel']:
+                ctx_low = df_context['low'].iloc[-1]
+                ctx_high = df_context['high'].iloc[-1]
+                ctx_close = df_context['close'].iloc[-1]
                 
-                channel = sr_h1['in_channel']
+                channel = sr_context['in_channel']
                 ch_low = channel['low']
                 ch_high = channel['high']
                 ch_mid = (ch_low + ch_high) / 2
                 
                 if is_long:
                     # LONG: Nến hiện tại
-                    current_in_upper = h1_close > ch_mid
-                    current_in_channel = h1_close > ch_low and h1_close < ch_high
+                    current_in_upper = ctx_close > ch_mid
+                    current_in_channel = ctx_close > ch_low and ctx_close < ch_high
                     
-                    if current_in_upper and current_in_channel and len(df_h1) > 1:
+                    if current_in_upper and current_in_channel and len(df_context) > 1:
                         # Nến trước: Open trên channel
-                        prev_h1_open = df_h1['open'].iloc[-2]
-                        prev_valid = prev_h1_open >= ch_high
+                        prev_ctx_open = df_context['open'].iloc[-2]
+                        prev_valid = prev_ctx_open >= ch_high
                         
                         if prev_valid:
                             # Nến hiện tại chạm support
-                            if h1_low <= ch_high and h1_close > ch_low:
-                                timeframes_touched.append('H1')
+                            if ctx_low <= ch_high and ctx_close > ch_low:
+                                timeframes_touched.append(context_label)
                 
                 elif is_short:
                     # SHORT: Nến hiện tại
-                    current_in_lower = h1_close < ch_mid
-                    current_in_channel = h1_close > ch_low and h1_close < ch_high
+                    current_in_lower = ctx_close < ch_mid
+                    current_in_channel = ctx_close > ch_low and ctx_close < ch_high
                     
-                    if current_in_lower and current_in_channel and len(df_h1) > 1:
+                    if current_in_lower and current_in_channel and len(df_context) > 1:
                         # Nến trước: Open dưới channel
-                        prev_h1_open = df_h1['open'].iloc[-2]
-                        prev_valid = prev_h1_open <= ch_low
+                        prev_ctx_open = df_context['open'].iloc[-2]
+                        prev_valid = prev_ctx_open <= ch_low
                         
                         if prev_valid:
                             # Nến hiện tại chạm resistance
-                            if h1_high >= ch_low and h1_close < ch_high:
-                                timeframes_touched.append('H1')
+                            if ctx_high >= ch_low and ctx_close < ch_high:
+                                timeframes_touched.append(context_label)
             
             # ========================================================================
-            # CHECK 4 NẾN M15 - LOGIC ĐƠN GIẢN
+            # CHECK CÁC NẾN KHUNG VÀO LỆNH TRONG 1 NẾN BỐI CẢNH (4 NẾN M15)
             # ========================================================================
-            if sr_m15['success'] and sr_m15['in_channel']:
-                last_4_m15 = df_m15.iloc[-4:]
+            if sr_entry['success'] and sr_entry['in_channel']:
+                candles_per_context = max(
+                    int(timeframe_delta(context.timeframe) // timeframe_delta(entry.timeframe)), 1
+                )
+                last_entries = df_entry.iloc[-candles_per_context:]
                 
-                channel = sr_m15['in_channel']
+                channel = sr_entry['in_channel']
                 ch_low = channel['low']
                 ch_high = channel['high']
                 ch_mid = (ch_low + ch_high) / 2
                 
-                m15_touched = False
+                entry_touched = False
                 
-                for i in range(len(last_4_m15)):
-                    m15_low = last_4_m15['low'].iloc[i]
-                    m15_high = last_4_m15['high'].iloc[i]
-                    m15_close = last_4_m15['close'].iloc[i]
-                    m15_open = last_4_m15['open'].iloc[i]
+                for i in range(len(last_entries)):
+                    e_low = last_entries['low'].iloc[i]
+                    e_high = last_entries['high'].iloc[i]
+                    e_close = last_entries['close'].iloc[i]
                     
                     if is_long:
                         # LONG: Nến hiện tại
-                        current_in_upper = m15_close > ch_mid
-                        current_in_channel = m15_close > ch_low and m15_close < ch_high
+                        current_in_upper = e_close > ch_mid
+                        current_in_channel = e_close > ch_low and e_close < ch_high
                         
                         if current_in_upper and current_in_channel:
                             # Check nến trước (nếu có)
                             if i > 0:
-                                prev_m15_open = last_4_m15['open'].iloc[i-1]
+                                prev_e_open = last_entries['open'].iloc[i-1]
                                 
                                 # ĐƠN GIẢN: Chỉ cần Open trên channel
-                                prev_valid = prev_m15_open >= ch_high
+                                prev_valid = prev_e_open >= ch_high
                                 
                                 if prev_valid:
                                     # Nến hiện tại chạm support
-                                    if m15_low <= ch_high and m15_close > ch_low:
-                                        m15_touched = True
+                                    if e_low <= ch_high and e_close > ch_low:
+                                        entry_touched = True
                                         break
                             else:
                                 # Nến đầu tiên - bỏ qua check nến trước
-                                if m15_low <= ch_high and m15_close > ch_low:
-                                    m15_touched = True
+                                if e_low <= ch_high and e_close > ch_low:
+                                    entry_touched = True
                                     break
                     
                     elif is_short:
                         # SHORT: Nến hiện tại
-                        current_in_lower = m15_close < ch_mid
-                        current_in_channel = m15_close > ch_low and m15_close < ch_high
+                        current_in_lower = e_close < ch_mid
+                        current_in_channel = e_close > ch_low and e_close < ch_high
                         
                         if current_in_lower and current_in_channel:
                             if i > 0:
-                                prev_m15_open = last_4_m15['open'].iloc[i-1]
+                                prev_e_open = last_entries['open'].iloc[i-1]
                                 
                                 # ĐƠN GIẢN: Chỉ cần Open dưới channel
-                                prev_valid = prev_m15_open <= ch_low
+                                prev_valid = prev_e_open <= ch_low
                                 
                                 if prev_valid:
                                     # Nến hiện tại chạm resistance
-                                    if m15_high >= ch_low and m15_close < ch_high:
-                                        m15_touched = True
+                                    if e_high >= ch_low and e_close < ch_high:
+                                        entry_touched = True
                                         break
                             else:
-                                if m15_high >= ch_low and m15_close < ch_high:
-                                    m15_touched = True
+                                if e_high >= ch_low and e_close < ch_high:
+                                    entry_touched = True
                                     break
                 
-                if m15_touched:
-                    timeframes_touched.insert(0, 'M15')
+                if entry_touched:
+                    timeframes_touched.insert(0, entry_label)
             
             # Tạo signal
             if timeframes_touched:
+                direction = 'BUY' if is_long else 'SELL'
+                
+                # Cặp mặc định giữ signal_id cũ để khớp lịch sử đã lưu
+                pair_suffix = ''
+                if (entry.timeframe, context.timeframe) != DEFAULT_PAIR:
+                    pair_suffix = f"_{entry_label}{context_label}"
+                
+                # Các key *_m15 / *_h1 = khung vào lệnh / khung bối cảnh
                 return {
                     'symbol': symbol,
-                    'signal_type': 'BUY' if is_long else 'SELL',
+                    'signal_type': direction,
                     'price': candle_close,
                     'signal_time': signal_time,
                     'confirm_time': datetime.now(VIETNAM_TZ),
-                    'stoch_k_m15': stoch_k_m15_value,
-                    'stoch_d_m15': stoch_d_m15_value,
-                    'stoch_k_h1': stoch_k_h1_value,
-                    'stoch_d_h1': stoch_d_h1_value,
-                    'signal_id': f"{symbol}_{signal_time.strftime('%Y%m%d%H%M')}_{'BUY' if is_long else 'SELL'}_SR",
+                    'stoch_k_m15': stoch_k_entry_value,
+                    'stoch_d_m15': stoch_d_entry_value,
+                    'stoch_k_h1': stoch_k_context_value,
+                    'stoch_d_h1': stoch_d_context_value,
+                    'signal_id': f"{symbol}_{signal_time.strftime('%Y%m%d%H%M')}_{direction}_SR{pair_suffix}",
                     'timeframes': ' & '.join(timeframes_touched),
+                    'entry_timeframe': entry.timeframe,
+                    'context_timeframe': context.timeframe,
                     'sr_type': 'support' if is_long else 'resistance'
                 }
             
             return None
-            
+        
         except Exception as e:
             print(f"Lỗi _check_signal_stoch_sr: {str(e)}")
             import traceback
             traceback.print_exc()
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,48 @@
+"""
+Đo thời gian khởi động bot theo từng bước
+
+main.py import module này đầu tiên nên mốc thời gian bắt đầu gần với lúc
+process khởi động. Các bước được ghi bằng startup_timer.mark(...) và in ra
+khi bot sẵn sàng và sau lần quét đầu tiên.
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    Ghi thời gian từng bước khởi động
+    """
+    
+    def __init__(self, started=None):
+        self.started = started if started is not None else PROCESS_START
+        self.last = self.started
+        self.steps = []
+        self.first_scan_reported = False
+    
+    def mark(self, name):
+        """Kết thúc một bước (tính từ bước trước)"""
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+    
+    def add(self, name, seconds):
+        """Ghi một bước đo riêng (ví dụ lần quét đầu, không tính thời gian chờ nến đóng)"""
+        self.steps.append((name, seconds))
+    
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.steps)
+    
+    def report(self):
+        """In bảng thời gian khởi động"""
+        breakdown = ' | '.join(f"{name} {seconds:.3f}s" for name, seconds in self.steps)
+        logger.info(f"⏱ Khởi động: {breakdown} | tổng {self.total:.3f}s")
+
+
+startup_timer = StartupTimer()
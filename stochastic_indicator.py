@@ -25,15 +25,15 @@ class StochasticIndicator:
         self.k_smooth = k_smooth
         self.d_smooth = d_smooth
     
-    def calculate(self, df):
+    def calculate_raw(self, df):
         """
-        Tính toán chỉ báo Stochastic
+        Tính %K chưa làm mượt (luôn nằm trong khoảng 0-100)
         
         Args:
             df: DataFrame với cột ['high', 'low', 'close']
             
         Returns:
-            tuple: (%K, %D)
+            Series: %K thô
         """
         # Tính highest high và lowest low trong k_period
         highest_high = df['high'].rolling(window=self.k_period).max()
@@ -43,7 +43,19 @@ class StochasticIndicator:
         raw_k = 100 * (df['close'] - lowest_low) / (highest_high - lowest_low)
         
         # Xử lý chia cho 0
-        raw_k = raw_k.fillna(50)
+        return raw_k.fillna(50)
+    
+    def calculate(self, df):
+        """
+        Tính toán chỉ báo Stochastic
+        
+        Args:
+            df: DataFrame với cột ['high', 'low', 'close']
+            
+        Returns:
+            tuple: (%K, %D)
+        """
+        raw_k = self.calculate_raw(df)
         
         # Làm mượt %K bằng SMA
         k_line = raw_k.rolling(window=self.k_smooth).mean()
@@ -53,6 +65,67 @@ class StochasticIndicator:
         
         return k_line, d_line
     
+    def forecast_bounds(self, df, steps, known_bars=None):
+        """
+        Tính biên dưới/trên mà %K và %D CÓ THỂ đạt được trong các nến tới
+        
+        %K là SMA(k_smooth) của %K thô (bị chặn trong 0-100) và %D là
+        SMA(d_smooth) của %K, nên mỗi nến mới chỉ làm %K/%D dịch chuyển
+        một lượng hữu hạn. Biên được tính chính xác từ các giá trị %K thô
+        đã biết, giả định các nến chưa biết có %K thô bất kỳ trong 0-100.
+        
+        Args:
+            df: DataFrame với cột ['high', 'low', 'close']
+            steps: Số nến tương lai cần tính biên
+            known_bars: Số nến đầu tiên của df đã cố định (mặc định: tất cả
+                trừ nến cuối - nến cuối có thể đang hình thành)
+            
+        Returns:
+            dict: Mảng 'k_min', 'k_max', 'd_min', 'd_max' - phần tử m-1
+            là biên của nến thứ m sau nến cố định cuối cùng.
+            None nếu chưa đủ dữ liệu.
+        """
+        if known_bars is None:
+            known_bars = len(df) - 1
+        
+        raw = self.calculate_raw(df.iloc[:known_bars]).to_numpy(dtype=float)
+        k_known = pd.Series(raw).rolling(window=self.k_smooth).mean().to_numpy()
+        
+        # Cần đủ %K thô và %K đã biết cho toàn bộ cửa sổ
+        if known_bars < self.k_period + self.k_smooth + self.d_smooth - 2:
+            return None
+        if np.isnan(raw[-self.k_smooth:]).any() or np.isnan(k_known[-self.d_smooth:]).any():
+            return None
+        
+        m = np.arange(1, steps + 1)
+        
+        # Tổng %K thô đã biết còn nằm trong cửa sổ của nến thứ m
+        raw_tail = np.concatenate(([0.0], np.cumsum(raw[::-1][:self.k_smooth])))
+        known_in_window = np.clip(self.k_smooth - m, 0, None)
+        raw_sum_known = raw_tail[known_in_window]
+        free_count = np.minimum(m, self.k_smooth)
+        
+        k_min = raw_sum_known / self.k_smooth
+        k_max = (raw_sum_known + 100.0 * free_count) / self.k_smooth
+        
+        # %D: %K đã biết trong cửa sổ + biên của các %K tương lai
+        k_tail = np.concatenate(([0.0], np.cumsum(k_known[::-1][:self.d_smooth])))
+        k_sum_known = k_tail[np.clip(self.d_smooth - m, 0, None)]
+        
+        k_min_cum = np.concatenate(([0.0], np.cumsum(k_min)))
+        k_max_cum = np.concatenate(([0.0], np.cumsum(k_max)))
+        first_future = np.maximum(m - self.d_smooth, 0)
+        
+        d_min = (k_sum_known + k_min_cum[m] - k_min_cum[first_future]) / self.d_smooth
+        d_max = (k_sum_known + k_max_cum[m] - k_max_cum[first_future]) / self.d_smooth
+        
+        return {
+            'k_min': k_min,
+            'k_max': k_max,
+            'd_min': d_min,
+            'd_max': d_max
+        }
+    
     def analyze(self, df):
         """
         Phân tích đầy đủ Stochastic
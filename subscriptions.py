@@ -0,0 +1,70 @@
+"""
+Chỉ mục đăng ký theo dõi: symbol -> các chat nhận tín hiệu
+
+Mỗi chat (người dùng /add trong chat riêng) có danh sách symbol của mình,
+channel TELEGRAM_CHANNEL_ID là một chat đặc biệt dùng watchlist chung.
+Bot chỉ quét hợp (không trùng) của mọi symbol được đăng ký, mỗi lần đóng nến
+một lần; tín hiệu của một symbol được gửi tới mọi chat trong chỉ mục
+symbol -> chat. Thêm người dùng chỉ tăng số tin nhắn, không tăng số lần quét.
+"""
+
+
+class SubscriptionIndex:
+    """
+    Chỉ mục ngược symbol -> tập chat_id (và chat_id -> tập symbol)
+    """
+    
+    def __init__(self, pairs=()):
+        """
+        Args:
+            pairs: Các cặp (chat_id, symbol) ban đầu
+        """
+        self.by_symbol = {}
+        self.by_chat = {}
+        self.load(pairs)
+    
+    def load(self, pairs):
+        """Dựng lại toàn bộ chỉ mục từ các cặp (chat_id, symbol)"""
+        by_symbol = {}
+        by_chat = {}
+        for chat_id, symbol in pairs:
+            by_symbol.setdefault(symbol, set()).add(chat_id)
+            by_chat.setdefault(chat_id, set()).add(symbol)
+        self.by_symbol, self.by_chat = by_symbol, by_chat
+    
+    def add(self, chat_id, symbol):
+        self.by_symbol.setdefault(symbol, set()).add(chat_id)
+        self.by_chat.setdefault(chat_id, set()).add(symbol)
+    
+    def remove(self, chat_id, symbol):
+        self._discard(self.by_symbol, symbol, chat_id)
+        self._discard(self.by_chat, chat_id, symbol)
+    
+    def remove_chat(self, chat_id):
+        """Bỏ mọi đăng ký của một chat (ví dụ người dùng đã chặn bot)"""
+        for symbol in self.by_chat.pop(chat_id, ()):
+            self._discard(self.by_symbol, symbol, chat_id)
+    
+    @staticmethod
+    def _discard(index, key, value):
+        values = index.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del index[key]
+    
+    def subscribers(self, symbol):
+        """Các chat nhận tín hiệu của symbol"""
+        return self.by_symbol.get(symbol, set())
+    
+    def chat_symbols(self, chat_id):
+        return self.by_chat.get(chat_id, set())
+    
+    def symbols(self):
+        """Hợp các symbol được đăng ký (danh sách cần quét), sắp xếp cố định"""
+        return sorted(self.by_symbol)
+    
+    def __len__(self):
+        """Số cặp (chat, symbol)"""
+        return sum(len(chats) for chats in self.by_symbol.values())
@@ -6,6 +6,7 @@ Sử dụng logic từ support_resistance_channel.py (TradingView)
 import pandas as pd
 import numpy as np
 from typing import Dict
+from pivots import pivot_high_mask, pivot_low_mask
 
 
 class SupportResistanceChannel:
@@ -34,7 +35,7 @@ class SupportResistanceChannel:
     def find_pivots(self, df: pd.DataFrame):
         """
         Tìm pivot points - LOGIC CHÍNH XÁC từ TradingView
-        Kiểm tra THỦ CÔNG từng nến (KHÔNG dùng rolling)
+        Dùng kernel pivot chung (pivots.py) - vector hóa, không vòng lặp từng nến
         """
         result_df = df.copy()
         
@@ -46,33 +47,13 @@ class SupportResistanceChannel:
             src1 = df[['close', 'open']].max(axis=1)
             src2 = df[['close', 'open']].min(axis=1)
         
-        # Khởi tạo cột pivot
-        result_df['ph'] = np.nan
-        result_df['pl'] = np.nan
-        
-        # Tìm Pivot High và Pivot Low - LOGIC THỦ CÔNG
-        for i in range(self.prd, len(df) - self.prd):
-            # Kiểm tra Pivot High
-            is_pivot_high = True
-            for j in range(1, self.prd + 1):
-                # Phải cao hơn TẤT CẢ nến bên trái VÀ bên phải
-                if src1.iloc[i] < src1.iloc[i-j] or src1.iloc[i] <= src1.iloc[i+j]:
-                    is_pivot_high = False
-                    break
-            
-            if is_pivot_high:
-                result_df.loc[result_df.index[i], 'ph'] = src1.iloc[i]
-            
-            # Kiểm tra Pivot Low
-            is_pivot_low = True
-            for j in range(1, self.prd + 1):
-                # Phải thấp hơn TẤT CẢ nến bên trái VÀ bên phải
-                if src2.iloc[i] > src2.iloc[i-j] or src2.iloc[i] >= src2.iloc[i+j]:
-                    is_pivot_low = False
-                    break
-            
-            if is_pivot_low:
-                result_df.loc[result_df.index[i], 'pl'] = src2.iloc[i]
+        # Pivot High: cao hơn hoặc bằng TẤT CẢ nến bên trái, cao hơn hẳn nến bên phải
+        ph_mask = pivot_high_mask(src1.to_numpy(), self.prd)
+        result_df['ph'] = np.where(ph_mask, src1.to_numpy(), np.nan)
+        
+        # Pivot Low: thấp hơn hoặc bằng TẤT CẢ nến bên trái, thấp hơn hẳn nến bên phải
+        pl_mask = pivot_low_mask(src2.to_numpy(), self.prd)
+        result_df['pl'] = np.where(pl_mask, src2.to_numpy(), np.nan)
         
         return result_df
     
@@ -2,6 +2,8 @@ import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from exchange_client import get_governor
+from weight_governor import weight_for_url
 
 # ==============================================================================
 # PHẦN 1: HÀM LẤY DỮ LIỆU TỪ BINANCE API
@@ -16,8 +18,11 @@ def get_binance_klines(symbol, interval, limit=500):
         'interval': interval,
         'limit': limit
     }
+    governor = get_governor()
     try:
+        governor.acquire(weight_for_url(url))
         response = requests.get(url, params=params)
+        governor.observe(response.headers, response.status_code)
         response.raise_for_status()  # Ném lỗi nếu request không thành công
         data = response.json()
         
@@ -0,0 +1,162 @@
+"""
+Trạng thái hiện tại của một symbol cho lệnh /check
+
+Symbol đang được quét: đọc thẳng từ trạng thái chỉ báo scanner giữ trong bộ
+nhớ (scanner.states) - không gọi Binance. Symbol ngoài watchlist (hoặc trạng
+thái đã cũ vì lịch bỏ qua chưa quét lại): tải nến và tính tại chỗ ở thread
+riêng, kết quả giữ CHECK_CACHE_TTL giây.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import config
+from candle_store import floor_to_timeframe, timeframe_delta
+from signal_scanner import TimeframeState
+
+
+def describe_state(state):
+    """
+    Tóm tắt TimeframeState: giá, Stoch, vùng S/R chứa giá và vùng gần nhất
+    
+    Returns:
+        dict: timeframe, candle_time, close, stoch_k, stoch_d, in_channel,
+              support, resistance (vùng dict low/high/strength hoặc None), sr_error
+    """
+    sr = state.sr
+    result = {
+        'timeframe': state.timeframe,
+        'candle_time': state.df.index[-1],
+        'close': float(state.df['close'].iloc[-1]),
+        'stoch_k': float(state.stoch_k.iloc[-1]),
+        'stoch_d': float(state.stoch_d.iloc[-1]),
+        'in_channel': None,
+        'support': None,
+        'resistance': None,
+        'sr_error': None,
+    }
+    if not sr['success']:
+        result['sr_error'] = sr['message']
+        return result
+    
+    result['in_channel'] = sr['in_channel']
+    if sr['supports']:
+        result['support'] = max(sr['supports'], key=lambda ch: ch['high'])
+    if sr['resistances']:
+        result['resistance'] = min(sr['resistances'], key=lambda ch: ch['low'])
+    return result
+
+
+class SymbolChecker:
+    """
+    Trả lời /check từ trạng thái scanner, tính khi cần cho symbol khác (cache TTL)
+    """
+    
+    def __init__(self, scanner, ttl=None, size=None):
+        """
+        Args:
+            scanner: SignalScanner (trạng thái chỉ báo + tải nến)
+            ttl: Thời gian giữ kết quả tính tại chỗ (mặc định CHECK_CACHE_TTL)
+            size: Số symbol tối đa trong cache (mặc định CHECK_CACHE_SIZE)
+        """
+        self.scanner = scanner
+        self.ttl = config.CHECK_CACHE_TTL if ttl is None else ttl
+        self.size = size or config.CHECK_CACHE_SIZE
+        self.cache = OrderedDict()
+    
+    def latest_open(self, timeframe, now):
+        """Open time nến đã đóng gần nhất của timeframe tại now"""
+        return floor_to_timeframe(pd.DatetimeIndex([now]), timeframe)[0] - timeframe_delta(timeframe)
+    
+    def live_states(self, symbol):
+        """
+        Trạng thái scanner của symbol nếu đủ mọi timeframe và đã tính ở nến gần nhất
+        
+        Returns:
+            list: TimeframeState theo thứ tự scanner.timeframes, None nếu thiếu/cũ
+        """
+        now = self.scanner.clock.now()
+        states = []
+        for tf in self.scanner.timeframes:
+            state = self.scanner.states.get((symbol, tf))
+            if state is None or state.df.index[-1] < self.latest_open(tf, now):
+                return None
+            states.append(state)
+        return states
+    
+    def cached(self, symbol):
+        """Kết quả tính tại chỗ còn hạn (None nếu không có)"""
+        entry = self.cache.get(symbol)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+    
+    def load_state(self, symbol, timeframe, now=None):
+        """
+        TimeframeState ở nến đã đóng gần nhất: của scanner nếu còn mới, không thì tải và tính
+        
+        State tự tính không ghi vào kho nến/CVD của scanner nên không ảnh hưởng lần quét.
+        
+        Returns:
+            TimeframeState hoặc None nếu không lấy được dữ liệu
+        """
+        now = now or self.scanner.clock.now()
+        state = self.scanner.states.get((symbol, timeframe))
+        if state is not None and state.df.index[-1] >= self.latest_open(timeframe, now):
+            return state
+        
+        df = self.scanner.fetch_data(symbol, timeframe, limit=config.CANDLES_LIMITS.get(timeframe, config.CANDLES_LIMIT))
+        if df is None or df.empty:
+            return None
+        df = df[df.index + timeframe_delta(timeframe) <= now]
+        if df.empty:
+            return None
+        stoch_k, stoch_d = self.scanner.stoch.calculate(df)
+        return TimeframeState(timeframe, df, stoch_k, stoch_d, self.scanner.sr_by_timeframe[timeframe])
+    
+    def compute(self, symbol):
+        """
+        Tải nến và tính trạng thái mọi timeframe (chạy ở thread riêng)
+        
+        Returns:
+            list: dict describe_state, None nếu không lấy được dữ liệu
+        """
+        now = self.scanner.clock.now()
+        result = []
+        complete = True
+        for tf in self.scanner.timeframes:
+            state = self.load_state(symbol, tf, now)
+            if state is None:
+                return None
+            result.append(describe_state(state))
+            complete = complete and state.df.index[-1] >= self.latest_open(tf, now)
+        
+        # Sàn chưa chốt nến vừa đóng -> không cache kết quả của nến trước
+        if not complete:
+            return result
+        
+        self.cache[symbol] = (time.monotonic() + self.ttl, result)
+        self.cache.move_to_end(symbol)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return result
+    
+    async def check(self, symbol):
+        """
+        Trạng thái mọi timeframe của symbol
+        
+        Returns:
+            tuple: (nguồn 'live' / 'cache' / 'fresh', list dict describe_state hoặc None)
+        """
+        states = self.live_states(symbol)
+        if states is not None:
+            # S/R có thể chưa được lần quét tính (Stoch chưa thỏa) -> không chặn event loop
+            return 'live', await asyncio.to_thread(lambda: [describe_state(state) for state in states])
+        
+        result = self.cached(symbol)
+        if result is not None:
+            return 'cache', result
+        return 'fresh', await asyncio.to_thread(self.compute, symbol)
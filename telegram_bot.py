@@ -5,14 +5,32 @@ CHỈ BÁO TÍN HIỆU ĐÚNG TIMEFRAME KHI NẾN ĐÓNG
 
 import asyncio
 import logging
+import os
+import socket
+import time
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram.constants import ParseMode
 
 import config
-from database import DatabaseManager
+from database import DatabaseManager, normalize_symbol, to_utc
 from signal_scanner import SignalScanner
+from candle_store import timeframe_label
+from aggtrade_cvd import AggTradeStream, TradeBucketStore
+from sharding import ShardCoordinator
+from close_scheduler import CloseScheduler
+from checkpoint import load_checkpoint, save_checkpoint
+from exchange_client import get_exchange
+from startup import startup_timer
+from latency_tracker import LatencyTracker
+from outcome_tracker import OutcomeTracker
+from subscriptions import SubscriptionIndex
+from fanout_dispatcher import FanoutDispatcher, parse_chat_id
+from symbol_check import SymbolChecker
+from chart_render import ChartRenderer
+from price_alerts import PriceAlertEngine
+import memory_usage
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -27,20 +45,78 @@ class TelegramBot:
     def __init__(self):
         """Khởi tạo bot"""
         self.db = DatabaseManager()
+        startup_timer.mark('database')
         self.scanner = SignalScanner()
-        self.app = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        builder = Application.builder().token(config.TELEGRAM_BOT_TOKEN)
+        if config.TELEGRAM_API_URL:
+            builder = builder.base_url(f"{config.TELEGRAM_API_URL.rstrip('/')}/bot")
+        self.app = builder.build()
         
-        # Lưu timestamp nến đã quét
-        self.last_scanned_m15 = None
-        self.last_scanned_h1 = None
+        # Lưu thời điểm đóng nến đã quét: timeframe -> close time
+        self.last_scanned = {}
+        
+        # Lịch quét theo thời điểm đóng nến trên server Binance
+        self.close_scheduler = CloseScheduler(self.scanner.timeframes, self.scanner.clock)
+        
+        # Stream aggTrade (khi bật AGGTRADE_ENABLED)
+        self.aggtrade_stream = None
+        self.aggtrade_task = None
+        
+        # Độ trễ đóng nến -> Telegram của các tín hiệu gần nhất
+        self.latency = LatencyTracker()
+        self.latency.load(self.db.get_recent_latencies(config.LATENCY_WINDOW))
+        
+        # Chỉ mục symbol -> chat nhận tín hiệu (channel + người dùng đăng ký riêng)
+        self.subscriptions = SubscriptionIndex()
+        self.subscriptions_loaded_at = None
+        
+        # Gửi tin tới nhiều chat trong giới hạn tốc độ Telegram
+        self.dispatcher = FanoutDispatcher(self.send_message, on_forbidden=self.unsubscribe_chat)
+        
+        # /check: đọc trạng thái chỉ báo của scanner, symbol khác tính tại chỗ
+        self.checker = SymbolChecker(self.scanner)
+        self.charts = ChartRenderer(self.checker)
+        
+        # Cảnh báo giá của người dùng (chỉ mục ngưỡng theo symbol)
+        self.alerts = PriceAlertEngine(self.scanner)
+        
+        # Chia symbol khi chạy nhiều worker (SHARDING_ENABLED)
+        self.shards = ShardCoordinator(self.db) if config.SHARDING_ENABLED else None
+        self.worker_id = self.shards.worker_id if self.shards is not None else (
+            config.WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self.heartbeat_task = None
+        self.retention_task = None
+        self.outcome_task = None
+        self.outbox_task = None
+        self.outbox_wakeup = asyncio.Event()
+        # Dòng outbox chờ tin tổng hợp tới người dùng: id -> (row, future các tin tổng hợp, task settle_outbox)
+        self.settling = {}
+        self.warmup_task = None
+        
+        if config.CHECKPOINT_ENABLED:
+            self.restore_checkpoint()
+        startup_timer.mark('scanner')
         
         self.app.add_handler(CommandHandler("start", self.cmd_start))
         self.app.add_handler(CommandHandler("add", self.cmd_add))
         self.app.add_handler(CommandHandler("remove", self.cmd_remove))
         self.app.add_handler(CommandHandler("list", self.cmd_list))
+        self.app.add_handler(CommandHandler("check", self.cmd_check))
+        self.app.add_handler(CommandHandler("chart", self.cmd_chart))
+        self.app.add_handler(CommandHandler("alert", self.cmd_alert))
+        self.app.add_handler(CommandHandler("alerts", self.cmd_alerts))
+        self.app.add_handler(CommandHandler("unalert", self.cmd_unalert))
         self.app.add_handler(CommandHandler("help", self.cmd_help))
+        self.app.add_handler(CommandHandler("latency", self.cmd_latency))
+        self.app.add_handler(CommandHandler("mem", self.cmd_mem))
+        self.app.add_handler(CommandHandler("stats", self.cmd_stats))
         
         self._init_default_symbols()
+        self.subscriptions.load(self.db.get_subscriptions(config.TELEGRAM_CHANNEL_ID) or [])
+        self.alerts.load(self.db.get_active_alerts() or [])
+        self.subscriptions_loaded_at = time.monotonic()
+        startup_timer.mark('symbols')
     
     def _init_default_symbols(self):
         """Thêm các symbol mặc định vào database"""
@@ -48,36 +124,68 @@ class TelegramBot:
             symbol_clean = symbol.replace('/', '')
             self.db.add_symbol(symbol_clean)
     
-    def should_scan_now(self):
+    async def refresh_subscriptions(self):
         """
-        Kiểm tra xem có nên quét không (khi nến M15 hoặc H1 vừa đóng)
+        Tải lại chỉ mục đăng ký từ database mỗi SUBSCRIPTION_REFRESH_INTERVAL
+        
+        Lệnh /add, /remove cập nhật chỉ mục ngay; tải lại để worker không nhận
+        lệnh (chạy nhiều worker) cũng thấy đăng ký mới.
+        """
+        if time.monotonic() - self.subscriptions_loaded_at < config.SUBSCRIPTION_REFRESH_INTERVAL:
+            return
+        pairs = await asyncio.to_thread(self.db.get_subscriptions, config.TELEGRAM_CHANNEL_ID)
+        alerts = await asyncio.to_thread(self.db.get_active_alerts)
+        if pairs is not None:
+            self.subscriptions.load(pairs)
+            self.subscriptions_loaded_at = time.monotonic()
+        if alerts is not None:
+            self.alerts.load(alerts)
+    
+    def is_admin(self, update):
+        """Chat quản lý watchlist của channel"""
+        return update.effective_chat.id in config.ADMIN_CHAT_IDS
+    
+    def restore_checkpoint(self):
+        """Khôi phục trạng thái scanner từ checkpoint (nếu có)"""
+        last_scanned = load_checkpoint(self.scanner)
+        if last_scanned is None:
+            logger.info("Không có checkpoint hợp lệ, tải lại toàn bộ dữ liệu ở lần quét đầu")
+            return
+        
+        self.last_scanned.update(last_scanned)
+        logger.info(f"Đã khôi phục checkpoint: {len(self.scanner.store.frames) if self.scanner.store else 0} chuỗi nến")
+    
+    async def save_checkpoint(self):
+        """Lưu trạng thái scanner (chạy ở thread riêng để không chặn bot)"""
+        try:
+            result = await asyncio.to_thread(save_checkpoint, self.scanner, dict(self.last_scanned))
+            logger.info(f"Đã lưu checkpoint: {result['frames']} chuỗi nến, "
+                        f"{result['bytes'] / 1024:.0f} KB, {result['seconds']:.2f}s")
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu checkpoint: {str(e)}")
+    
+    async def wait_for_close(self):
+        """
+        Chờ đến khi nến của một timeframe trong các cặp đóng (theo giờ server)
         
         Returns:
-            tuple: (should_scan, timeframe) - ('m15', 'h1', 'both', hoặc None)
+            tuple: (close_time, timeframes) - thời điểm đóng nến và các timeframe vừa đóng
         """
-        now = datetime.now(config.TIMEZONE)
-        
-        # Làm tròn về phút gần nhất
-        current_minute = now.replace(second=0, microsecond=0)
-        
-        # Kiểm tra nến H1 (đóng vào phút :00)
-        if current_minute.minute == 0:
-            # Nến H1 vừa đóng
-            if self.last_scanned_h1 != current_minute:
-                self.last_scanned_h1 = current_minute
-                self.last_scanned_m15 = current_minute  # M15 cũng đóng lúc :00
-                logger.info(f"✓ Nến H1 & M15 vừa đóng: {current_minute.strftime('%H:%M %d-%m-%Y')}")
-                return True, 'both'
-        
-        # Kiểm tra nến M15 (đóng vào phút :15, :30, :45)
-        elif current_minute.minute % 15 == 0:
-            # Nến M15 vừa đóng (không phải :00)
-            if self.last_scanned_m15 != current_minute:
-                self.last_scanned_m15 = current_minute
-                logger.info(f"✓ Nến M15 vừa đóng: {current_minute.strftime('%H:%M %d-%m-%Y')}")
-                return True, 'm15'
-        
-        return False, None
+        while True:
+            close_time, closed = await self.close_scheduler.wait_next_close()
+            
+            # Bỏ timeframe đã quét ở nến này (ví dụ khôi phục từ checkpoint)
+            closed = [tf for tf in closed if self.last_scanned.get(tf) != close_time]
+            if not closed:
+                continue
+            
+            for tf in closed:
+                self.last_scanned[tf] = close_time
+            
+            labels = ' & '.join(timeframe_label(tf) for tf in closed)
+            delay = self.scanner.clock.time() - close_time.timestamp()
+            logger.info(f"✓ Nến {labels} vừa đóng: {close_time.strftime('%H:%M %d-%m-%Y')} (+{delay:.1f}s)")
+            return close_time, closed
     
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Lệnh /start"""
@@ -92,9 +200,16 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
 - Kiểm tra trên cả khung M15 và H1
 
 <b>Các lệnh:</b>
-/add BTCUSDT - Thêm coin
-/remove BTCUSDT - Xóa coin
-/list - Xem danh sách
+/add BTCUSDT - Theo dõi coin (nhận tín hiệu tại chat này)
+/remove BTCUSDT - Bỏ theo dõi coin
+/list - Xem danh sách bạn theo dõi
+/check BTCUSDT - Stoch và vùng S/R hiện tại của coin
+/chart BTCUSDT H1 - Biểu đồ nến + S/R + Stoch
+/alert ETH 3200 - Báo khi giá chạm mức (hoặc vào vùng: /alert ETH 3200 3250)
+/alerts - Cảnh báo giá đang chờ
+/latency - Độ trễ gửi tín hiệu
+/mem - Bộ nhớ bot đang dùng
+/stats [coin] [số ngày] - Tỷ lệ thắng thực tế
 /help - Hướng dẫn chi tiết
 """
         await update.message.reply_text(welcome_msg, parse_mode=ParseMode.HTML)
@@ -105,12 +220,17 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
             await update.message.reply_text("⚠️ Cách dùng: /add BTCUSDT")
             return
         
-        symbol = context.args[0]
-        success, message = self.db.add_symbol(symbol)
+        chat_id = update.effective_chat.id
+        if self.is_admin(update):
+            success, message = self.db.add_symbol(context.args[0])
+            chat_id, symbol = config.TELEGRAM_CHANNEL_ID, normalize_symbol(context.args[0])
+        else:
+            success, message, symbol = self.db.add_subscription(chat_id, context.args[0])
         await update.message.reply_text(message)
         
         if success:
-            logger.info(f"Đã thêm {symbol} vào watchlist")
+            self.subscriptions.add(chat_id, symbol)
+            logger.info(f"Đã thêm {symbol} vào watchlist của {chat_id}")
     
     async def cmd_remove(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Lệnh /remove SYMBOL"""
@@ -118,22 +238,32 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
             await update.message.reply_text("⚠️ Cách dùng: /remove BTCUSDT")
             return
         
-        symbol = context.args[0]
-        success, message = self.db.remove_symbol(symbol)
+        chat_id = update.effective_chat.id
+        if self.is_admin(update):
+            success, message = self.db.remove_symbol(context.args[0])
+            chat_id, symbol = config.TELEGRAM_CHANNEL_ID, normalize_symbol(context.args[0])
+        else:
+            success, message, symbol = self.db.remove_subscription(chat_id, context.args[0])
         await update.message.reply_text(message)
         
         if success:
-            logger.info(f"Đã xóa {symbol} khỏi watchlist")
+            self.subscriptions.remove(chat_id, symbol)
+            logger.info(f"Đã xóa {symbol} khỏi watchlist của {chat_id}")
     
     async def cmd_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Lệnh /list"""
-        watchlist = self.db.get_watchlist_info()
+        if self.is_admin(update):
+            watchlist = self.db.get_watchlist_info()
+            title = "Danh sách channel đang theo dõi"
+        else:
+            watchlist = self.db.get_chat_subscriptions(update.effective_chat.id)
+            title = "Danh sách bạn đang theo dõi"
         
         if not watchlist:
             await update.message.reply_text("📋 Danh sách theo dõi đang trống")
             return
         
-        msg = f"📋 <b>Danh sách đang theo dõi ({len(watchlist)} coin):</b>\n\n"
+        msg = f"📋 <b>{title} ({len(watchlist)} coin):</b>\n\n"
         
         for idx, item in enumerate(watchlist, 1):
             added_time = item['added_at'].strftime('%d-%m-%Y %H:%M')
@@ -142,6 +272,124 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
         
         await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
     
+    async def cmd_check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /check SYMBOL - Stoch và S/R hiện tại (từ trạng thái scanner, không chờ lần quét)"""
+        if not context.args:
+            await update.message.reply_text("⚠️ Cách dùng: /check BTCUSDT")
+            return
+        
+        started = time.perf_counter()
+        symbol = normalize_symbol(context.args[0])
+        source, states = await self.checker.check(symbol)
+        if not states:
+            await update.message.reply_text(f"❌ Không lấy được dữ liệu {symbol}")
+            return
+        
+        def zone(channel):
+            return f"{channel['low']:.4f} - {channel['high']:.4f}" if channel else "—"
+        
+        msg = f"🔎 <b>{symbol}</b> - giá đóng nến ${states[0]['close']:.4f}\n"
+        for state in states:
+            label = timeframe_label(state['timeframe'])
+            msg += f"\n<b>{label}</b> (nến {state['candle_time'].strftime('%H:%M %d-%m')})\n"
+            msg += f"Stoch: %K {state['stoch_k']:.1f} | %D {state['stoch_d']:.1f}\n"
+            if state['sr_error']:
+                msg += f"S/R: {state['sr_error']}\n"
+                continue
+            if state['in_channel']:
+                msg += f"Trong vùng: {zone(state['in_channel'])}\n"
+            msg += f"Hỗ trợ gần nhất: {zone(state['support'])}\n"
+            msg += f"Kháng cự gần nhất: {zone(state['resistance'])}\n"
+        
+        sources = {'live': 'lần quét gần nhất', 'cache': 'cache', 'fresh': 'vừa tải'}
+        msg += f"\n<i>Dữ liệu: {sources[source]} | {(time.perf_counter() - started) * 1000:.0f}ms</i>"
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+    
+    async def cmd_chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /chart SYMBOL [TF] - ảnh nến + S/R + Stoch (cache theo nến đã đóng)"""
+        labels = {timeframe_label(tf): tf for tf in self.scanner.timeframes}
+        if not context.args:
+            await update.message.reply_text(f"⚠️ Cách dùng: /chart BTCUSDT [{'/'.join(labels)}]")
+            return
+        
+        symbol = normalize_symbol(context.args[0])
+        timeframe = self.scanner.timeframes[-1]
+        if len(context.args) > 1:
+            arg = context.args[1]
+            timeframe = labels.get(arg.upper(), arg.lower())
+            if timeframe not in self.scanner.timeframes:
+                await update.message.reply_text(f"⚠️ Khung hỗ trợ: {', '.join(labels)}")
+                return
+        
+        image, candle = await self.charts.chart(symbol, timeframe)
+        if image is None:
+            await update.message.reply_text(f"❌ Không lấy được dữ liệu {symbol}")
+            return
+        caption = f"{symbol} {timeframe_label(timeframe)} - nến {candle.strftime('%H:%M %d-%m-%Y')}"
+        await update.message.reply_photo(photo=image, caption=caption)
+    
+    async def cmd_alert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /alert SYMBOL PRICE [PRICE2] - báo khi giá chạm mức hoặc vào vùng"""
+        try:
+            prices = sorted(float(arg.replace(',', '')) for arg in (context.args or [])[1:3])
+        except ValueError:
+            prices = []
+        if not prices or prices[0] <= 0:
+            await update.message.reply_text("⚠️ Cách dùng: /alert ETH 3200 hoặc /alert ETH 3200 3250 (vùng)")
+            return
+        
+        symbol = normalize_symbol(context.args[0])
+        low, high = prices[0], prices[-1]
+        
+        # Giá hiện tại (nến đang hình thành): kiểm tra symbol có trên sàn, vùng phải nằm ngoài giá,
+        # cảnh báo chỉ xét giá từ mức này trở đi
+        created_at = self.scanner.clock.now()
+        df = await asyncio.to_thread(self.scanner.fetch_data, symbol, self.alerts.timeframe, 1)
+        if df is None or df.empty:
+            await update.message.reply_text(f"❌ Không lấy được giá {symbol}")
+            return
+        price = float(df['close'].iloc[-1])
+        if low < high and low <= price <= high:
+            await update.message.reply_text(f"⚠️ Giá {symbol} ({price:.4f}) đang nằm trong vùng {low:g} - {high:g}")
+            return
+        
+        chat_id = update.effective_chat.id
+        success, message, alert_id = await asyncio.to_thread(
+            self.db.add_price_alert, chat_id, symbol, low, high, created_at, price
+        )
+        if success:
+            self.alerts.add(alert_id, chat_id, symbol, low, high, created_at, price)
+            target = f"vào vùng {low:g} - {high:g}" if low < high else f"chạm {low:g}"
+            message += f": báo khi giá {target} (hiện tại {price:.4f})"
+        await update.message.reply_text(message)
+    
+    async def cmd_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /alerts - các cảnh báo giá đang chờ của chat"""
+        alerts = await asyncio.to_thread(self.db.get_chat_alerts, update.effective_chat.id)
+        if not alerts:
+            await update.message.reply_text("🔔 Không có cảnh báo giá nào đang chờ")
+            return
+        
+        msg = f"🔔 <b>Cảnh báo giá đang chờ ({len(alerts)}):</b>\n\n"
+        for alert in alerts:
+            low, high = alert['price_low'], alert['price_high']
+            target = f"vùng {low:g} - {high:g}" if low < high else f"{low:g}"
+            msg += f"#{alert['id']} <code>{alert['symbol']}</code> {target}\n"
+        msg += "\nXóa: /unalert ID"
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+    
+    async def cmd_unalert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /unalert ID"""
+        if not context.args or not context.args[0].lstrip('#').isdigit():
+            await update.message.reply_text("⚠️ Cách dùng: /unalert 12 (xem ID bằng /alerts)")
+            return
+        
+        alert_id = int(context.args[0].lstrip('#'))
+        success, message = await asyncio.to_thread(self.db.remove_price_alert, update.effective_chat.id, alert_id)
+        if success:
+            self.alerts.remove([alert_id])
+        await update.message.reply_text(message)
+    
     async def cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Lệnh /help"""
         help_msg = """
@@ -150,6 +398,7 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
 <b>1. Thêm coin theo dõi:</b>
 /add BTCUSDT
 /add BTC (tự động thêm USDT)
+Mỗi người có danh sách riêng, tín hiệu của coin đã thêm được gửi tới chat này
 
 <b>2. Xóa coin:</b>
 /remove BTCUSDT
@@ -157,7 +406,29 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
 <b>3. Xem danh sách:</b>
 /list
 
-<b>4. Tín hiệu Stoch + S/R:</b>
+<b>4. Xem trạng thái hiện tại của coin:</b>
+/check BTCUSDT
+Stoch %K/%D, vùng S/R chứa giá và vùng gần nhất trên từng khung
+/chart BTCUSDT (khung lớn nhất) hoặc /chart BTCUSDT M15 - biểu đồ nến kèm vùng S/R và Stoch
+
+<b>5. Cảnh báo giá:</b>
+/alert ETH 3200 - báo khi giá chạm 3200
+/alert ETH 3200 3250 - báo khi giá vào vùng 3200 - 3250
+/alerts - xem cảnh báo đang chờ
+/unalert 12 - xóa cảnh báo #12
+Giá được xét theo nến M15 đã đóng, mỗi cảnh báo báo một lần
+
+<b>6. Độ trễ gửi tín hiệu:</b>
+/latency
+
+<b>7. Bộ nhớ bot đang dùng:</b>
+/mem
+
+<b>8. Tỷ lệ thắng thực tế:</b>
+/stats (tất cả coin, 30 ngày)
+/stats BTC 7
+
+<b>9. Tín hiệu Stoch + S/R:</b>
 
 🟢 <b>LONG (MUA):</b>
 - Stoch H1 %D < 25 & M15 %D < 20
@@ -174,6 +445,86 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
 """
         await update.message.reply_text(help_msg, parse_mode=ParseMode.HTML)
     
+    async def cmd_latency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /latency - p50/p95/p99 độ trễ từ đóng nến đến khi gửi"""
+        if not self.latency.count:
+            await update.message.reply_text("⏱ Chưa có tín hiệu nào để đo độ trễ")
+            return
+        
+        names = {'fetch': 'Lấy nến', 'decide': 'Tính tín hiệu', 'send': 'Gửi Telegram', 'total': 'Tổng'}
+        msg = f"⏱ <b>Độ trễ {self.latency.count} tín hiệu gần nhất</b> (SLO p95 ≤ {self.latency.slo_seconds:g}s)\n\n"
+        
+        for stage, values in self.latency.summary().items():
+            if values['p50'] is None:
+                continue
+            msg += f"<b>{names[stage]}:</b> p50 {values['p50']:.2f}s | p95 {values['p95']:.2f}s | p99 {values['p99']:.2f}s\n"
+        
+        outbox = await asyncio.to_thread(self.db.outbox_status)
+        msg += f"\n<b>Outbox:</b> chờ gửi {outbox.get('pending', 0)} | đang gửi {outbox.get('sending', 0)} | lỗi {outbox.get('failed', 0)}"
+        
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+    
+    async def cmd_mem(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /mem - RSS, số object và (nếu bật tracemalloc) các dòng code giữ nhiều bộ nhớ nhất"""
+        stats = await asyncio.to_thread(memory_usage.report)
+        fmt = memory_usage.format_bytes
+        
+        msg = "🧠 <b>Bộ nhớ bot</b>\n\n"
+        msg += f"<b>RSS:</b> {fmt(stats['rss'])} (cao nhất {fmt(stats['rss_peak'])})\n"
+        msg += f"<b>Object Python:</b> {stats['gc_objects']:,}\n"
+        msg += f"<b>Kết nối database:</b> {self.db.pool_status()}\n"
+        
+        if not stats['tracing']:
+            msg += "\n<i>Bật MEMORY_TRACE_ENABLED=true để xem chi tiết theo dòng code</i>"
+        else:
+            msg += f"<b>tracemalloc:</b> {fmt(stats['traced'])} (cao nhất {fmt(stats['traced_peak'])})\n"
+            msg += "\n<b>Giữ nhiều nhất:</b>\n"
+            msg += ''.join(f"<code>{where}</code> {fmt(size)}\n" for where, size in stats['top'])
+            if stats.get('growth'):
+                msg += "\n<b>Tăng từ lần /mem trước:</b>\n"
+                msg += ''.join(f"<code>{where}</code> +{fmt(size)}\n" for where, size in stats['growth'])
+        
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+    
+    async def cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lệnh /stats [SYMBOL] [DAYS] - tỷ lệ thắng theo hướng và khung (từ bảng thống kê ngày)"""
+        symbol = None
+        days = config.STATS_DEFAULT_DAYS
+        for arg in context.args or []:
+            if arg.isdigit():
+                days = max(int(arg), 1)
+            else:
+                symbol = normalize_symbol(arg)
+        
+        stats = await asyncio.to_thread(self.db.get_signal_stats, symbol, days)
+        if stats is None:
+            await update.message.reply_text("❌ Lỗi khi lấy thống kê")
+            return
+        
+        title = f"{symbol or 'Tất cả coin'} - {days} ngày"
+        if not stats:
+            await update.message.reply_text(f"📊 {title}: chưa có tín hiệu nào")
+            return
+        
+        msg = f"📊 <b>Thống kê tín hiệu {title}</b>\n"
+        msg += f"<i>Kết quả sau {config.STATS_HORIZON}: TP {config.OUTCOME_TP_PCT:g}% / SL {config.OUTCOME_SL_PCT:g}%</i>\n\n"
+        
+        for row in sorted(stats, key=lambda r: (r['signal_type'], r['timeframes'])):
+            direction = '🟢 LONG' if row['signal_type'] == 'BUY' else '🔴 SHORT'
+            msg += f"<b>{direction} {row['timeframes'] or 'N/A'}</b>: {row['signals']} tín hiệu\n"
+            if not row['evaluated']:
+                msg += "   Chưa có kết quả\n"
+                continue
+            
+            closed = row['wins'] + row['losses']
+            win_rate = f"{row['wins'] / closed * 100:.0f}%" if closed else "-"
+            msg += (f"   Thắng {win_rate} (TP {row['wins']} / SL {row['losses']} / "
+                    f"chưa chạm {row['evaluated'] - closed})\n")
+            msg += (f"   TB: lãi {row['return_sum'] / row['evaluated']:+.2f}% | "
+                    f"MFE {row['mfe_sum'] / row['evaluated']:+.2f}% | MAE {row['mae_sum'] / row['evaluated']:+.2f}%\n")
+        
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+    
     def format_signal_message(self, signal):
         """
         Format message cho tín hiệu
@@ -196,55 +547,232 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
         message = f"🔶 Token: {symbol} (Bybit)\n\n"
         message += f"{icon} Tín hiệu đảo chiều {type_text}\n\n"
         
-        # HIỂN THỊ KHUNG THỜI GIAN CHẠM S/R
-        if 'M15' in timeframes and 'H1' in timeframes:
-            message += f"⏰ Phản ứng với {sr_name} khung M15 & H1\n\n"
-        elif 'M15' in timeframes:
-            message += f"⏰ Phản ứng với {sr_name} khung M15\n\n"
-        elif 'H1' in timeframes:
-            message += f"⏰ Phản ứng với {sr_name} khung H1\n\n"
-        else:
-            message += f"⏰ Khung thời gian: {timeframes}\n\n"
+        # HIỂN THỊ KHUNG THỜI GIAN CHẠM S/R (ví dụ: "M15", "H1", "M15 & H1")
+        if timeframes:
+            message += f"⏰ Phản ứng với {sr_name} khung {timeframes}\n\n"
         
         message += f"💰 Giá xác nhận: ${price:.4f}\n\n"
         
         return message.strip()
     
-    async def send_signal_to_channel(self, signal):
-        """Gửi tín hiệu lên channel"""
-        try:
-            message = self.format_signal_message(signal)
-            
-            await self.app.bot.send_message(
-                chat_id=config.TELEGRAM_CHANNEL_ID,
-                text=message
-            )
-            
-            logger.info(f"Đã gửi tín hiệu {signal['signal_type']} cho {signal['symbol']}")
-            
-            saved = self.db.save_signal(
-                signal_id=signal['signal_id'],
-                symbol=signal['symbol'],
-                signal_type=signal['signal_type'],
-                signal_time=signal['signal_time'],
-                price=signal['price'],
-                stoch_m15=signal['stoch_d_m15'],
-                stoch_h1=signal['stoch_d_h1']
-            )
-            
-            if saved:
-                logger.info(f"Đã lưu tín hiệu vào database (ID: {signal['signal_id']})")
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi gửi tín hiệu: {str(e)}")
+    async def send_message(self, chat_id, message):
+        """Gửi một tin (FanoutDispatcher gọi, lỗi được ném ra để dispatcher xử lý)"""
+        await self.app.bot.send_message(chat_id=chat_id, text=message)
     
-    def filter_signal_by_timeframe(self, signal, scan_timeframe):
+    async def unsubscribe_chat(self, chat_id):
+        """Người dùng đã chặn bot / xóa chat -> bỏ mọi đăng ký của chat đó"""
+        if chat_id == config.TELEGRAM_CHANNEL_ID:
+            logger.error(f"Bot không gửi được tin lên channel {chat_id}")
+            return
+        self.subscriptions.remove_chat(chat_id)
+        self.alerts.remove(self.alerts.chat_alerts(chat_id))
+        removed = await asyncio.to_thread(self.db.remove_chat, chat_id)
+        logger.info(f"Đã xóa {removed} đăng ký của chat {chat_id}")
+    
+    async def check_alerts(self, symbols, close_time):
+        """
+        Xét cảnh báo giá của các symbol tại lần đóng nến rồi gửi các cảnh báo kích hoạt
+        
+        Symbol vừa quét dùng luôn nến lần quét đã tải; symbol bị lịch bỏ qua hoặc
+        chỉ có cảnh báo giá (ngoài watchlist) phải tải nến mới qua kho nến nên tải
+        song song (ALERT_FETCH_CONCURRENCY request).
+        """
+        semaphore = asyncio.Semaphore(config.ALERT_FETCH_CONCURRENCY)
+        
+        async def candles(symbol):
+            async with semaphore:
+                return await asyncio.to_thread(self.alerts.candles, symbol, close_time)
+        
+        frames = await asyncio.gather(*(candles(symbol) for symbol in symbols), return_exceptions=True)
+        hits = []
+        for symbol, df in zip(symbols, frames):
+            if isinstance(df, Exception):
+                logger.error(f"Lỗi khi xét cảnh báo giá {symbol}: {str(df)}")
+                continue
+            hits.extend(self.alerts.update(symbol, df))
+        await self.send_alerts(hits)
+    
+    async def send_alerts(self, hits):
+        """
+        Gửi các cảnh báo giá vừa kích hoạt: [(id, ngưỡng bị chạm)]
+        
+        Chỉ gửi cảnh báo đánh dấu được trong database (mỗi cảnh báo một lần).
+        """
+        if not hits:
+            return
+        marked = await asyncio.to_thread(self.db.mark_alerts_triggered, hits)
+        for alert_id, price in hits:
+            if alert_id not in marked:
+                continue
+            chat_id, symbol, low, high = self.alerts.alert(alert_id)
+            target = f"vào vùng {low:g} - {high:g}" if low < high else f"chạm {low:g}"
+            self.dispatcher.add_signal(chat_id, f"🔔 {symbol}: giá {target} (cảnh báo #{alert_id})", priority=0)
+        self.alerts.remove([alert_id for alert_id, _ in hits])
+        self.dispatcher.flush()
+        logger.info(f"Cảnh báo giá: {len(marked)}/{len(hits)} cảnh báo kích hoạt")
+    
+    async def enqueue_signals(self, signals):
+        """
+        Ghi các tín hiệu vừa quyết định vào outbox - một lần ghi database, không chờ gửi
+        
+        Returns:
+            int: Số tín hiệu mới (chưa worker/lần quét nào giành)
+        """
+        signals = [s for s in signals if self.subscriptions.subscribers(s['symbol'])]
+        if not signals:
+            return 0
+        
+        claimed = await asyncio.to_thread(
+            self.db.enqueue_signals, [(signal, self.format_signal_message(signal)) for signal in signals]
+        )
+        if claimed:
+            logger.info(f"Đã ghi {len(claimed)} tín hiệu vào outbox: {', '.join(claimed)}")
+            self.wake_outbox()
+        return len(claimed)
+    
+    def wake_outbox(self):
+        """Báo outbox có tín hiệu mới (chạy vòng gửi nếu worker này được gửi)"""
+        if self.shards is not None and not self.shards.is_leader:
+            return
+        if self.outbox_task is None or self.outbox_task.done():
+            self.outbox_task = asyncio.create_task(self.outbox_loop())
+        self.outbox_wakeup.set()
+    
+    async def deliver_signal(self, row):
+        """
+        Gửi một tín hiệu trong outbox
+        
+        Channel (nếu theo dõi symbol) được gửi với ưu tiên cao nhất và chờ
+        Telegram xác nhận để đo độ trễ. Người dùng đăng ký symbol nhận tin tổng
+        hợp các tín hiệu cùng lượt gửi (xem FanoutDispatcher). Channel không
+        theo dõi symbol -> chỉ đánh dấu đã gửi khi các tin tổng hợp gửi xong
+        (settle_outbox), dòng outbox vẫn được giữ đến lúc đó.
+        
+        Returns:
+            bool: True nếu đã gửi (hoặc đã xếp hàng gửi), False nếu lỗi (outbox hẹn lần thử sau)
+        """
+        signal_id = row['signal_id']
+        subscribers = self.subscriptions.subscribers(row['symbol'])
+        
+        acked_at = None
+        if config.TELEGRAM_CHANNEL_ID in subscribers:
+            if not await self.dispatcher.send_now(config.TELEGRAM_CHANNEL_ID, row['text']):
+                attempts = row['attempts'] + 1
+                retry = await asyncio.to_thread(self.db.retry_outbox, row['id'], attempts,
+                                                'Gửi lên channel thất bại', self.worker_id)
+                if retry:
+                    logger.warning(f"Gửi {signal_id} thất bại (lần {attempts}), sẽ thử lại")
+                else:
+                    logger.error(f"Gửi {signal_id} thất bại {attempts} lần, đánh dấu 'failed' trong outbox")
+                return False
+            acked_at = self.scanner.clock.time()
+            logger.info(f"Đã gửi tín hiệu {signal_id}")
+        
+        digests = [self.dispatcher.add_signal(chat_id, row['text'])
+                   for chat_id in subscribers if chat_id != config.TELEGRAM_CHANNEL_ID]
+        if acked_at is None and digests:
+            task = asyncio.create_task(self.settle_outbox(row, digests))
+            self.settling[row['id']] = (row, digests, task)
+            task.add_done_callback(lambda _: self.settling.pop(row['id'], None))
+            return True
+        
+        total = None
+        if acked_at is not None and row['candle_close_at'] is not None:
+            seconds = self.latency.record({
+                'candle_close_at': row['candle_close_at'], 'data_received_at': row['data_received_at'],
+                'decided_at': row['decided_at'], 'acked_at': to_utc(acked_at),
+            })
+            total = seconds.get('total')
+            if total is not None:
+                logger.info(f"Độ trễ {signal_id}: tổng {total:.2f}s (lấy nến {seconds.get('fetch', 0):.2f}s, "
+                            f"tính {seconds.get('decide', 0):.2f}s, gửi {seconds.get('send', 0):.2f}s)")
+        if not await asyncio.to_thread(self.db.mark_outbox_delivered, row['id'], signal_id, self.worker_id,
+                                       acked_at, None if total is None else int(total * 1000)):
+            logger.warning(f"Không đánh dấu được {signal_id} đã gửi (lỗi hoặc worker khác đã giành lại)")
+        return True
+    
+    async def settle_outbox(self, row, digests):
+        """
+        Đánh dấu tín hiệu chỉ gửi tới người dùng sau khi các tin tổng hợp chứa nó gửi xong
+        
+        Không người dùng nào nhận được -> hẹn lần thử sau như khi gửi channel lỗi.
+        """
+        results = await asyncio.gather(*digests)
+        if any(results):
+            if not await asyncio.to_thread(self.db.mark_outbox_delivered, row['id'], row['signal_id'], self.worker_id):
+                logger.warning(f"Không đánh dấu được {row['signal_id']} đã gửi (lỗi hoặc worker khác đã giành lại)")
+            return
+        attempts = row['attempts'] + 1
+        if await asyncio.to_thread(self.db.retry_outbox, row['id'], attempts, 'Gửi tới người dùng thất bại',
+                                   self.worker_id):
+            logger.warning(f"Gửi {row['signal_id']} tới người dùng thất bại (lần {attempts}), sẽ thử lại")
+        else:
+            logger.error(f"Gửi {row['signal_id']} thất bại {attempts} lần, đánh dấu 'failed' trong outbox")
+    
+    async def deliver_outbox(self):
+        """
+        Gửi một lượt tín hiệu đến hạn trong outbox
+        
+        Returns:
+            int: Số tín hiệu đã lấy ra (0 nếu outbox trống)
+        """
+        rows = await asyncio.to_thread(self.db.get_due_outbox, config.OUTBOX_BATCH, self.worker_id)
+        if not rows:
+            return 0
+        
+        results = await asyncio.gather(*(self.deliver_signal(row) for row in rows))
+        digests = self.dispatcher.flush()
+        stats = self.dispatcher.stats()
+        logger.info(f"Outbox: gửi {sum(results)}/{len(rows)} tín hiệu, {digests} tin tổng hợp tới người dùng "
+                    f"(hàng đợi {stats['queued']} tin / {stats['chats']} chat)")
+        await self.check_latency_slo()
+        return len(rows)
+    
+    async def outbox_loop(self):
+        """Vòng gửi outbox: gửi ngay khi lần quét ghi tín hiệu mới, kiểm tra định kỳ cho lần thử lại"""
+        while True:
+            try:
+                self.outbox_wakeup.clear()
+                # Dòng đang chờ tin tới người dùng: giữ quyền gửi, worker khác không giành lại
+                if self.settling:
+                    await asyncio.to_thread(self.db.refresh_outbox_claims, list(self.settling), self.worker_id)
+                if self.shards is None or self.shards.is_leader:
+                    if await self.deliver_outbox():
+                        continue
+                try:
+                    await asyncio.wait_for(self.outbox_wakeup.wait(), config.OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi khi gửi outbox: {str(e)}")
+                await asyncio.sleep(config.OUTBOX_POLL_INTERVAL)
+    
+    async def check_latency_slo(self):
+        """Báo động khi p95 độ trễ đóng nến -> Telegram vượt LATENCY_SLO_SECONDS"""
+        p95 = self.latency.check_slo()
+        if p95 is None:
+            return
+        
+        total = self.latency.summary()['total']
+        message = (f"⚠️ Độ trễ tín hiệu vượt SLO: p95 {p95:.2f}s > {self.latency.slo_seconds:g}s "
+                   f"(p50 {total['p50']:.2f}s, p99 {total['p99']:.2f}s, {self.latency.count} tín hiệu)")
+        logger.warning(message)
+        
+        if config.LATENCY_ALERT_CHAT_ID:
+            try:
+                await self.app.bot.send_message(chat_id=config.LATENCY_ALERT_CHAT_ID, text=message)
+            except Exception as e:
+                logger.error(f"Lỗi khi gửi báo động độ trễ: {str(e)}")
+    
+    def filter_signal_by_timeframe(self, signal, closed_timeframes):
         """
         Lọc tín hiệu theo timeframe đang quét
         
         Args:
             signal: Tín hiệu từ scanner
-            scan_timeframe: 'm15', 'h1', hoặc 'both'
+            closed_timeframes: Danh sách timeframe vừa đóng nến
             
         Returns:
             bool: True nếu được phép gửi, False nếu bỏ qua
@@ -252,23 +780,138 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
         if not signal:
             return False
         
-        timeframes = signal.get('timeframes', '')
+        # Chỉ gửi khi nến khung vào lệnh vừa đóng. Nến khung bối cảnh scanner xét
+        # luôn là nến đã đóng (closed_candles) nên tín hiệu chạm S/R bối cảnh ở
+        # lần quét giữa giờ (:15/:30/:45) đã chốt, không cần đợi nến bối cảnh đóng -
+        # đợi thì tín hiệu mất hẳn vì nến vào lệnh sau không tạo lại tín hiệu này
+        return signal.get('entry_timeframe', '15m') in closed_timeframes
+    
+    async def scan_symbols(self, symbols, timeframes, close_time):
+        """
+        Quét danh sách symbol tại một lần đóng nến
         
-        # Nếu đang quét H1 (cả H1 và M15 đóng cùng lúc)
-        if scan_timeframe == 'both':
-            # Gửi tất cả tín hiệu (cả M15 only, H1 only, và M15 & H1)
-            return True
+        Tín hiệu được ghi vào outbox một lần khi quét xong (gửi ở outbox_loop).
         
-        # Nếu đang quét M15 (chỉ M15 đóng, H1 chưa đóng)
-        elif scan_timeframe == 'm15':
-            # CHỈ gửi tín hiệu M15 only (không có H1)
-            # Nếu có H1 thì đợi đến khi H1 đóng
-            if 'H1' in timeframes:
-                logger.debug(f"Bỏ qua tín hiệu {signal['symbol']} (có H1, đợi đến giờ :00)")
-                return False
-            return True
+        Returns:
+            tuple: (số tín hiệu mới, số symbol bỏ qua, các symbol sàn chưa chốt nến)
+        """
+        decided = []
+        skipped_count = 0
+        lagging = []
+        alert_symbols = []
         
-        return False
+        for symbol in symbols:
+            try:
+                # Stoch chưa thể thỏa ngưỡng -> không cần lấy dữ liệu để tìm tín hiệu
+                if not self.scanner.is_due(symbol, timeframes, close_time):
+                    skipped_count += 1
+                else:
+                    # Quét ở thread riêng: chờ weight Binance không chặn bot
+                    signals = await asyncio.to_thread(self.scanner.scan_symbol, symbol, timeframes, close_time)
+                    
+                    # Sàn chưa trả nến vừa đóng -> quét lại sau
+                    if signals is None:
+                        lagging.append(symbol)
+                        continue
+                    
+                    # Lọc tín hiệu theo timeframe
+                    decided.extend(signal for signal in signals if self.filter_signal_by_timeframe(signal, timeframes))
+                
+                if symbol in self.alerts:
+                    alert_symbols.append(symbol)
+                
+            except Exception as e:
+                logger.error(f"Lỗi khi quét {symbol}: {str(e)}")
+                continue
+        
+        signal_count = await self.enqueue_signals(decided)
+        await self.check_alerts(alert_symbols, close_time)
+        return signal_count, skipped_count, lagging
+    
+    async def run_scan(self, close_time, timeframes):
+        """
+        Quét toàn bộ watchlist tại một lần đóng nến
+        
+        Returns:
+            dict: {'symbols', 'signals', 'skipped', 'repolled', 'lagging', 'seconds'}, None nếu watchlist trống
+        """
+        scan_started = time.perf_counter()
+        labels = ' & '.join(timeframe_label(tf) for tf in timeframes)
+        logger.info(f"┌{'─'*78}┐")
+        logger.info(f"│ BẮT ĐẦU QUÉT ({labels})".ljust(79) + "│")
+        logger.info(f"└{'─'*78}┘")
+        
+        # Hợp các symbol được đăng ký (channel + người dùng), mỗi symbol quét một lần
+        await self.refresh_subscriptions()
+        symbols = sorted(self.subscriptions.symbols())
+        # Symbol chỉ có cảnh báo giá: không quét tín hiệu, chỉ lấy nến qua kho nến
+        alert_symbols = sorted(self.alerts.symbols() - set(symbols))
+        
+        if not symbols and not alert_symbols:
+            logger.warning("Không có symbol nào trong watchlist")
+            return None
+        
+        # Nhiều worker -> chỉ quét phần symbol thuộc worker này
+        if self.shards is not None:
+            self.shards.refresh()
+            total = len(symbols)
+            symbols = self.shards.filter_symbols(symbols)
+            alert_symbols = self.shards.filter_symbols(alert_symbols)
+            logger.info(f"Worker {self.shards.worker_id}: {len(symbols)}/{total} symbols ({len(self.shards.workers)} worker)")
+        
+        logger.info(f"Quét {len(symbols)} symbols...")
+        
+        signal_count, skipped_count, lagging = await self.scan_symbols(symbols, timeframes, close_time)
+        await self.check_alerts(alert_symbols, close_time)
+        repolled = len(lagging)
+        
+        # Chỉ quét lại các symbol sàn chưa chốt nến
+        for attempt in range(1, config.CLOSE_REPOLL_ATTEMPTS + 1):
+            if not lagging:
+                break
+            await asyncio.sleep(config.CLOSE_REPOLL_DELAY)
+            logger.info(f"Quét lại {len(lagging)} symbols chưa có nến đóng (lần {attempt})")
+            sent, _, lagging = await self.scan_symbols(lagging, timeframes, close_time)
+            signal_count += sent
+        
+        if lagging:
+            logger.warning(f"Bỏ qua {len(lagging)} symbols chưa có nến đóng: {', '.join(lagging)}")
+        
+        if skipped_count:
+            logger.info(f"Bỏ qua {skipped_count} symbols (Stoch chưa thể thỏa ngưỡng)")
+        
+        weight = self.scanner.governor.stats()
+        logger.info(f"Weight Binance: {weight['used']}/{weight['limit']} ({weight['utilization']:.0%}), "
+                    f"chờ {weight['wait_seconds']:.1f}s, bị giới hạn {weight['rate_limited']} lần")
+        
+        if self.scanner.fetcher is not None:
+            fetch = self.scanner.fetcher.stats()
+            if fetch['p99'] is not None:
+                hosts = ', '.join(f"{host} {h['state']}" for host, h in fetch['hosts'].items() if h['state'] != 'closed')
+                logger.info(f"REST Binance: p50 {fetch['p50']:.2f}s, p95 {fetch['p95']:.2f}s, p99 {fetch['p99']:.2f}s, "
+                            f"dự phòng {fetch['hedges']} lần (thắng {fetch['hedge_wins']}), "
+                            f"đổi host {fetch['failovers']} lần" + (f", ngắt: {hosts}" if hosts else ""))
+        
+        logger.info(f"┌{'─'*78}┐")
+        logger.info(f"│ HOÀN THÀNH: {signal_count} tín hiệu mới (đã ghi outbox)".ljust(79) + "│")
+        logger.info(f"└{'─'*78}┘")
+        
+        if not startup_timer.first_scan_reported:
+            startup_timer.first_scan_reported = True
+            startup_timer.add('first_scan', time.perf_counter() - scan_started)
+            startup_timer.report()
+        
+        if config.CHECKPOINT_ENABLED:
+            await self.save_checkpoint()
+        
+        return {
+            'symbols': len(symbols),
+            'signals': signal_count,
+            'skipped': skipped_count,
+            'repolled': repolled,
+            'lagging': len(lagging),
+            'seconds': time.perf_counter() - scan_started,
+        }
     
     async def scan_loop(self):
         """Vòng lặp quét tín hiệu - BÁO ĐÚNG TIMEFRAME"""
@@ -276,59 +919,12 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
         
         while True:
             try:
-                # Kiểm tra xem có nên quét không
-                should_scan, timeframe = self.should_scan_now()
-                
-                if not should_scan:
-                    # Chưa đến lúc quét, đợi 30 giây
-                    await asyncio.sleep(30)
-                    continue
-                
-                # Đến lúc quét
-                logger.info(f"┌{'─'*78}┐")
-                logger.info(f"│ BẮT ĐẦU QUÉT ({timeframe.upper()})".ljust(79) + "│")
-                logger.info(f"└{'─'*78}┘")
-                
-                symbols = self.db.get_active_symbols()
-                
-                if not symbols:
-                    logger.warning("Không có symbol nào trong watchlist")
-                    await asyncio.sleep(30)
-                    continue
-                
-                logger.info(f"Quét {len(symbols)} symbols...")
-                
-                signal_count = 0
-                for symbol in symbols:
-                    try:
-                        signal = self.scanner.check_signal(symbol)
-                        
-                        # Lọc tín hiệu theo timeframe
-                        if not self.filter_signal_by_timeframe(signal, timeframe):
-                            continue
-                        
-                        if signal:
-                            signal_id = signal['signal_id']
-                            
-                            if not self.db.check_signal_exists(signal_id):
-                                await self.send_signal_to_channel(signal)
-                                signal_count += 1
-                            else:
-                                logger.debug(f"Signal {signal_id} đã tồn tại, skip")
-                        
-                        await asyncio.sleep(1)
-                        
-                    except Exception as e:
-                        logger.error(f"Lỗi khi quét {symbol}: {str(e)}")
-                        continue
-                
-                logger.info(f"┌{'─'*78}┐")
-                logger.info(f"│ HOÀN THÀNH: Gửi {signal_count} tín hiệu mới".ljust(79) + "│")
-                logger.info(f"└{'─'*78}┘")
-                
-                # Đợi 30 giây trước khi check lại
-                await asyncio.sleep(30)
+                # Ngủ đến đúng thời điểm đóng nến kế tiếp
+                close_time, timeframes = await self.wait_for_close()
+                await self.run_scan(close_time, timeframes)
                 
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Lỗi trong vòng lặp quét: {str(e)}")
                 await asyncio.sleep(60)
@@ -339,18 +935,142 @@ Chào mừng! Bot sẽ tự động gửi tín hiệu:
         
         await self.app.initialize()
         await self.app.start()
-        await self.app.updater.start_polling(drop_pending_updates=True)
+        
+        if self.shards is not None:
+            # Chỉ leader nhận lệnh Telegram (nhiều worker cùng polling sẽ bị Conflict)
+            self.shards.refresh()
+            await self.sync_polling()
+            self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        else:
+            await self.app.updater.start_polling(drop_pending_updates=True)
+        
+        if config.AGGTRADE_ENABLED and config.AGGTRADE_SYMBOLS:
+            self.start_aggtrade_stream()
+        
+        # Tin chưa gửi xong ở lần chạy trước
+        pending = self.db.pop_pending_deliveries()
+        if pending:
+            self.dispatcher.restore((parse_chat_id(chat_id), text, priority, attempts)
+                                    for chat_id, text, priority, attempts in pending)
+            logger.info(f"Gửi tiếp {len(pending)} tin chưa gửi ở lần chạy trước")
+        
+        self.retention_task = asyncio.create_task(self.retention_loop())
+        self.outbox_task = asyncio.create_task(self.outbox_loop())
+        if config.OUTCOME_ENABLED:
+            self.outcome_task = asyncio.create_task(self.outcome_loop())
+        
+        startup_timer.mark('telegram')
+        startup_timer.report()
+        
+        # Import ccxt ở thread riêng trong lúc chờ nến đóng (không chặn khởi động)
+        self.warmup_task = asyncio.create_task(asyncio.to_thread(get_exchange))
         
         logger.info("Bot đã sẵn sàng! Chỉ báo tín hiệu đúng timeframe khi nến đóng")
         
         await self.scan_loop()
     
+    async def sync_polling(self):
+        """Bật/tắt nhận lệnh Telegram theo vai trò leader"""
+        if self.shards.is_leader and not self.app.updater.running:
+            logger.info(f"Worker {self.shards.worker_id} là leader, bắt đầu nhận lệnh")
+            await self.app.updater.start_polling(drop_pending_updates=True)
+        elif not self.shards.is_leader and self.app.updater.running:
+            logger.info(f"Worker {self.shards.worker_id} không còn là leader, dừng nhận lệnh")
+            await self.app.updater.stop()
+    
+    async def heartbeat_loop(self):
+        """Gửi heartbeat định kỳ để các worker khác biết worker này còn sống"""
+        while True:
+            try:
+                await asyncio.sleep(config.WORKER_HEARTBEAT_INTERVAL)
+                self.shards.refresh()
+                await self.sync_polling()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi heartbeat: {str(e)}")
+    
+    async def retention_loop(self):
+        """Định kỳ lưu trữ tín hiệu cũ ra file và xóa khỏi database (chỉ leader khi chạy nhiều worker)"""
+        while True:
+            try:
+                if self.shards is None or self.shards.is_leader:
+                    archived = await asyncio.to_thread(self.db.archive_old_signals)
+                    if archived:
+                        logger.info(f"Đã lưu trữ {archived} tín hiệu cũ vào {config.SIGNAL_ARCHIVE_DIR}")
+                    purged = await asyncio.to_thread(self.db.purge_outbox)
+                    if purged:
+                        logger.info(f"Đã dọn {purged} dòng outbox đã gửi")
+                    purged = await asyncio.to_thread(self.db.purge_price_alerts)
+                    if purged:
+                        logger.info(f"Đã dọn {purged} cảnh báo giá đã kích hoạt")
+                await asyncio.sleep(config.SIGNAL_RETENTION_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi lưu trữ tín hiệu: {str(e)}")
+                await asyncio.sleep(config.SIGNAL_RETENTION_INTERVAL)
+    
+    async def outcome_loop(self):
+        """Định kỳ đánh giá kết quả thực tế của các tín hiệu đã gửi (chỉ leader khi chạy nhiều worker)"""
+        tracker = OutcomeTracker(self.db, self.scanner)
+        while True:
+            try:
+                if self.shards is None or self.shards.is_leader:
+                    # Lượt đầy và có tín hiệu đánh giá xong -> còn tồn đọng, làm tiếp ngay
+                    while True:
+                        result = await asyncio.to_thread(tracker.run)
+                        if result['rows']:
+                            logger.info(f"Đánh giá kết quả {result['signals']} tín hiệu -> "
+                                        f"{result['rows']} dòng ({result['completed']} tín hiệu xong) "
+                                        f"trong {result['seconds']:.2f}s")
+                        if result['signals'] < config.OUTCOME_BATCH or not result['completed']:
+                            break
+                await asyncio.sleep(config.OUTCOME_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi đánh giá kết quả tín hiệu: {str(e)}")
+                await asyncio.sleep(config.OUTCOME_INTERVAL)
+    
+    def start_aggtrade_stream(self):
+        """Bật stream aggTrade cho CVD chính xác của các symbol volume lớn"""
+        self.scanner.trade_buckets = TradeBucketStore()
+        self.aggtrade_stream = AggTradeStream(self.scanner.trade_buckets, config.AGGTRADE_SYMBOLS)
+        self.aggtrade_task = asyncio.create_task(self.aggtrade_stream.run())
+    
     async def stop_bot(self):
         """Dừng bot"""
         logger.info("Đang dừng bot...")
-        await self.app.updater.stop()
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        if self.retention_task is not None:
+            self.retention_task.cancel()
+        if self.outcome_task is not None:
+            self.outcome_task.cancel()
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+        self.charts.shutdown()
+        # Tin tổng hợp chưa gửi được lưu lại -> dòng outbox chờ chúng coi như đã gửi (cùng transaction)
+        settling = [(row['id'], row['signal_id']) for row, digests, _ in self.settling.values()
+                    if not all(digest.done() for digest in digests)]
+        for _, _, task in list(self.settling.values()):
+            task.cancel()
+        saved = self.db.save_pending_deliveries(await self.dispatcher.stop(), settling, self.worker_id)
+        if saved:
+            logger.info(f"Đã lưu {saved} tin chưa gửi, sẽ gửi tiếp ở lần chạy sau")
+        if self.app.updater.running:
+            await self.app.updater.stop()
         await self.app.stop()
         await self.app.shutdown()
+        if self.aggtrade_stream is not None:
+            self.aggtrade_stream.stop()
+        if self.scanner.fetcher is not None:
+            self.scanner.fetcher.close()
+        if self.shards is not None:
+            self.shards.leave()
+        if config.CHECKPOINT_ENABLED:
+            await self.save_checkpoint()
         self.db.close()
         logger.info("Bot đã dừng")
     
@@ -0,0 +1,210 @@
+"""
+Replay file aggTrades của nhiều symbol, so delta từng nến với klines
+
+Cách dùng:
+    python test_aggtrade_replay.py DIR [--min-symbols 50]
+    python test_aggtrade_replay.py --synthetic 60 [--days 2]
+
+DIR chứa file tải từ https://data.binance.vision (spot/daily), mỗi symbol:
+    {SYMBOL}-aggTrades-{DATE}.zip   (aggTrades)
+    {SYMBOL}-15m-{DATE}.zip         (klines cùng khung AGGTRADE_TIMEFRAME)
+--synthetic: tạo file cùng định dạng cho N symbol giả (stream bắt đầu giữa
+nến, một số symbol mất một đoạn id như khi mất kết nối) rồi replay như trên.
+
+Với mỗi nến bucket đánh dấu đủ lệnh: delta từ aggTrades phải bằng delta
+klines 2 * taker_buy_volume - volume. Nến còn lại phải dùng delta klines.
+In ra tốc độ xử lý, bộ nhớ bucket và số nến đã so của từng symbol.
+"""
+
+import argparse
+import glob
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aggtrade_cvd import AGGTRADE_FILE_COLUMNS, TradeBucketStore, replay_trade_file
+from candle_store import timeframe_delta
+from fake_exchange import synthetic_symbols
+import config
+
+# Cột file klines của data.binance.vision
+KLINE_FILE_COLUMNS = [
+    'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume',
+    'trades', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore'
+]
+
+
+def load_klines(paths):
+    """
+    Klines từ các file CSV (open time ms hoặc microsecond)
+    
+    Returns:
+        DataFrame: index open time (giờ Việt Nam), cột volume, delta
+    """
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path, header=None, names=KLINE_FILE_COLUMNS)
+        df = df[pd.to_numeric(df['open_time'], errors='coerce').notna()]
+        frames.append(df)
+    df = pd.concat(frames)
+    
+    open_time = df['open_time'].to_numpy(dtype=np.int64)
+    if len(open_time) and open_time[0] > 10**14:
+        open_time = open_time // 1000
+    volume = df['volume'].to_numpy(dtype=np.float64)
+    taker_buy = df['taker_buy_volume'].to_numpy(dtype=np.float64)
+    
+    index = pd.to_datetime(open_time, unit='ms', utc=True).tz_convert(config.TIMEZONE)
+    return pd.DataFrame({'volume': volume, 'delta': 2 * taker_buy - volume}, index=index).sort_index()
+
+
+def find_files(directory, timeframe):
+    """
+    Returns:
+        dict: symbol -> ([file aggTrades], [file klines]) theo ngày
+    """
+    files = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.zip')) + glob.glob(os.path.join(directory, '*.csv'))):
+        match = re.match(rf'([A-Z0-9]+)-(aggTrades|{timeframe})-', os.path.basename(path))
+        if match:
+            entry = files.setdefault(match.group(1), ([], []))
+            entry[0 if match.group(2) == 'aggTrades' else 1].append(path)
+    return {symbol: entry for symbol, entry in files.items() if entry[0] and entry[1]}
+
+
+def write_synthetic(directory, symbols, days, timeframe, seed=0):
+    """
+    Tạo file aggTrades + klines giả khớp nhau
+    
+    Stream bắt đầu sau open time nến đầu (file aggTrades thiếu các lệnh đầu),
+    một phần ba số symbol mất một đoạn id giữa ngày. Klines tính từ toàn bộ lệnh.
+    """
+    rng = np.random.default_rng(seed)
+    interval_ms = int(timeframe_delta(timeframe).total_seconds() * 1000)
+    start = pd.Timestamp('2024-01-01', tz='UTC').value // 10**6
+    candles = days * 86_400_000 // interval_ms
+    
+    for n, symbol in enumerate(symbols):
+        counts = rng.integers(20, 400, candles)
+        open_times = start + np.arange(candles, dtype=np.int64) * interval_ms
+        timestamps = np.repeat(open_times, counts) + np.concatenate(
+            [np.sort(rng.integers(0, interval_ms, count)) for count in counts]
+        )
+        quantities = np.round(rng.exponential(1.0, len(timestamps)), 6)
+        is_buyer_maker = rng.random(len(timestamps)) < 0.5
+        ids = np.arange(len(timestamps), dtype=np.int64) + 1_000_000
+        prices = 100 + np.cumsum(rng.normal(0, 0.05, len(timestamps)))
+        
+        slot = np.repeat(np.arange(candles), counts)
+        volume = np.bincount(slot, quantities, candles)
+        taker_buy = np.bincount(slot[~is_buyer_maker], quantities[~is_buyer_maker], candles)
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        klines = pd.DataFrame({
+            'open_time': open_times,
+            'open': prices[bounds[:-1]],
+            'high': np.maximum.reduceat(prices, bounds[:-1]),
+            'low': np.minimum.reduceat(prices, bounds[:-1]),
+            'close': prices[bounds[1:] - 1],
+            'volume': volume,
+            'close_time': open_times + interval_ms - 1,
+            'quote_volume': np.bincount(slot, quantities * prices, candles),
+            'trades': counts,
+            'taker_buy_volume': taker_buy,
+            'taker_buy_quote_volume': 0.0,
+            'ignore': 0,
+        })
+        
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[:rng.integers(1, counts[0])] = False
+        if n % 3 == 0:
+            gap = rng.integers(len(timestamps) // 3, len(timestamps) // 2)
+            keep[gap:gap + rng.integers(1, 200)] = False
+        trades = pd.DataFrame({
+            'agg_trade_id': ids, 'price': prices, 'quantity': quantities, 'first_trade_id': ids,
+            'last_trade_id': ids, 'transact_time': timestamps, 'is_buyer_maker': is_buyer_maker,
+            'is_best_match': True,
+        })[keep]
+        
+        for day in range(days):
+            date = (pd.Timestamp('2024-01-01') + pd.Timedelta(days=day)).strftime('%Y-%m-%d')
+            begin, end = start + day * 86_400_000, start + (day + 1) * 86_400_000
+            in_day = (trades['transact_time'] >= begin) & (trades['transact_time'] < end)
+            trades[in_day].to_csv(os.path.join(directory, f"{symbol}-aggTrades-{date}.csv"),
+                                  header=False, index=False, columns=AGGTRADE_FILE_COLUMNS)
+            in_day = (klines['open_time'] >= begin) & (klines['open_time'] < end)
+            klines[in_day].to_csv(os.path.join(directory, f"{symbol}-{timeframe}-{date}.csv"),
+                                  header=False, index=False, columns=KLINE_FILE_COLUMNS)
+
+
+def test_aggtrade_replay(directory, min_symbols=50):
+    store = TradeBucketStore()
+    files = find_files(directory, store.timeframe)
+    
+    print(f"\n{'='*80}")
+    print(f"REPLAY aggTrades: {len(files)} symbols - khung {store.timeframe} - {store.capacity} bucket")
+    print(f"{'='*80}\n")
+    assert len(files) >= min_symbols, f"Cần ít nhất {min_symbols} symbol có cả aggTrades và klines, có {len(files)}"
+    
+    total_trades = 0
+    total_seconds = 0.0
+    total_compared = 0
+    total_fallback = 0
+    failures = []
+    
+    for symbol, (trade_paths, kline_paths) in sorted(files.items()):
+        for path in trade_paths:
+            result = replay_trade_file(store, symbol, path)
+            total_trades += result['trades']
+            total_seconds += result['seconds']
+        
+        klines = load_klines(kline_paths)
+        buckets = store.candles(symbol)
+        complete = buckets[buckets['complete']].index.intersection(klines.index)
+        
+        # Nến đủ lệnh: delta aggTrades = delta klines
+        expected = klines.loc[complete, 'delta'].to_numpy()
+        actual = buckets.loc[complete, 'delta'].to_numpy()
+        tolerance = 1e-9 * klines.loc[complete, 'volume'].to_numpy() + 1e-8
+        mismatched = np.abs(actual - expected) > tolerance
+        
+        # delta_for: nến đủ lệnh lấy từ bucket, nến còn lại giữ delta klines
+        delta = store.delta_for(symbol, klines.index, klines['delta'].to_numpy())
+        from_buckets = klines.index.isin(complete)
+        fallback_ok = np.array_equal(delta[~from_buckets], klines['delta'].to_numpy()[~from_buckets])
+        
+        total_compared += len(complete)
+        total_fallback += int((~from_buckets).sum())
+        status = "OK" if not mismatched.any() and fallback_ok and len(complete) else "LỖI"
+        print(f"  {symbol:<14} | so {len(complete):>4} nến | dùng klines {int((~from_buckets).sum()):>3} nến | "
+              f"lệch {int(mismatched.sum())} | {status}")
+        if status != "OK":
+            failures.append(symbol)
+    
+    rate = total_trades / total_seconds if total_seconds > 0 else 0
+    print(f"\nTổng: {total_trades:,} lệnh - {rate:,.0f} lệnh/giây")
+    print(f"Bộ nhớ bucket: {store.memory_usage() / 1024:.1f} KB")
+    print(f"Đã so {total_compared} nến đủ lệnh, {total_fallback} nến dùng delta klines")
+    print(f"\n{'='*80}\n")
+    
+    assert not failures, f"Delta aggTrades khác klines: {', '.join(failures)}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay aggTrades nhiều symbol và so delta với klines')
+    parser.add_argument('directory', nargs='?', help='Thư mục file aggTrades + klines của data.binance.vision')
+    parser.add_argument('--min-symbols', type=int, default=50, help='Số symbol tối thiểu phải replay')
+    parser.add_argument('--synthetic', type=int, default=0, help='Tạo dữ liệu giả cho N symbol')
+    parser.add_argument('--days', type=int, default=2, help='Số ngày dữ liệu giả')
+    args = parser.parse_args()
+    
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as workdir:
+            write_synthetic(workdir, synthetic_symbols(args.synthetic), args.days, config.AGGTRADE_TIMEFRAME)
+            test_aggtrade_replay(workdir, min(args.min_symbols, args.synthetic))
+    elif args.directory:
+        test_aggtrade_replay(args.directory, args.min_symbols)
+    else:
+        parser.error("Cần DIR hoặc --synthetic N")
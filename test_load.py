@@ -0,0 +1,232 @@
+"""
+Load test bot với sàn giả (fake_exchange.py) - không cần Binance/Telegram thật
+
+Chạy TelegramBot.scan_loop thật trên N symbol giả. Giờ của sàn giả được
+đặt ngay trước mỗi lần đóng nến nên các lần quét chạy liên tiếp, không phải
+chờ 15 phút. Database là file SQLite tạm.
+
+Cách dùng:
+    python test_load.py [--symbols 1000] [--scans 4] [--latency 0.02]
+                        [--tail-probability 0.01 --tail-latency 3]
+                        [--error-rate 0.005] [--lag-probability 0.05]
+                        [--recording market.npz] [--verbose]
+                        [--users 10000 --user-symbols 5] [--alerts 50000]
+
+In ra thời gian và tốc độ mỗi lần quét, độ trễ từ lúc đóng nến đến khi quét
+xong/tin nhắn tới Telegram giả, độ trễ REST p50/p95/p99. Với --users, mỗi
+người dùng giả đăng ký ngẫu nhiên --user-symbols symbol để đo phần gửi tới
+người dùng (số lần quét không đổi). Với --alerts, sau lần quét đầu tạo
+cảnh báo giá giả quanh giá đóng hiện tại (±ALERT_SPREAD) của mọi symbol.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from fake_exchange import (FakeExchange, FakeExchangeServer, M15_MS, RecordedMarket,
+                           SyntheticMarket, synthetic_symbols)
+
+ALERT_SPREAD = 0.01  # Cảnh báo giá giả nằm trong ±1% quanh giá đóng
+LEAD_SECONDS = 2     # Đặt giờ sàn giả trước thời điểm đóng nến bao nhiêu giây (lâu hơn lần đồng bộ giờ đầu tiên)
+
+
+def configure(server_url, workdir, symbols):
+    """Trỏ bot sang sàn giả, database SQLite tạm"""
+    # Cùng server dưới 2 tên host để chạy thử hedged request/đổi host
+    config.BINANCE_API_URL = f"{server_url},{server_url.replace('127.0.0.1', 'localhost')}"
+    config.TELEGRAM_API_URL = server_url
+    config.TELEGRAM_BOT_TOKEN = '123456:FAKE'
+    config.TELEGRAM_CHANNEL_ID = '-1001'
+    config.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+    config.MARKETS_CACHE_PATH = os.path.join(workdir, 'markets.json')
+    config.DEFAULT_SYMBOLS = symbols
+    config.CHECKPOINT_ENABLED = False
+    config.SHARDING_ENABLED = False
+    config.AGGTRADE_ENABLED = False
+    config.CLOSE_GRACE_SECONDS = 0.2
+    config.CLOSE_REPOLL_DELAY = 0.5
+
+
+def add_users(bot, symbols, users, per_user, seed=0):
+    """Đăng ký giả: mỗi người dùng theo dõi per_user symbol ngẫu nhiên"""
+    from database import UserSubscription
+    rng = np.random.default_rng(seed)
+    rows = [{'chat_id': 1000 + user, 'symbol': symbol.replace('/', '')}
+            for user in range(users)
+            for symbol in rng.choice(symbols, size=min(per_user, len(symbols)), replace=False)]
+    with bot.db.engine.begin() as conn:
+        conn.execute(UserSubscription.__table__.insert(), rows)
+    bot.subscriptions.load(bot.db.get_subscriptions(config.TELEGRAM_CHANNEL_ID))
+    return len(rows)
+
+
+def add_alerts(bot, count, seed=0):
+    """Cảnh báo giá giả quanh giá đóng nến cuối của các symbol đã quét"""
+    from database import PriceAlert, to_utc
+    rng = np.random.default_rng(seed)
+    closes = {symbol: float(state.df['close'].iloc[-1])
+              for (symbol, tf), state in bot.scanner.states.items() if tf == bot.alerts.timeframe}
+    symbols = list(closes)
+    created_at = to_utc(bot.scanner.clock.now())
+    rows = []
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        price = closes[symbol] * (1 + rng.uniform(-ALERT_SPREAD, ALERT_SPREAD))
+        rows.append({'chat_id': 1000 + i % 5000, 'symbol': symbol, 'price_low': price, 'price_high': price,
+                     'created_at': created_at, 'created_price': closes[symbol]})
+    with bot.db.engine.begin() as conn:
+        conn.execute(PriceAlert.__table__.insert(), rows)
+    bot.alerts.load(bot.db.get_active_alerts())
+    return len(rows)
+
+
+async def wait_outbox(bot):
+    """Chờ outbox gửi hết các tín hiệu đã ghi"""
+    while (await asyncio.to_thread(bot.db.outbox_status)).get('pending', 0):
+        await asyncio.sleep(0.05)
+
+
+def percentiles(values):
+    if not len(values):
+        return "-"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f"p50 {p50:.2f}s | p95 {p95:.2f}s | p99 {p99:.2f}s | max {max(values):.2f}s"
+
+
+async def run(args):
+    if args.recording:
+        market = RecordedMarket.load(args.recording)
+        start_ms = market.replay_start()
+    else:
+        market = SyntheticMarket(synthetic_symbols(args.symbols))
+        start_ms = int(time.time() * 1000) // M15_MS * M15_MS
+    
+    exchange = FakeExchange(market, latency=args.latency, tail_probability=args.tail_probability,
+                            tail_latency=args.tail_latency, error_rate=args.error_rate,
+                            lag_probability=args.lag_probability)
+    server = FakeExchangeServer(exchange).start()
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    configure(server.url, workdir, market.symbols)
+    
+    from telegram_bot import TelegramBot
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    
+    print(f"\n{'='*80}")
+    print(f"LOAD TEST: {len(market.symbols)} symbols - {args.scans} lần quét - sàn giả {server.url}")
+    print(f"{'='*80}\n")
+    
+    bot = TelegramBot()
+    if args.users:
+        count = add_users(bot, market.symbols, args.users, args.user_symbols)
+        print(f"{args.users} người dùng, {count} đăng ký, quét {len(bot.subscriptions.symbols())} symbols\n")
+    await bot.app.initialize()
+    await bot.app.start()
+    
+    results = []
+    done = asyncio.Event()
+    run_scan = bot.run_scan
+    
+    async def timed_scan(close_time, timeframes):
+        sent_before = len(exchange.messages)
+        result = await run_scan(close_time, timeframes)
+        finished = exchange.time()
+        
+        # Outbox gửi tách khỏi lần quét -> chờ gửi xong trước khi nhảy giờ sàn giả
+        await wait_outbox(bot)
+        
+        # Độ trễ tính theo tin nhắn tới channel (tin tới người dùng gửi nền)
+        messages = [t - close_time.timestamp() for t, chat_id, _ in exchange.messages[sent_before:]
+                    if str(chat_id) == config.TELEGRAM_CHANNEL_ID]
+        results.append((close_time, result, finished - close_time.timestamp(), messages))
+        
+        if args.alerts and len(results) == 1:
+            print(f"Tạo {add_alerts(bot, args.alerts)} cảnh báo giá\n")
+        
+        if len(results) >= args.scans:
+            done.set()
+        else:
+            # Nhảy tới ngay trước lần đóng nến kế tiếp, bắt bot đồng bộ lại giờ
+            next_close, _ = bot.close_scheduler.next_close(close_time + pd.Timedelta(seconds=1))
+            exchange.set_time(next_close.timestamp() - LEAD_SECONDS)
+            bot.scanner.clock.synced_at = None
+        return result
+    
+    bot.run_scan = timed_scan
+    exchange.set_time(start_ms / 1000 - LEAD_SECONDS)
+    bot.scanner.clock.synced_at = None
+    started = time.perf_counter()
+    task = asyncio.create_task(bot.scan_loop())
+    await done.wait()
+    task.cancel()
+    elapsed = time.perf_counter() - started
+    
+    print(f"\n{'='*80}")
+    print("KẾT QUẢ:")
+    print(f"{'='*80}\n")
+    
+    all_messages = []
+    for close_time, result, end_to_end, messages in results:
+        all_messages.extend(messages)
+        if result is None:
+            print(f"  {close_time.strftime('%H:%M %d-%m-%Y')}: watchlist trống")
+            continue
+        rate = result['symbols'] / result['seconds'] if result['seconds'] > 0 else 0
+        print(f"  {close_time.strftime('%H:%M %d-%m-%Y')}: {result['symbols']} symbols trong {result['seconds']:.2f}s "
+              f"({rate:.0f} symbol/s) | bỏ qua {result['skipped']} | quét lại {result['repolled']} | "
+              f"chưa chốt nến {result['lagging']} | "
+              f"tín hiệu {result['signals']} | xong sau đóng nến {end_to_end:.2f}s")
+    
+    scans = [r[1]['seconds'] for r in results if r[1] is not None]
+    print(f"\nThời gian quét: {percentiles(scans)}")
+    print(f"Đóng nến -> tin nhắn Telegram ({len(all_messages)} tin): {percentiles(all_messages)}")
+    for stage, values in bot.latency.summary().items():
+        if values['p50'] is not None:
+            print(f"  Độ trễ {stage}: p50 {values['p50']:.2f}s | p95 {values['p95']:.2f}s | p99 {values['p99']:.2f}s")
+    
+    if bot.scanner.fetcher is not None:
+        fetch = bot.scanner.fetcher.stats()
+        print(f"REST: {fetch['requests']} request | p50 {fetch['p50'] or 0:.3f}s | p95 {fetch['p95'] or 0:.3f}s | "
+              f"p99 {fetch['p99'] or 0:.3f}s | dự phòng {fetch['hedges']} | đổi host {fetch['failovers']}")
+    if args.alerts:
+        print(f"Cảnh báo giá: {args.alerts - len(bot.alerts)}/{args.alerts} đã kích hoạt")
+    if args.users or args.alerts:
+        await bot.dispatcher.join()
+        users = sum(1 for _, chat_id, _ in exchange.messages if str(chat_id) != config.TELEGRAM_CHANNEL_ID)
+        print(f"Tin nhắn tới người dùng: {users}")
+    print(f"Sàn giả: {exchange.requests} request | lỗi {exchange.errors} | bị giới hạn {exchange.rate_limited}")
+    print(f"Tổng thời gian: {elapsed:.1f}s")
+    print(f"\n{'='*80}\n")
+    
+    await bot.stop_bot()
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test bot với sàn giả')
+    parser.add_argument('--symbols', type=int, default=1000, help='Số symbol giả')
+    parser.add_argument('--scans', type=int, default=4, help='Số lần đóng nến cần quét')
+    parser.add_argument('--recording', help='File .npz nến đã ghi (thay cho dữ liệu giả)')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--tail-probability', type=float, default=0.0)
+    parser.add_argument('--tail-latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--lag-probability', type=float, default=0.0)
+    parser.add_argument('--users', type=int, default=0, help='Số người dùng giả đăng ký theo dõi')
+    parser.add_argument('--user-symbols', type=int, default=5, help='Số symbol mỗi người dùng theo dõi')
+    parser.add_argument('--alerts', type=int, default=0, help='Số cảnh báo giá giả')
+    parser.add_argument('--verbose', action='store_true', help='In log của bot')
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,17 +4,17 @@ HIỂN THỊ VỊ TRÍ GIÁ TRONG CHANNEL
 """
 
 import pandas as pd
-import ccxt
 import pytz
 from support_resistance import SupportResistanceChannel
 import config
+from exchange_client import get_exchange
 
 VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
 
 
 def fetch_data(symbol, timeframe, limit):
     """Lấy dữ liệu từ Binance"""
-    exchange = ccxt.binance({'enableRateLimit': True})
+    exchange = get_exchange()
     
     if '/' not in symbol:
         symbol = symbol[:-4] + '/' + symbol[-4:]
@@ -7,19 +7,19 @@ LOGIC CHÍNH XÁC - CHECK HIGH/LOW:
 """
 
 import pandas as pd
-import ccxt
 import pytz
 from datetime import datetime
 from support_resistance import SupportResistanceChannel
 from stochastic_indicator import StochasticIndicator
 import config
+from exchange_client import get_exchange
 
 VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
 
 
 def fetch_data_until_time(symbol, timeframe, target_time, limit=1000):
     """Lấy dữ liệu từ Binance TỚI thời điểm cụ thể"""
-    exchange = ccxt.binance({'enableRateLimit': True})
+    exchange = get_exchange()
     
     if '/' not in symbol:
         symbol = symbol[:-4] + '/' + symbol[-4:]
@@ -11,18 +11,18 @@ LOGIC CHÍNH XÁC - CHECK HIGH/LOW:
 """
 
 import pandas as pd
-import ccxt
 import pytz
 from stochastic_indicator import StochasticIndicator
 from support_resistance import SupportResistanceChannel
 import config
+from exchange_client import get_exchange
 
 VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
 
 
 def fetch_data(symbol, timeframe, limit):
     """Lấy dữ liệu từ Binance"""
-    exchange = ccxt.binance({'enableRateLimit': True})
+    exchange = get_exchange()
     
     if '/' not in symbol:
         symbol = symbol[:-4] + '/' + symbol[-4:]
@@ -0,0 +1,194 @@
+"""
+Quản lý request weight Binance dùng chung cho mọi nơi gọi API
+
+Binance giới hạn request weight theo IP mỗi phút (BINANCE_WEIGHT_LIMIT) và
+trả weight đã dùng trong header X-MBX-USED-WEIGHT-1M. Vượt giới hạn bị 429,
+cố tình tiếp tục bị 418 (cấm IP). Thay cho delay cố định của enableRateLimit:
+- Mỗi request xin trước weight của nó; hết ngân sách phút này -> chờ sang phút mới
+- Header của mọi response cập nhật weight thực tế (gồm cả process khác cùng IP)
+- 429/418 có Retry-After -> chặn mọi request đến hết thời gian đó
+- Tùy chọn chia sẻ trạng thái giữa các process cùng máy (BINANCE_WEIGHT_SHARED)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import config
+
+# Weight của các endpoint spot (theo tài liệu Binance), mặc định 1
+ENDPOINT_WEIGHTS = {
+    'klines': 2,
+    'uiKlines': 2,
+    'time': 1,
+    'ping': 1,
+    'exchangeInfo': 20,
+    'ticker/price': 2,
+    'ticker/24hr': 2,
+    'depth': 5,
+    'aggTrades': 2,
+}
+
+# Vị trí các giá trị trong mảng trạng thái
+_WINDOW, _USED, _BANNED_UNTIL_MS = 0, 1, 2
+
+
+def weight_for_url(url):
+    """Weight của request theo đường dẫn API (ví dụ .../api/v3/klines?...)"""
+    path = url.split('?', 1)[0]
+    endpoint = path.split('/api/v3/', 1)[-1].strip('/')
+    return ENDPOINT_WEIGHTS.get(endpoint, 1)
+
+
+def _header(headers, name):
+    """Đọc header không phân biệt hoa thường"""
+    if not headers:
+        return None
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class WeightGovernor:
+    """
+    Ngân sách request weight theo phút, an toàn giữa các thread
+    """
+    
+    def __init__(self, limit=None, safety=None, shared_name=None, clock=None):
+        """
+        Args:
+            limit: Weight tối đa mỗi phút (mặc định BINANCE_WEIGHT_LIMIT)
+            safety: Tỷ lệ ngân sách được dùng (mặc định BINANCE_WEIGHT_SAFETY)
+            shared_name: Tên shared memory để chia sẻ giữa các process (None = chỉ process này)
+            clock: Hàm trả giờ server (giây) - mặc định time.time
+        """
+        self.limit = limit or config.BINANCE_WEIGHT_LIMIT
+        self.budget = int(self.limit * (safety or config.BINANCE_WEIGHT_SAFETY))
+        self.clock = clock or time.time
+        
+        self._lock = threading.Lock()
+        self._shm = None
+        self._lock_file = None
+        if shared_name:
+            self.state = self._attach_shared(shared_name)
+        else:
+            self.state = np.zeros(3, dtype=np.int64)
+        
+        # Thống kê của process này
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+    
+    def _attach_shared(self, name):
+        from multiprocessing import shared_memory
+        
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=3 * 8)
+            np.ndarray(3, dtype=np.int64, buffer=self._shm.buf)[:] = 0
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._lock_file = open(f"/tmp/{name}.lock", 'a+')
+        return np.ndarray(3, dtype=np.int64, buffer=self._shm.buf)
+    
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._lock_file is None:
+                yield
+                return
+            import fcntl
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+    
+    def _roll(self, now):
+        """Sang phút mới -> reset weight đã dùng"""
+        window = int(now // 60)
+        if self.state[_WINDOW] != window:
+            self.state[_WINDOW] = window
+            self.state[_USED] = 0
+    
+    def acquire(self, weight=1):
+        """
+        Xin weight cho một request (chờ nếu hết ngân sách hoặc đang bị chặn)
+        
+        Returns:
+            float: Số giây đã chờ
+        """
+        waited = 0.0
+        while True:
+            with self._locked():
+                now = self.clock()
+                self._roll(now)
+                banned_until = self.state[_BANNED_UNTIL_MS] / 1000
+                
+                if now < banned_until:
+                    delay = banned_until - now
+                elif self.state[_USED] + weight <= self.budget or self.state[_USED] == 0:
+                    self.state[_USED] += weight
+                    self.requests += 1
+                    if waited:
+                        self.waits += 1
+                        self.wait_seconds += waited
+                    return waited
+                else:
+                    delay = (self.state[_WINDOW] + 1) * 60 - now
+            
+            delay = max(float(delay), 0.01)
+            time.sleep(delay)
+            waited += delay
+    
+    def observe(self, headers, status=None):
+        """
+        Cập nhật weight thực tế từ header response
+        
+        Args:
+            headers: Header response của Binance
+            status: HTTP status (429/418 -> chặn theo Retry-After)
+        """
+        used = _header(headers, 'X-MBX-USED-WEIGHT-1M')
+        retry_after = _header(headers, 'Retry-After')
+        
+        with self._locked():
+            now = self.clock()
+            self._roll(now)
+            if used is not None:
+                self.state[_USED] = max(int(self.state[_USED]), int(used))
+            
+            if status in (418, 429) or retry_after is not None:
+                self.rate_limited += 1
+                seconds = float(retry_after) if retry_after is not None else (self.state[_WINDOW] + 1) * 60 - now
+                self.state[_BANNED_UNTIL_MS] = max(int(self.state[_BANNED_UNTIL_MS]), int((now + seconds) * 1000))
+                self.state[_USED] = max(int(self.state[_USED]), self.budget)
+    
+    @property
+    def used(self):
+        """Weight đã dùng trong phút hiện tại"""
+        with self._locked():
+            self._roll(self.clock())
+            return int(self.state[_USED])
+    
+    @property
+    def utilization(self):
+        """Tỷ lệ weight đã dùng so với giới hạn của Binance (0-1)"""
+        return self.used / self.limit
+    
+    def stats(self):
+        """Thống kê để log/giám sát"""
+        return {
+            'used': self.used,
+            'limit': self.limit,
+            'budget': self.budget,
+            'utilization': self.utilization,
+            'requests': self.requests,
+            'waits': self.waits,
+            'wait_seconds': self.wait_seconds,
+            'rate_limited': self.rate_limited,
+        }